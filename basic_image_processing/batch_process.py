@@ -0,0 +1,218 @@
+"""
+Traitement par lots d'images enregistrées : ligne et intersections
+
+Les entrées sont des fichiers image, des répertoires (parcourus
+récursivement) ou des sessions enregistrées par
+basic_motion/session_store.py (répertoire avec manifest.json et un
+signal 'frame'). Chaque image passe par detect_line (line_detection.py)
+et detect_corners (corner_detection.py).
+
+Les images sont réparties par paquets (--chunk) sur un pool de
+processus ; les résultats sont écrits au fil de l'eau dans un CSV, ou
+rangés par colonnes dans un .npz (--format npz, un tableau par colonne).
+Les images annotées sont enregistrées en option (--annotate DIR).
+
+Usage:
+    python3 batch_process.py images/ --output resultats.csv
+    python3 batch_process.py ../basic_motion/sessions/20260101_120000 \\
+        --workers 4 --annotate annotees/ --format npz --output session.npz
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+from corner_detection import detect_corners, draw_corners
+from line_detection import detect_line, draw_line
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+COLUMNS = ('source', 'frame', 't', 'width', 'height', 'found', 'cx', 'cy',
+           'contours', 'corners', 'intersection')
+
+
+############################################
+# Recherche des images
+############################################
+
+def is_session(path):
+    return os.path.isfile(os.path.join(path, 'manifest.json'))
+
+
+def collect_items(inputs):
+    """
+    Liste des images à traiter : (source, numéro d'image)
+    numéro d'image = -1 pour un fichier, indice dans le signal 'frame' pour une session
+    """
+    items = []
+    for path in inputs:
+        if os.path.isdir(path) and is_session(path):
+            with open(os.path.join(path, 'manifest.json')) as f:
+                manifest = json.load(f)
+            count = manifest['signals'].get('frame', {}).get('count', 0)
+            if count == 0:
+                print(f"{path} : session sans images enregistrées")
+            items.extend((path, i) for i in range(count))
+        elif os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                if is_session(root):
+                    items.extend(collect_items([root]))
+                    dirs[:] = []
+                    continue
+                items.extend((os.path.join(root, name), -1) for name in sorted(files)
+                             if name.lower().endswith(IMAGE_EXTENSIONS))
+        else:
+            items.append((path, -1))
+    return items
+
+
+_sessions = {}
+
+
+def _session_frames(path):
+    # signal 'frame' d'une session, ouvert une fois par processus (np.memmap)
+    if path not in _sessions:
+        motion = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'basic_motion')
+        if motion not in sys.path:
+            sys.path.insert(0, motion)
+        from session_store import SessionStore
+        _sessions[path] = SessionStore.open(path)['frame']
+    return _sessions[path]
+
+
+def load_image(source, number):
+    """Returns: (image, date) ; date NaN pour un fichier"""
+    if number < 0:
+        return cv2.imread(source), float('nan')
+    record = _session_frames(source).data[number]
+    return np.ascontiguousarray(record['image']), float(record['t'])
+
+
+############################################
+# Traitement d'un paquet (dans un processus du pool)
+############################################
+
+def annotated_name(source, number):
+    base = os.path.splitext(os.path.basename(os.path.normpath(source)))[0]
+    return f"{base}.png" if number < 0 else f"{base}_{number:06d}.png"
+
+
+def process_chunk(chunk, annotate=None):
+    """Détection sur un paquet d'images ; Returns: liste de lignes (tuples COLUMNS)"""
+    rows = []
+    for source, number in chunk:
+        image, t = load_image(source, number)
+        if image is None:
+            rows.append((source, number, t, 0, 0, False, -1, -1, 0, 0, False))
+            continue
+        h, w = image.shape[:2]
+        cx, cy, contours = detect_line(image)
+        corners, intersection = detect_corners(image)
+        rows.append((source, number, t, w, h, cx is not None,
+                     -1 if cx is None else cx, -1 if cy is None else cy,
+                     len(contours), len(corners), intersection))
+        if annotate:
+            out = draw_corners(draw_line(image.copy(), cx, cy, contours), corners)
+            cv2.imwrite(os.path.join(annotate, annotated_name(source, number)), out)
+    return rows
+
+
+def chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+############################################
+# Sorties
+############################################
+
+class CsvWriter:
+    """Écriture des lignes au fil de l'eau"""
+
+    def __init__(self, path):
+        self.file = open(path, 'w', newline='')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(COLUMNS)
+
+    def write(self, rows):
+        self.writer.writerows(rows)
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class ColumnWriter:
+    """Colonnes numpy enregistrées dans un .npz à la fin"""
+
+    def __init__(self, path):
+        self.path = path
+        self.rows = []
+
+    def write(self, rows):
+        self.rows.extend(rows)
+
+    def close(self):
+        columns = list(zip(*self.rows)) if self.rows else [()] * len(COLUMNS)
+        np.savez(self.path, **{name: np.array(col) for name, col in zip(COLUMNS, columns)})
+
+
+def run(inputs, output, workers=os.cpu_count(), chunk=32, annotate=None, fmt='csv',
+        report_every=2.0):
+    """
+    Traite toutes les images des entrées
+    Returns: (nombre d'images, nombre d'intersections, durée en s)
+    """
+    items = collect_items(inputs)
+    if annotate:
+        os.makedirs(annotate, exist_ok=True)
+    writer = ColumnWriter(output) if fmt == 'npz' else CsvWriter(output)
+    print(f"{len(items)} images, {workers} processus, paquets de {chunk}")
+
+    done = intersections = 0
+    start = last_report = time.perf_counter()
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # les paquets sont rendus dans l'ordre : le CSV suit l'ordre des entrées
+            for rows in executor.map(process_chunk, chunks(items, chunk),
+                                     [annotate] * ((len(items) + chunk - 1) // chunk)):
+                writer.write(rows)
+                done += len(rows)
+                intersections += sum(row[-1] for row in rows)
+                now = time.perf_counter()
+                if now - last_report > report_every:
+                    rate = done / (now - start)
+                    print(f"  {done}/{len(items)} images  {rate:.1f} images/s  "
+                          f"reste ~{(len(items) - done) / rate:.0f} s")
+                    last_report = now
+    finally:
+        writer.close()
+    return done, intersections, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Détection de ligne et d'intersections par lots")
+    parser.add_argument('inputs', nargs='+', help="images, répertoires ou sessions enregistrées")
+    parser.add_argument('--output', default='resultats.csv')
+    parser.add_argument('--format', choices=('csv', 'npz'), default='csv')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--chunk', type=int, default=32, help="images par paquet")
+    parser.add_argument('--annotate', metavar='DIR', help="enregistre les images annotées")
+    args = parser.parse_args()
+
+    done, intersections, elapsed = run(args.inputs, args.output, args.workers, args.chunk,
+                                       args.annotate, args.format)
+    print(f"✓ {done} images en {elapsed:.1f} s ({done / max(elapsed, 1e-9):.1f} images/s), "
+          f"{intersections} intersections -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
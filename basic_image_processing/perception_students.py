@@ -1,21 +1,32 @@
 from __future__ import division
-import cv2
 import numpy as np
 
-from picamera import PiCamera
-from picamera.array import PiRGBArray
-
 resolution_target = (160, 128)
 
-camera = PiCamera(sensor_mode = 2)
-camera.resolution = resolution_target
-camera.framerate = 32
-rawCapture = PiRGBArray(camera, size=camera.resolution)
+# caméra ouverte au premier appel de perception() (import sans effet de bord)
+camera = None
+rawCapture = None
+frame_source = None
+
+
+def init_camera():
+    global camera, rawCapture, frame_source
+    from picamera import PiCamera
+    from picamera.array import PiRGBArray
 
-frame_source = camera.capture_continuous(rawCapture, format="bgr", use_video_port=True)
+    camera = PiCamera(sensor_mode = 2)
+    camera.resolution = resolution_target
+    camera.framerate = 32
+    rawCapture = PiRGBArray(camera, size=camera.resolution)
+
+    frame_source = camera.capture_continuous(rawCapture, format="bgr", use_video_port=True)
 
 
 def perception(feedback = True):
+    import cv2
+
+    if frame_source is None:
+        init_camera()
 
     # Input Image
     image = next(frame_source).array
@@ -31,6 +42,10 @@ def perception(feedback = True):
 
 
 
-if __name__ == "__main__":
+def main():
     while True:
-        perception(feedback = True)
\ No newline at end of file
+        perception(feedback = True)
+
+
+if __name__ == "__main__":
+    main()
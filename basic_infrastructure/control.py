@@ -11,7 +11,8 @@
 # TBD : message content could explicitly include origin 
 #########################################################################
 
-import zmq
+import teleop
+import transport
 
 server_ip = "192.168.137.1"
 verbose_mode = False
@@ -26,30 +27,29 @@ def main():
 
     print("Welcome to control.py")
     print("Press enter to validate your command and send it to the server")
+    if teleop.RAW_KEYBOARD_AVAILABLE:
+        print("Command 't' (or 't bot001') starts the teleoperation of all robots (or of one)")
     cmd_char = ''
     while cmd_char != 'q':
         input_str = input("Enter your command (press 'q' to exit): ")
         if input_str != '':
             cmd_char = input_str[0]
-            if cmd_char != 'q':
+            if cmd_char == 't' and teleop.RAW_KEYBOARD_AVAILABLE:
+                target = input_str[1:].strip() or "all"
+                teleop.run_keyboard(server_ip, target=target)
+            elif cmd_char != 'q':
                 msg = {"cmd": "key", "key": cmd_char}       # add header indicating origin ?
                 send_message(server_socket, msg)
 
 
 def connect_to(ip):
-    ctx = zmq.Context()
-    sock = ctx.socket(zmq.REQ)
-    address = "tcp://{}:5005".format(ip)
-    sock.connect(address)
-    
-    return sock
-
-def send_message(sock, content):
-    msg = {"from": "control"}       # header indicating origin
-    msg.update(content)
-    sock.send_pyobj(msg)
-    reply = sock.recv_pyobj()
-    if verbose_mode:
+    return transport.Client(ip, "control")
+
+def send_message(client, content):
+    reply = client.request(content)
+    if reply is None:
+        print("no reply from the server (RTT {}, {} timeouts)".format(client.rtt, client.timeouts))
+    elif verbose_mode:
         print(reply)
     
     return reply
@@ -4,6 +4,9 @@
 # Communication client for robots
 #   This program sends messages to the server regularly
 #   to be informed of commands given at the control side.
+#   Teleoperation commands (teleop.py) are applied as soon as they
+#   arrive, in a separate thread, to the Arduino given as third argument
+#   (or printed without one).
 #
 #########################################################################
 # Authors : Philippe Benabes & Koen de Turck
@@ -11,16 +14,23 @@
 # TBD : message content could explicitly include origin 
 #########################################################################
 
-import zmq
+import os
 import sys
+import threading
 import time
 
+import teleop
+import transport
+
 server_ip = "192.168.0.192"
 if len(sys.argv) > 1:
 	server_ip = sys.argv[1]
 my_id = 'bot001'
 if len(sys.argv) > 2:
 	my_id = sys.argv[2]
+arduino_port = None
+if len(sys.argv) > 3:
+	arduino_port = sys.argv[3]
 
 
 def main():
@@ -28,30 +38,44 @@ def main():
     print("initial hello msg ...")
     register_msg = {"cmd": "log"}       # add header indicating origin ?
     send_message(server_socket, register_msg)
+    threading.Thread(target=teleop.run_robot, args=(server_ip, my_id, make_driver(arduino_port)),
+                     daemon=True).start()
     
     while True:
         msg = {"cmd": "key"}
         reply = send_message(server_socket, msg)
-        if reply["key"] != '':
+        if reply is None:
+            print("server not answering ({} timeouts)".format(server_socket.timeouts))
+        elif reply.get("key", '') != '':
             print("received:{}".format(reply))
         time.sleep(1)
 
 
+def make_driver(port):
+    """Function (left, right) sending a motor command to the Arduino (serial_link.ino)"""
+    if port is None:
+        return lambda left, right: print("motors: {} {}".format(left, right))
+    motion = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'basic_motion')
+    if motion not in sys.path:
+        sys.path.insert(0, motion)
+    import serial_protocol          # also opens emul:// and daemon:// (basic_motion)
+    arduino, rep = serial_protocol.connect(port, b'A12')   # simple acknowledgement, binary replies
+    if not rep:
+        arduino.close()
+        raise RuntimeError("no reply from the Arduino on {}".format(port))
+
+    def drive(left, right):
+        arduino.write(serial_protocol.encode_command('C', left, right, 0, commode=2))
+        arduino.readline()          # acknowledgement
+    return drive
+
+
 def connect_to(ip):
-    ctx = zmq.Context()
-    reqsock = ctx.socket(zmq.REQ)
-    reqaddr = "tcp://{}:5005".format(server_ip)
-    reqsock.connect(reqaddr)
-    
-    return reqsock
+    return transport.Client(ip, my_id)
 
-def send_message(sock, content):
-    msg = {"from": my_id}       # header indicating origin
-    msg.update(content)
-    sock.send_pyobj(msg)
-    reply = sock.recv_pyobj()
-    
-    return reply
+def send_message(client, content):
+    # None if the server did not answer: the robot carries on without it
+    return client.request(content)
 
 
 if __name__ == "__main__":
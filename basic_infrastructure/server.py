@@ -6,89 +6,265 @@
 #   It forwards messages from the control to all robots.
 #   Each robot filters out messages that are not meant for it.
 #
+#   The server keeps one record per node (robot or controller), created
+#   on its first message. Every message counts as a heartbeat; idle
+#   clients send {"cmd": "heartbeat"} and nodes silent for longer than
+#   HEARTBEAT_TIMEOUT are reported as lost.
+#
+#   Teleoperation key states (teleop.py) arrive on a ROUTER socket and
+#   are republished as they come on a PUB socket, topic = robot name.
+#
+#   Keys sent by a controller go to one robot ({"to": "bot001"}) or to
+#   all of them. Broadcasts are kept once in a numbered log and each
+#   robot keeps a cursor into it, so the cost of a message does not
+#   depend on the number of connected nodes.
+#
 #########################################################################
 # Authors : Philippe Benabes & Koen de Turck
 # Modifications by Morgan Roger & Erwan Libessart
-# TBD : nodes is not declared as global
-# TBD : replace 'key' with 'last_key_hit' ?
 #########################################################################
 
-import zmq
+import collections
+import math
 import sys
+import time
+
+import zmq
+
+import teleop
 
 server_ip = "192.168.137.1"
+if len(sys.argv) > 1:
+    server_ip = sys.argv[1]
 verbose_mode = False
-nodes = list()
-global key # last key hit ?
-key = '' 
+
+HEARTBEAT_INTERVAL = 1.0        # period of the liveness check (s)
+HEARTBEAT_TIMEOUT = 3.0         # a node silent for this long is lost (s)
+RATE_TIME_CONSTANT = 5.0        # averaging time of the message rates (s)
+QUEUE_LENGTH = 64               # pending keys kept per robot, and broadcasts kept
+
+nodes = dict()                                          # name -> Node
+broadcasts = collections.deque(maxlen=QUEUE_LENGTH)     # (sequence number, key)
+broadcast_count = 0
+totals = {"messages": 0, "invalid": 0, "busy": 0.0, "started": time.monotonic()}
+
+
+class Node:
+    """What the server knows about one robot or controller"""
+
+    __slots__ = ('name', 'role', 'first_seen', 'last_seen', 'alive', 'messages',
+                 'rate', 'rtt', 'pending', 'cursor', 'telemetry', 'telemetry_time')
+
+    def __init__(self, name, role, now):
+        self.name = name
+        self.role = role                    # "robot" or "control"
+        self.first_seen = now
+        self.last_seen = now
+        self.alive = True
+        self.messages = 0
+        self.rate = 0.0                     # messages per second, exponentially averaged
+        self.rtt = None                     # last round trip time reported by the client (s)
+        self.pending = collections.deque(maxlen=QUEUE_LENGTH)   # keys sent to this robot only
+        self.cursor = broadcast_count       # broadcasts before registration are not delivered
+        self.telemetry = None
+        self.telemetry_time = None
+
+    def seen(self, now):
+        decay = math.exp(-(now - self.last_seen) / RATE_TIME_CONSTANT)
+        self.rate = self.rate * decay + 1.0 / RATE_TIME_CONSTANT
+        self.last_seen = now
+        self.messages += 1
+        if not self.alive:
+            self.alive = True
+            print("node {} is back".format(self.name))
+
+    def queue_depth(self):
+        if self.role != "robot":            # controllers do not receive broadcasts
+            return len(self.pending)
+        return len(self.pending) + min(broadcast_count - self.cursor, len(broadcasts))
+
+    def summary(self, now):
+        return {"role": self.role, "alive": self.alive,
+                "last_seen": round(now - self.last_seen, 3),
+                "messages": self.messages, "rate": round(self.rate, 2),
+                "rtt": self.rtt, "queue": self.queue_depth(),
+                "telemetry": self.telemetry,
+                "telemetry_age": None if self.telemetry_time is None
+                                 else round(now - self.telemetry_time, 3)}
 
 
 def main():
     repsock = create_connection_interface(server_ip)
+    teleop_in, teleop_out = create_teleop_relay(server_ip)
+    poller = zmq.Poller()
+    poller.register(repsock, zmq.POLLIN)
+    poller.register(teleop_in, zmq.POLLIN)
+    next_check = time.monotonic() + HEARTBEAT_INTERVAL
     while True:
-        msg = repsock.recv_pyobj()
-        reply = process_msg(msg)
-        repsock.send_pyobj(reply)
-        if verbose_mode:
-            print("received: {}".format(msg))
-            print("reply: {}".format(reply))
+        timeout = max(0.0, next_check - time.monotonic())
+        events = dict(poller.poll(timeout * 1000))
+        if teleop_in in events:
+            relay_teleop(teleop_in, teleop_out)
+        if repsock in events:
+            msg = repsock.recv_pyobj()
+            reply = process_msg(msg)
+            repsock.send_pyobj(reply)
+            if verbose_mode:
+                print("received: {}".format(msg))
+                print("reply: {}".format(reply))
+        now = time.monotonic()
+        if now >= next_check:
+            check_liveness(now)
+            next_check = now + HEARTBEAT_INTERVAL
 
 
 def process_msg(msg):
-    global key
-    default_reply = {"all": "is fine"}
-
-    msg_type = {
-      "new node registering": ((msg["cmd"] == "log") and msg["from"] not in nodes),
-      "known node registering": ((msg["cmd"] == "log") and msg["from"] in nodes),
-      "from control": (msg["from"] == "control"),
-      "key request from robot": ((msg["from"] != "control") and (msg["cmd"] == "key"))
-               }
-
-    if msg_type["new node registering"]:
-        print("new node signing in, adding {} to nodes".format(msg["from"]))
-        nodes.append(msg["from"])
-        if verbose_mode:
-            print(nodes)
-        reply = default_reply
-
-    elif msg_type["known node registering"]:
-        print("node {} already known".format(msg["from"]))
-        if verbose_mode:
-            print(nodes)
-        reply = {"already": "registered"}
+    start = time.perf_counter()
+    now = time.monotonic()
+    totals["messages"] += 1
 
+    try:
+        name, cmd = msg["from"], msg["cmd"]
+        handler = handlers[cmd]
+    except (KeyError, TypeError):
+        print("invalid message")
+        totals["invalid"] += 1
+        return {"message": "is invalid"}
 
-    elif msg_type["from control"]:
-        print("from control")
+    node = nodes.get(name)
+    if node is None:
+        role = msg.get("role", "control" if name.startswith("control") else "robot")
+        node = nodes[name] = Node(name, role, now)
+        print("new node signing in, adding {} to nodes ({})".format(name, role))
         if verbose_mode:
-            print(msg)
-        if (msg["cmd"] == "key"): 
-            key = msg["key"]
-            print(key)
-        reply = default_reply
-
-    elif msg_type["key request from robot"]:
-        print("key request from {}".format(msg["from"]))
-        reply = {"key": key}
-        key = ''
-
-    else:
-        print("invalid message")
-        reply = {"message": "is invalid"}
+            print(list(nodes))
+    elif cmd == "log" and verbose_mode:
+        print("node {} already known".format(name))
+    node.seen(now)
+    if "rtt" in msg:
+        node.rtt = msg["rtt"]
 
+    reply = handler(node, msg, now)
     if verbose_mode:
         print(reply)
+    totals["busy"] += time.perf_counter() - start
     return reply
 
+
+############################################
+# Message handlers
+############################################
+
+def on_log(node, msg, now):
+    # kept for older clients: the node is registered by its first message anyway
+    if node.messages > 1:
+        return {"already": "registered"}
+    return {"all": "is fine"}
+
+
+def on_heartbeat(node, msg, now):
+    return {"alive": True}
+
+
+def on_key(node, msg, now):
+    global broadcast_count
+    if node.role == "control":
+        target = msg.get("to")
+        if target is None:
+            broadcasts.append((broadcast_count, msg["key"]))
+            broadcast_count += 1
+        elif target in nodes:
+            nodes[target].pending.append(msg["key"])
+        else:
+            return {"unknown": target}
+        if verbose_mode:
+            print("key {} from {} to {}".format(msg["key"], node.name, target or "all"))
+        return {"all": "is fine"}
+
+    # key request from a robot: its own queue first, then the broadcasts it has not read
+    if node.pending:
+        return {"key": node.pending.popleft()}
+    if node.cursor < broadcast_count and broadcasts:
+        node.cursor = max(node.cursor, broadcasts[0][0])    # skip broadcasts already dropped
+        key = broadcasts[node.cursor - broadcasts[0][0]][1]
+        node.cursor += 1
+        return {"key": key}
+    return {"key": ''}
+
+
+def on_telemetry(node, msg, now):
+    node.telemetry = msg.get("data")
+    node.telemetry_time = now
+    return {"all": "is fine"}
+
+
+def on_stats(node, msg, now):
+    """Aggregate statistics, and the record of every node (or of msg["node"])"""
+    if "node" in msg:
+        record = nodes.get(msg["node"])
+        return {"node": record.summary(now) if record is not None else None}
+    elapsed = now - totals["started"]
+    alive = [n for n in nodes.values() if n.alive]
+    rtts = [n.rtt for n in alive if n.rtt is not None]
+    return {"uptime": round(elapsed, 1),
+            "nodes": len(nodes),
+            "alive": {"robot": sum(n.role == "robot" for n in alive),
+                      "control": sum(n.role == "control" for n in alive)},
+            "messages": totals["messages"],
+            "invalid": totals["invalid"],
+            "rate": round(sum(n.rate for n in alive), 2),
+            "processing_us": round(1e6 * totals["busy"] / max(totals["messages"], 1), 1),
+            "rtt_max": max(rtts) if rtts else None,
+            "queued": sum(n.queue_depth() for n in alive),
+            "per_node": {n.name: n.summary(now) for n in nodes.values()}}
+
+
+handlers = {"log": on_log, "heartbeat": on_heartbeat, "key": on_key,
+            "telemetry": on_telemetry, "stats": on_stats}
+
+
+def relay_teleop(teleop_in, teleop_out):
+    # forwarded without unpickling: [target, sender, payload]
+    while True:
+        try:
+            _, target, sender, payload = teleop_in.recv_multipart(zmq.NOBLOCK)
+        except zmq.Again:
+            return
+        except ValueError:
+            totals["invalid"] += 1
+            continue
+        teleop_out.send_multipart([target, sender, payload])
+        totals["messages"] += 1
+        node = nodes.get(sender.decode())
+        if node is not None:
+            node.seen(time.monotonic())
+
+
+def check_liveness(now):
+    for node in nodes.values():
+        if node.alive and now - node.last_seen > HEARTBEAT_TIMEOUT:
+            node.alive = False
+            print("node {} lost (silent for {:.1f}s)".format(node.name, now - node.last_seen))
+
+
 def create_connection_interface(ip):
-    ctx = zmq.Context()
+    ctx = zmq.Context.instance()
     repsock = ctx.socket(zmq.REP)
     repaddr = "tcp://{}:5005".format(ip)
     repsock.bind(repaddr)
-    
+
     return repsock
 
 
+def create_teleop_relay(ip):
+    ctx = zmq.Context.instance()
+    router = ctx.socket(zmq.ROUTER)
+    router.bind("tcp://{}:{}".format(ip, teleop.TELEOP_PORT))
+    pub = ctx.socket(zmq.PUB)
+    pub.setsockopt(zmq.SNDHWM, 16)          # a slow robot drops stale states, not the others
+    pub.bind("tcp://{}:{}".format(ip, teleop.TELEOP_PUB_PORT))
+    return router, pub
+
+
 if __name__ == "__main__":
     main()
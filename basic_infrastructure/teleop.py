@@ -0,0 +1,234 @@
+#########################################################################
+# CENTRALESUPELEC : ST5 Integration teaching
+#
+# Teleoperation channel
+#   The control side reads the keyboard in raw mode and streams key
+#   state changes (not whole lines) to the server on a DEALER socket.
+#   The server republishes them on a PUB socket, with the robot name as
+#   topic. Each robot subscribes to its name and to "all", and turns the
+#   latest key state into one motor command.
+#
+#   control --DEALER--> server:TELEOP_PORT (ROUTER)
+#   server:TELEOP_PUB_PORT (PUB) --SUB--> robots
+#
+#   A terminal only reports key presses and their auto-repeat, never key
+#   releases: a key is released when its repeats stop for longer than
+#   the release timeout. Only the last key pressed auto-repeats, so a
+#   single key is held at a time; a/e give the diagonal moves.
+#
+#   The current state is sent again every KEEPALIVE seconds. A robot
+#   that hears nothing for DEADMAN_TIMEOUT stops its motors.
+#
+#########################################################################
+
+import os
+import pickle
+import select
+import sys
+import time
+
+import zmq
+
+# raw keyboard mode is only available in a Unix terminal
+try:
+    import termios
+    import tty
+    RAW_KEYBOARD_AVAILABLE = True
+except ImportError:
+    RAW_KEYBOARD_AVAILABLE = False
+
+TELEOP_PORT = 5006          # control -> server
+TELEOP_PUB_PORT = 5007      # server -> robots
+
+FIRST_REPEAT_DELAY = 0.6    # longest wait before the terminal starts repeating a key (s)
+REPEAT_TIMEOUT = 0.12       # longest gap between two repeats of a held key (s)
+KEEPALIVE = 0.2             # period of the state refresh (s)
+DEADMAN_TIMEOUT = 0.6       # the robot stops after this long without news (s)
+
+# key -> (forward, turn), AZERTY layout; turn > 0 turns left
+KEY_BINDINGS = {
+    'z': (1, 0), 's': (-1, 0),
+    'q': (0, 1), 'd': (0, -1),
+    'a': (1, 0.5), 'e': (1, -0.5),
+}
+STOP_KEY = ' '
+EXIT_KEY = '\x1b'           # Escape
+
+
+def keys_to_motors(keys, speed=150, turn_ratio=0.6):
+    """Wheel commands (left, right) in -255..255 for a set of held keys"""
+    forward = sum(KEY_BINDINGS[k][0] for k in keys if k in KEY_BINDINGS)
+    turn = sum(KEY_BINDINGS[k][1] for k in keys if k in KEY_BINDINGS)
+    left = speed * (forward - turn_ratio * turn)
+    right = speed * (forward + turn_ratio * turn)
+    return (int(max(-255, min(255, left))), int(max(-255, min(255, right))))
+
+
+############################################
+# Control side
+############################################
+
+class RawKeyboard:
+    """Terminal in cbreak mode: characters are read as soon as they are typed"""
+
+    def __init__(self, stream=sys.stdin):
+        self.fd = stream.fileno()
+        self.saved = None
+
+    def __enter__(self):
+        self.saved = termios.tcgetattr(self.fd)
+        tty.setcbreak(self.fd)
+        return self
+
+    def __exit__(self, *exc):
+        termios.tcsetattr(self.fd, termios.TCSADRAIN, self.saved)
+
+    def read(self, timeout):
+        """Characters typed within `timeout` seconds ('' if none)"""
+        ready, _, _ = select.select([self.fd], [], [], max(timeout, 0))
+        if not ready:
+            return ''
+        return os.read(self.fd, 32).decode(errors='ignore')
+
+
+class KeyTracker:
+    """Held keys, deduced from the key presses and their auto-repeat"""
+
+    def __init__(self):
+        self.pressed = {}           # key -> (first press, last press)
+
+    def press(self, key, now):
+        first, _ = self.pressed.get(key, (now, now))
+        self.pressed[key] = (first, now)
+
+    def release_all(self):
+        self.pressed.clear()
+
+    def expire(self, now):
+        """Releases the keys whose repeats stopped; returns the next expiry date"""
+        next_expiry = None
+        for key, (first, last) in list(self.pressed.items()):
+            timeout = FIRST_REPEAT_DELAY if last == first else REPEAT_TIMEOUT
+            if now - last > timeout:
+                del self.pressed[key]
+            elif next_expiry is None or last + timeout < next_expiry:
+                next_expiry = last + timeout
+        return next_expiry
+
+    @property
+    def state(self):
+        return ''.join(sorted(self.pressed))
+
+
+def connect_sender(ip, ctx=None):
+    ctx = ctx or zmq.Context.instance()
+    sock = ctx.socket(zmq.DEALER)
+    sock.setsockopt(zmq.LINGER, 0)
+    sock.setsockopt(zmq.SNDHWM, 16)         # never queue a backlog of stale states
+    sock.connect("tcp://{}:{}".format(ip, TELEOP_PORT))
+    return sock
+
+
+def send_state(sock, sender, target, seq, keys):
+    payload = pickle.dumps({"seq": seq, "keys": keys, "t": time.time()})
+    try:
+        sock.send_multipart([target.encode(), sender.encode(), payload], zmq.NOBLOCK)
+    except zmq.Again:
+        pass                                # server unreachable: the next state will follow
+
+
+def run_keyboard(ip, sender="control", target="all"):
+    """Streams the keyboard state to `target` until Escape is pressed"""
+    sock = connect_sender(ip)
+    tracker = KeyTracker()
+    seq = 0
+    sent = None
+    last_send = 0.0
+    print("Teleoperation of {}: z/s forward/backward, q/d turn, a/e diagonals, "
+          "space stop, Escape to leave".format(target))
+    with RawKeyboard() as keyboard:
+        while True:
+            now = time.monotonic()
+            next_expiry = tracker.expire(now)
+            deadline = last_send + KEEPALIVE
+            if next_expiry is not None:
+                deadline = min(deadline, next_expiry)
+            chars = keyboard.read(deadline - now)
+            now = time.monotonic()
+            if chars == EXIT_KEY:           # alone: not the start of an arrow key sequence
+                break
+            for char in chars.lower():
+                if char == STOP_KEY:
+                    tracker.release_all()
+                elif char in KEY_BINDINGS:
+                    tracker.press(char, now)
+            tracker.expire(now)
+            state = tracker.state
+            if state != sent or now - last_send >= KEEPALIVE:
+                seq += 1
+                send_state(sock, sender, target, seq, state)
+                sent, last_send = state, now
+    send_state(sock, sender, target, seq + 1, '')
+    sock.close()
+
+
+############################################
+# Robot side
+############################################
+
+def connect_receiver(ip, my_id, ctx=None):
+    ctx = ctx or zmq.Context.instance()
+    sock = ctx.socket(zmq.SUB)
+    sock.setsockopt(zmq.LINGER, 0)
+    sock.setsockopt(zmq.RCVHWM, 16)
+    sock.setsockopt(zmq.SUBSCRIBE, my_id.encode())
+    sock.setsockopt(zmq.SUBSCRIBE, b"all")
+    sock.connect("tcp://{}:{}".format(ip, TELEOP_PUB_PORT))
+    return sock
+
+
+def receive_latest(sock, timeout):
+    """
+    Waits up to `timeout` seconds, then drains the socket
+    Returns: the most recent state received (dict), or None
+    """
+    latest = None
+    if not sock.poll(timeout * 1000):
+        return None
+    while True:
+        try:
+            _, _, payload = sock.recv_multipart(zmq.NOBLOCK)
+        except zmq.Again:
+            return latest
+        state = pickle.loads(payload)
+        if latest is None or state["seq"] > latest["seq"]:
+            latest = state
+
+
+def run_robot(ip, my_id, drive, speed=150, should_stop=lambda: False):
+    """
+    Applies the teleoperation commands sent to this robot
+    drive: function (left, right) sending a motor command, called only
+           when the command changes
+    """
+    sock = connect_receiver(ip, my_id)
+    command = (0, 0)
+    last_heard = time.monotonic()
+    try:
+        while not should_stop():
+            state = receive_latest(sock, DEADMAN_TIMEOUT / 3)
+            now = time.monotonic()
+            if state is not None:
+                last_heard = now
+                wanted = keys_to_motors(state["keys"], speed)
+            elif now - last_heard > DEADMAN_TIMEOUT:
+                wanted = (0, 0)             # control lost: stop
+            else:
+                continue
+            if wanted != command:
+                command = wanted
+                drive(*command)
+    finally:
+        if command != (0, 0):
+            drive(0, 0)
+        sock.close()
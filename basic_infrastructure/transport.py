@@ -0,0 +1,133 @@
+#########################################################################
+# CENTRALESUPELEC : ST5 Integration teaching
+#
+# Client transport for robots and controllers
+#   A REQ socket waits forever for a lost reply, and cannot send again
+#   before it has received one. Client polls for the reply with a short
+#   timeout, once. If none comes, the server is presumed down and later
+#   requests never block: they only check (poll 0) whether the late
+#   reply has arrived, and return None meanwhile. Every `backoff` (doubled
+#   each time, up to MAX_BACKOFF) the stuck socket is replaced by a new one
+#   and the request is sent again without waiting ("lazy pirate" pattern),
+#   so a restarted server is noticed within MAX_BACKOFF. A dead server
+#   costs the robot loop a single timeout per outage.
+#   The late reply is returned to the caller: the server has acted on the
+#   request (e.g. handed over a key), so it must not be thrown away.
+#
+#   All sockets of a process share one zmq.Context.
+#
+#########################################################################
+
+import time
+
+import zmq
+
+SERVER_PORT = 5005
+
+REQUEST_TIMEOUT = 0.1       # wait for a reply, once per outage (s)
+MIN_BACKOFF = 0.01          # first delay before the request is sent again on a new socket (s)
+MAX_BACKOFF = 1.0           # longest delay between two new sockets during an outage (s)
+
+
+class Client:
+    """
+    Request/reply client with timeouts and reconnection
+
+    Usage:
+        client = Client("192.168.137.1", "bot001")
+        reply = client.request({"cmd": "key"})      # None if the server did not answer
+    """
+
+    def __init__(self, ip, name, port=SERVER_PORT, timeout=REQUEST_TIMEOUT, ctx=None):
+        self.address = "tcp://{}:{}".format(ip, port)
+        self.name = name
+        self.timeout = timeout
+        self.ctx = ctx or zmq.Context.instance()
+        self.sock = None
+        self.waiting = False        # a request is still unanswered: server presumed down
+        self.backoff = 0.0
+        self.retry_at = 0.0
+        # counters
+        self.requests = 0
+        self.replies = 0
+        self.timeouts = 0
+        self.reconnects = 0
+        self.rtt = None             # last round trip time (s)
+        self.rtt_mean = None        # exponential average
+        self.rtt_max = 0.0
+        self._connect()
+
+    def _connect(self):
+        self.sock = self.ctx.socket(zmq.REQ)
+        self.sock.setsockopt(zmq.LINGER, 0)
+        self.sock.setsockopt(zmq.RECONNECT_IVL, 10)         # ms, a restarted server is found at once
+        self.sock.setsockopt(zmq.RECONNECT_IVL_MAX, 500)
+        self.sock.connect(self.address)
+
+    def _reconnect(self):
+        self.sock.close()
+        self._connect()
+        self.reconnects += 1
+
+    @property
+    def connected(self):
+        """False while a request is unanswered (server presumed down)"""
+        return not self.waiting
+
+    def request(self, content):
+        """
+        Sends a message and returns the reply (dict), or None if the server
+        did not answer; blocks at most `timeout`, and only on the first
+        request of an outage.
+        When the reply to an older request arrives at last, that reply is
+        returned and `content` is not sent: the caller sends it again
+        """
+        msg = {"from": self.name}           # header indicating origin
+        if self.rtt is not None:
+            msg["rtt"] = self.rtt
+        msg.update(content)
+        self.requests += 1
+
+        if self.waiting:
+            if not self.sock.poll(0):
+                now = time.monotonic()
+                if now >= self.retry_at:
+                    # the stuck socket may never get its reply: new socket, sent again, no wait
+                    self.timeouts += 1
+                    self._reconnect()
+                    self.sock.send_pyobj(msg)
+                    self.backoff = min(2 * self.backoff, MAX_BACKOFF)
+                    self.retry_at = now + self.backoff
+                return None
+            reply = self.sock.recv_pyobj()  # late reply to an older request: the server is back
+            self.waiting = False
+            self.backoff = 0.0
+            self.replies += 1
+            return reply
+
+        start = time.perf_counter()
+        self.sock.send_pyobj(msg)
+        if self.sock.poll(self.timeout * 1000):
+            reply = self.sock.recv_pyobj()
+            self._record(time.perf_counter() - start)
+            return reply
+        # no reply: the socket is left waiting for it, the next requests only check it
+        self.timeouts += 1
+        self.waiting = True
+        self.backoff = MIN_BACKOFF
+        self.retry_at = time.monotonic() + self.backoff
+        return None
+
+    def _record(self, rtt):
+        self.replies += 1
+        self.rtt = rtt
+        self.rtt_mean = rtt if self.rtt_mean is None else 0.9 * self.rtt_mean + 0.1 * rtt
+        self.rtt_max = max(self.rtt_max, rtt)
+
+    def stats(self):
+        return {"requests": self.requests, "replies": self.replies,
+                "timeouts": self.timeouts, "reconnects": self.reconnects,
+                "rtt": self.rtt, "rtt_mean": self.rtt_mean, "rtt_max": self.rtt_max}
+
+    def close(self):
+        self.sock.close()
@@ -0,0 +1,440 @@
+"""
+Démon de la liaison série : une seule connexion à la carte, partagée
+
+L'ouverture du port redémarre la carte (Uno) : chaque script qui se
+connecte lui-même attend son redémarrage et remet les moteurs à zéro.
+Le démon ouvre le port une fois, fait la connexion 'A..' et reste
+connecté ; les scripts s'y attachent par un socket Unix en quelques
+millisecondes avec le port 'daemon://' (serial_protocol.open_serial),
+sans rien changer d'autre : le socket se lit et s'écrit comme le port.
+
+- les octets de chaque client sont découpés en commandes par un
+  CommandParser (comme sur la carte) et rangés dans la file du client
+- les commandes sont envoyées à la carte une par une, en tourniquet
+  entre les clients ; la réponse attendue (une ligne, ou les octets
+  binaires d'une question en commode >= 2) est rendue au client qui a
+  posé la question avant de passer à la commande suivante
+- la demande de connexion 'A..' n'est pas renvoyée à la carte si elle
+  correspond au mode en cours : la réponse gardée est rendue tout de
+  suite. Un autre mode n'est accepté que si aucun autre client n'est
+  connecté ('KO' sinon)
+- la déconnexion 'a' d'un client ne déconnecte pas la carte ; si le
+  client qui a commandé les moteurs en dernier part (ou s'arrête
+  brutalement), le démon arrête les moteurs
+
+Usage:
+    python3 arduino_daemon.py [--port /dev/ttyACM0] [--handshake A20]
+    python3 dialogue.py daemon://
+"""
+
+import argparse
+import os
+import select
+import selectors
+import socket
+import struct
+import time
+from collections import deque
+
+import config
+from serial_protocol import REPLY_FORMATS, RX_SIZE, CommandParser, connect, encode_command
+
+QUEUE_LENGTH = 32           # commandes en attente par client (au-delà le client n'est plus lu)
+REPLY_TIMEOUT = 0.1         # attente maximale de la réponse d'une commande (s)
+POLL_INTERVAL = 0.0005      # lecture de la carte quand elle n'a pas de descripteur (émulateur)
+MOTOR_COMMANDS = 'CcDd'
+
+LINE = -1                   # réponse attendue : une ligne
+
+
+class _Client:
+    __slots__ = ('sock', 'number', 'parser', 'queue', 'connected', 'paused', 'commands')
+
+    def __init__(self, sock, number, commode):
+        self.sock = sock
+        self.number = number
+        self.parser = CommandParser()
+        self.parser.commode = commode
+        self.parser.connected = True
+        self.queue = deque()            # (cmd, paramètres bruts)
+        self.connected = False          # a fait sa demande de connexion 'A..'
+        self.paused = False             # file pleine : socket retiré du sélecteur
+        self.commands = 0
+
+    def send(self, data):
+        if data and self.sock is not None:
+            try:
+                self.sock.sendall(data)
+            except OSError:
+                pass                    # client parti : détaché à la prochaine lecture
+
+
+class ArduinoDaemon:
+    """
+    link: liaison série déjà connectée (serial_protocol.connect)
+    handshake, greeting: demande de connexion faite et réponse de la carte
+    """
+
+    def __init__(self, link, handshake, greeting, path=config.ARDUINO_DAEMON_SOCKET):
+        self.link = link
+        self.path = path
+        self._set_mode(handshake, greeting)
+        self.clients = []
+        self.internal = deque()         # commandes du démon (arrêt des moteurs)
+        self.inflight = None            # [client, réponse attendue, octets reçus, échéance, connexion]
+        self.motor_owner = None
+        self.last_owner = None
+        self.turn = 0
+        self.count = 0
+        self.commands = 0
+        self.selector = selectors.DefaultSelector()
+        try:
+            self.board_fd = link.fileno()
+        except (AttributeError, OSError, ValueError):
+            self.board_fd = None        # émulateur, URL pyserial : lecture périodique
+
+    def _set_mode(self, handshake, greeting):
+        self.handshake = bytes(handshake)
+        self.greeting = greeting
+        self.feedback = handshake[1] - ord('0')
+        self.commode = handshake[2] - ord('0')
+
+    ############################################
+    # Sockets
+    ############################################
+
+    def listen(self):
+        if os.path.exists(self.path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.path)
+                probe.close()
+                raise RuntimeError(f"un démon est déjà à l'écoute sur {self.path}")
+            except (ConnectionRefusedError, FileNotFoundError):
+                os.unlink(self.path)        # socket d'un démon arrêté brutalement
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server.bind(self.path)
+        self.server.listen()
+        self.server.setblocking(False)
+        self.selector.register(self.server, selectors.EVENT_READ, self._accept)
+        if self.board_fd is not None:
+            self.selector.register(self.board_fd, selectors.EVENT_READ, self._read_board)
+        return self
+
+    def _accept(self):
+        sock, _ = self.server.accept()
+        self.count += 1
+        client = _Client(sock, self.count, self.commode)
+        self.clients.append(client)
+        self.selector.register(sock, selectors.EVENT_READ, lambda: self._read_client(client))
+        print(f"client {client.number} attaché ({len(self.clients)} connectés)")
+
+    def _read_client(self, client):
+        try:
+            data = client.sock.recv(4096)
+        except OSError:
+            data = b''
+        if not data:
+            self._detach(client)
+            return
+        now_us = time.monotonic() * 1e6
+        parser = client.parser
+        # le parser garde au plus RX_SIZE octets, comme la carte : on le nourrit par morceaux
+        while data:
+            free = RX_SIZE - len(parser.buffer)
+            chunk, data = data[:free], data[free:]
+            for command in parser.feed(chunk, now_us):
+                self._queue(client, command)
+        if len(client.queue) >= QUEUE_LENGTH and not client.paused:
+            self.selector.unregister(client.sock)
+            client.paused = True
+
+    def _queue(self, client, command):
+        client.queue.append(command)
+        client.commands += 1
+
+    def _detach(self, client):
+        if not client.paused:
+            self.selector.unregister(client.sock)
+        client.sock.close()
+        client.sock = None
+        client.queue.clear()
+        self.clients.remove(client)
+        if self.inflight is not None and self.inflight[0] is client:
+            self.inflight[0] = None     # la réponse sera lue et ignorée
+        if self.motor_owner is client:
+            self._stop_motors()
+        print(f"client {client.number} détaché après {client.commands} commandes "
+              f"({len(self.clients)} connectés)")
+
+    def _stop_motors(self):
+        self.motor_owner = None
+        frame = encode_command('C', 0, 0, commode=self.commode)
+        if self.commode == 3:
+            frame = frame[1:]               # longueur remise par _frame
+        self.internal.append(('C', frame[1:]))
+
+    ############################################
+    # Carte
+    ############################################
+
+    def _frame(self, cmd, payload):
+        """Octets de la commande pour la carte, dans le mode en cours"""
+        raw = cmd.encode() + bytes(payload)
+        if cmd in ('A', 'a'):
+            return raw
+        if self.commode == 0:
+            return raw if raw.endswith((b'\n', b'\r')) else raw + b'\n'
+        if self.commode == 3:
+            return bytes([len(raw)]) + raw
+        return raw
+
+    def _expected(self, cmd):
+        """Réponse attendue de la carte : octets binaires, LINE ou 0 (aucune)"""
+        fmt = REPLY_FORMATS.get(cmd.upper())
+        if fmt is not None:
+            return struct.calcsize(fmt) if self.commode >= 2 else LINE
+        return LINE if self.feedback else 0
+
+    def _send(self, client, cmd, payload, handshake=False):
+        self.link.write(self._frame(cmd, payload))
+        self.commands += 1
+        expected = LINE if handshake else self._expected(cmd)
+        if expected:
+            self.inflight = [client, expected, bytearray(), time.monotonic() + REPLY_TIMEOUT, handshake]
+        if client is not None:
+            self.last_owner = client
+
+    def _read_board(self):
+        n = self.link.in_waiting
+        if not n:
+            return
+        data = self.link.read(n)
+        if self.inflight is None:
+            # octets hors réponse : au dernier client servi
+            if self.last_owner is not None and self.last_owner in self.clients:
+                self.last_owner.send(data)
+            return
+        client, expected, reply = self.inflight[:3]
+        reply += data
+        if client is not None:
+            client.send(data)
+        if (expected == LINE and b'\n' in reply) or (expected > 0 and len(reply) >= expected):
+            self._complete()
+
+    def _complete(self):
+        client, _, reply, _, handshake = self.inflight
+        self.inflight = None
+        if handshake and reply.split()[:1] == [b'OK']:
+            self.greeting = bytes(reply)
+
+    ############################################
+    # Envoi des commandes
+    ############################################
+
+    def _next(self):
+        """Prochaine commande : celles du démon d'abord, puis les clients en tourniquet"""
+        if self.internal:
+            return None, self.internal.popleft()
+        for i in range(len(self.clients)):
+            client = self.clients[(self.turn + i) % len(self.clients)]
+            if client.queue:
+                self.turn = (self.turn + i + 1) % len(self.clients)
+                command = client.queue.popleft()
+                if client.paused and len(client.queue) < QUEUE_LENGTH // 2:
+                    self.selector.register(client.sock, selectors.EVENT_READ,
+                                           lambda c=client: self._read_client(c))
+                    client.paused = False
+                return client, command
+        return None, None
+
+    def _dispatch(self):
+        while self.inflight is None:
+            client, command = self._next()
+            if command is None:
+                return
+            cmd, payload = command
+            if cmd == 'ER':
+                client.send(b'ER\r\n')          # trame incomplète, comme la carte
+            elif cmd == 'a':
+                client.connected = False
+                if self.motor_owner is client:
+                    self._stop_motors()
+                client.send(b'OK Arduino deconnecte\r\n')
+            elif cmd == 'A':
+                self._handshake(client, b'A' + bytes(payload[:2]))
+            elif cmd:
+                if cmd in MOTOR_COMMANDS and client is not None:
+                    self.motor_owner = client
+                self._send(client, cmd, payload)
+
+    def _handshake(self, client, handshake):
+        client.connected = True
+        if handshake == self.handshake and self.greeting:
+            client.send(self.greeting)          # mode en cours : la carte n'est pas réinitialisée
+            return
+        if any(other.connected for other in self.clients if other is not client):
+            client.parser.commode = self.commode
+            client.connected = False
+            client.send(b'KO mode %s utilise par un autre client\r\n' % self.handshake[1:])
+            return
+        # seul client : la carte change de mode
+        self._set_mode(handshake, None)
+        for other in self.clients:
+            other.parser.commode = self.commode
+        self._send(client, 'A', handshake[1:], handshake=True)
+
+    ############################################
+    # Boucle principale
+    ############################################
+
+    def serve(self, should_stop=lambda: False):
+        while not should_stop():
+            busy = self.inflight is not None or any(c.parser.buffer for c in self.clients)
+            if self.board_fd is None and busy:
+                timeout = POLL_INTERVAL
+            else:
+                timeout = 0.005 if busy else 0.5
+            for key, _ in self.selector.select(timeout):
+                key.data()
+            now = time.monotonic()
+            for client in list(self.clients):
+                # commandes ASCII terminées par un silence
+                for command in client.parser.poll(now * 1e6):
+                    self._queue(client, command)
+            if self.board_fd is None:
+                self._read_board()
+            if self.inflight is not None and now > self.inflight[3]:
+                self._complete()                # pas (ou pas toute) la réponse attendue
+            self._dispatch()
+
+    def close(self):
+        self._stop_motors()
+        self._dispatch()
+        deadline = time.monotonic() + REPLY_TIMEOUT
+        while self.inflight is not None and time.monotonic() < deadline:
+            self._read_board()
+            time.sleep(POLL_INTERVAL)
+        for client in list(self.clients):
+            self._detach(client)
+        self.selector.close()
+        self.server.close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.link.write(b'a')
+        self.link.close()
+
+
+############################################
+# Côté client
+############################################
+
+class DaemonSerial:
+    """
+    Objet compatible serial.Serial relié au démon
+    (ouvert par serial_protocol.open_serial('daemon://[chemin du socket]'))
+    """
+
+    def __init__(self, path=None, timeout=None, baudrate=config.ARDUINO_BAUDRATE):
+        self.path = path or config.ARDUINO_DAEMON_SOCKET
+        self.port = 'daemon://' + self.path
+        self.timeout = timeout
+        self.baudrate = baudrate
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.path)
+        self.is_open = True
+        self._rx = bytearray()
+
+    def write(self, data):
+        data = bytes(data)
+        self.sock.sendall(data)
+        return len(data)
+
+    def _fill(self, deadline):
+        """Lit ce qui est arrivé ; attend jusqu'à deadline (None : sans limite) si rien n'est arrivé"""
+        timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+        if select.select([self.sock], [], [], timeout)[0]:
+            data = self.sock.recv(4096)
+            if not data:
+                raise ConnectionError("démon arrêté")
+            self._rx += data
+            return True
+        return False
+
+    def _deadline(self):
+        return None if self.timeout is None else time.monotonic() + self.timeout
+
+    def read(self, size=1):
+        deadline = self._deadline()
+        while len(self._rx) < size and self._fill(deadline):
+            pass
+        data = bytes(self._rx[:size])
+        del self._rx[:size]
+        return data
+
+    def readline(self):
+        deadline = self._deadline()
+        while b'\n' not in self._rx and self._fill(deadline):
+            pass
+        end = self._rx.find(b'\n') + 1 or len(self._rx)
+        data = bytes(self._rx[:end])
+        del self._rx[:end]
+        return data
+
+    @property
+    def in_waiting(self):
+        while self._fill(time.monotonic()):
+            pass
+        return len(self._rx)
+
+    def inWaiting(self):
+        return self.in_waiting
+
+    def reset_input_buffer(self):
+        self.in_waiting
+        self._rx.clear()
+
+    def flush(self):
+        pass
+
+    def close(self):
+        if self.is_open:
+            self.sock.close()
+            self.is_open = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Démon de la liaison série avec la carte")
+    parser.add_argument('--port', default=config.ARDUINO_PORT,
+                        help="port de la carte ('emul://' pour l'émulateur)")
+    parser.add_argument('--socket', default=config.ARDUINO_DAEMON_SOCKET)
+    parser.add_argument('--handshake', default='A20', help="connexion faite au démarrage")
+    args = parser.parse_args()
+
+    handshake = args.handshake.encode()
+    link, greeting = connect(args.port, handshake, baudrate=config.ARDUINO_BAUDRATE,
+                             timeout=config.ARDUINO_TIMEOUT, startup=config.ARDUINO_STARTUP_TIMEOUT)
+    if not greeting:
+        print(f"✗ La carte ne répond pas sur {args.port}")
+        link.close()
+        return
+    print(greeting.decode().strip())
+    daemon = ArduinoDaemon(link, handshake, greeting, args.socket).listen()
+    print(f"✓ Démon à l'écoute sur {args.socket} (port daemon://{args.socket})")
+    try:
+        daemon.serve()
+    except KeyboardInterrupt:
+        print("\nArrêt du démon")
+    finally:
+        daemon.close()
+
+
+if __name__ == "__main__":
+    main()
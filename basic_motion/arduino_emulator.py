@@ -0,0 +1,655 @@
+#!/usr/bin/env python3
+"""
+Émulateur de la carte Arduino programmée avec serial_link.ino
+
+Permet de faire tourner dialogue.py, test_moteurs.py, test_motor_commands.py
+ou demo.py sans robot, et de mesurer le débit et la latence de la liaison
+série en intégration continue.
+
+L'émulateur reproduit :
+- la connexion 'A' (feedback, commode) et la déconnexion 'a'
+- les modes de communication 0 (ASCII) à 3 (trames), avec le décodeur
+  non bloquant de la carte (serial_protocol.CommandParser)
+- les commandes B, C, c, D, G, g, I et les questions N, O, P, R, S, T
+- le capteur ultrasonore orienté par le servomoteur (range_at)
+- l'intégration des encodeurs à partir de la tension des moteurs
+- la protection infrarouge (tâche 4) et les réponses "OB"
+- le temps de transmission d'un octet à 115200 bauds (~87 µs)
+
+Deux façons de l'utiliser :
+- dans le même processus : serial_protocol.open_serial('emul://') renvoie
+  un objet EmulatedSerial qui s'utilise comme serial.Serial
+- par un pseudo-terminal : python3 arduino_emulator.py affiche le port
+  (/dev/pts/N) à donner aux scripts, par ex. python3 dialogue.py /dev/pts/N
+
+Mesure de la liaison :
+    python3 arduino_emulator.py --bench
+"""
+
+import argparse
+import os
+import struct
+import threading
+import time
+
+from serial_protocol import CommandParser, encode_command
+
+BAUDRATE = 115200
+
+# Modèle des moteurs et encodeurs
+TICKS_AT_255 = 1200.0     # ticks/s d'un encodeur à pleine tension
+PWM_DEADBAND = 25         # tension en dessous de laquelle le moteur ne tourne pas
+MOTOR_TAU = 0.08          # constante de temps des moteurs (s)
+PHYSICS_DT = 0.005        # pas d'intégration (s)
+
+# Capteur infrarouge : valeur sans obstacle et seuil de la tâche 4
+IR_DEFAULT = 120
+IR_OBSTACLE = 500
+
+# Périodes des tâches de la carte (ms), comme del2..del4 dans serial_link.ino
+DEL_SPEED = 500
+DEL_RAMP = 100
+DEL_IR = 100
+
+
+def byte_time(baudrate=BAUDRATE):
+    """Durée de transmission d'un octet (1 start + 8 bits + 1 stop), en secondes"""
+    return 10.0 / baudrate
+
+
+def _int16(value):
+    return (int(value) + 0x8000) % 0x10000 - 0x8000
+
+
+class ArduinoEmulator:
+    """
+    Modèle de la carte : état des moteurs, encodeurs, servomoteur et tâches
+
+    Les dates sont en secondes depuis la mise sous tension ; receive()
+    et poll() rendent les octets émis en réponse par la carte.
+    """
+
+    def __init__(self):
+        self.parser = CommandParser()
+        self.ir_value = IR_DEFAULT
+        self.battery = 1.0          # charge de la batterie : la vitesse des moteurs lui est proportionnelle
+        self.range_at = lambda angle: -1   # distance (cm) vue par l'ultrason selon l'angle du servo, -1 sans écho
+        self._us = (0, -1, 0)              # dernière mesure ultrasonore (ms, cm, angle)
+        self.time = 0.0
+        self.count1 = 0.0
+        self.count2 = 0.0
+        self.speed1 = 0.0          # ticks/s réels des roues (modèle du 1er ordre)
+        self.speed2 = 0.0
+        self.vitesse1 = 0
+        self.vitesse2 = 0
+        self._lv1 = 0
+        self._lv2 = 0
+        self._tim2 = DEL_SPEED / 1000
+        self.commands = 0
+        self._session = False
+        self.init_arduino()
+
+    def init_arduino(self):
+        self.feedback = 0
+        self.nivM1 = self.nivM2 = 0      # tensions commandées (renvoyées par T)
+        self.pwm1 = self.pwm2 = 0        # tensions réellement appliquées
+        self.nivE1 = self.nivE2 = 0
+        self.vitdem = 25
+        self.servomin, self.servomax = 30, 150
+        self.servopos = (self.servomin + self.servomax) // 2
+        self.obst = False
+        self.task3on = False
+        self.task4on = False
+        self._tim3 = self._tim4 = self.time
+
+    @property
+    def connected(self):
+        return self.parser.connected
+
+    @property
+    def commode(self):
+        return self.parser.commode
+
+    ############################################
+    # Évolution dans le temps
+    ############################################
+
+    def advance(self, now):
+        """Fait évoluer moteurs, encodeurs et tâches périodiques jusqu'à now (s)"""
+        while self.time < now:
+            dt = min(PHYSICS_DT, now - self.time)
+            self.time += dt
+            alpha = dt / (MOTOR_TAU + dt)
+            self.speed1 += alpha * (self._target(self.pwm1) - self.speed1)
+            self.speed2 += alpha * (self._target(self.pwm2) - self.speed2)
+            self.count1 += self.speed1 * dt
+            self.count2 += self.speed2 * dt
+            self._tasks()
+
+    def _target(self, niv):
+        if abs(niv) <= PWM_DEADBAND:
+            return 0.0
+        niv = max(-255, min(255, niv))
+        return self.battery * TICKS_AT_255 * (abs(niv) - PWM_DEADBAND) / (255 - PWM_DEADBAND) * (1 if niv > 0 else -1)
+
+    def _tasks(self):
+        # tâche 2 : vitesse en ticks par période
+        if self.time >= self._tim2:
+            self.vitesse1 = int(self.count1) - self._lv1
+            self.vitesse2 = int(self.count2) - self._lv2
+            self._lv1, self._lv2 = int(self.count1), int(self.count2)
+            self._tim2 += DEL_SPEED / 1000
+        # tâche 3 : démarrage progressif
+        if self.task3on and self.time >= self._tim3:
+            self._set_motors(self._ramp(self.nivM1, self.nivE1),
+                             self._ramp(self.nivM2, self.nivE2))
+            if (self.nivM1, self.nivM2) == (self.nivE1, self.nivE2):
+                self.task3on = False
+            self._tim3 += DEL_RAMP / 1000
+        # tâche 4 : protection infrarouge
+        if self.task4on and self.time >= self._tim4:
+            if self.ir_value > IR_OBSTACLE:
+                self.obst = True
+                self.nivM1 = self.nivM2 = self.pwm1 = self.pwm2 = 0
+                self.task3on = False
+            self._tim4 += DEL_IR / 1000
+
+    def _ramp(self, niv, target):
+        if niv < target:
+            return min(niv + self.vitdem, target)
+        return max(niv - self.vitdem, target)
+
+    def _set_motors(self, niv1, niv2):
+        # set_motor : tension nulle si un obstacle a été détecté
+        self.nivM1, self.nivM2 = niv1, niv2
+        self.pwm1, self.pwm2 = (0, 0) if self.obst else (niv1, niv2)
+
+    ############################################
+    # Liaison série
+    ############################################
+
+    def receive(self, data, now):
+        """
+        Octets reçus par la carte à la date now (s)
+        Returns: octets émis en réponse
+        """
+        self.advance(now)
+        out = bytearray()
+        for cmd, payload in self.parser.feed(bytes(data), now * 1e6):
+            out += self._dispatch(cmd, payload)
+        return bytes(out)
+
+    def poll(self, now):
+        """Commandes terminées par un silence (ASCII) et trames abandonnées"""
+        self.advance(now)
+        out = bytearray()
+        for cmd, payload in self.parser.poll(now * 1e6):
+            out += self._dispatch(cmd, payload)
+        return bytes(out)
+
+    def _dispatch(self, cmd, payload):
+        if cmd == 'ER':
+            return b'ER\r\n'
+        if not cmd:
+            return b''              # trame vide (mode 3)
+        if cmd == 'A':
+            return self._connect(payload)
+        if not self._session:
+            return b''              # commandes ignorées tant que la carte n'est pas connectée
+        if cmd == 'a':
+            self._session = False
+            self.init_arduino()
+            return b'OK Arduino deconnecte\r\n'
+        self.commands += 1
+        self._args = _Arguments(payload, self.commode)
+        # tableaux UpperFn / LowerFn : les codes non définis répondent ER
+        handler = getattr(self, '_cmd_' + (cmd if cmd.isupper() else cmd.upper() + '_lower'), None)
+        if handler is None:
+            return b'ER\r\n'
+        return handler()
+
+    def _ack(self, message=None):
+        """RetAcquitSimpl + message complet en feedback 2"""
+        out = b''
+        if self.feedback == 1:
+            out = b'OB\r\n' if self.obst else b'OK\r\n'
+        if self.feedback == 2 and message is not None:
+            out += message.encode() + b'\r\n'
+        return out
+
+    def _binary(self):
+        return self.commode >= 2
+
+    ############################################
+    # Commandes (voir serial_link.ino)
+    ############################################
+
+    def _connect(self, payload):
+        self._session = True
+        self.init_arduino()
+        self.feedback = payload[0] - ord('0') if payload else 0
+        out = self._ack()
+        if self.feedback == 2:
+            out += b'OK Arduino connecte version 1.0 en mode %d\r\n' % self.commode
+        return out
+
+    def _cmd_B(self):
+        self._args.long(0), self._args.long(0)
+        self.count1 = self.count2 = 0.0
+        self._lv1 = self._lv2 = 0
+        return self._ack("Ok encodeurs de position remis à 0")
+
+    def _cmd_C(self):
+        niv1 = self._args.int(0)
+        niv2 = self._args.int(niv1)
+        self._set_motors(niv1, niv2)
+        if (niv1, niv2) == (1, 0):
+            self.task3on = False
+        return self._motor_ack("OK Moteurs mis aux tensions : %d %d" % (niv1, niv2))
+
+    def _cmd_C_lower(self):
+        m = self._args.char(b'0')
+        if m not in (b'1', b'2'):
+            return 'Erreur commande incomplète\r\n'.encode()
+        niv = self._args.int(0)
+        if m == b'1':
+            self._set_motors(niv, self.nivM2)
+        else:
+            self._set_motors(self.nivM1, niv)
+        return self._motor_ack("OK Moteur %s mis à la tension : %d" % (m.decode(), niv))
+
+    def _cmd_D(self):
+        self.nivE1 = self._args.int(0)
+        self.nivE2 = self._args.int(self.nivE1)
+        self.vitdem = self._args.int(25)
+        if not self.obst:
+            self.task3on = True
+            self._tim3 = self.time + DEL_RAMP / 1000
+        return self._motor_ack("OK Moteurs démarrage progressif : %d %d %d"
+                               % (self.nivE1, self.nivE2, self.vitdem))
+
+    def _motor_ack(self, message):
+        out = self._ack()
+        if self.feedback == 2:
+            out += (b'OB stacle d\xc3\xa9tect\xc3\xa9 moteur non allum\xc3\xa9\r\n' if self.obst
+                    else message.encode() + b'\r\n')
+        return out
+
+    def _cmd_G(self):
+        pos = self._args.int(0)
+        self.servopos = max(self.servomin, min(self.servomax, pos))
+        return self._ack("OK servomoteur en %d" % self.servopos)
+
+    def _cmd_G_lower(self):
+        self.servomin = max(0, self._args.int(0))
+        self.servomax = min(270, self._args.int(0))
+        return self._ack("servomoteur min max = %d %d" % (self.servomin, self.servomax))
+
+    def _cmd_I(self):
+        m = self._args.char(b'0')
+        if m == b'0':
+            self.task4on = self.obst = False
+        elif m == b'1':
+            self.task4on, self.obst = True, False
+            self._tim4 = self.time + DEL_IR / 1000
+        out = b'OK\r\n' if self.feedback == 1 else b''
+        if self.feedback == 2:
+            out += b'OK protection moteur : %d\r\n' % self.task4on
+        return out
+
+    def _cmd_N(self):
+        v1, v2 = int(self.count1), int(self.count2)
+        if self._binary():
+            return struct.pack('<ll', v1, v2)
+        return b'%d %d\r\n' % (v1, v2)
+
+    def _cmd_O(self):
+        c = self._args.char(b'0')
+        v2 = int(self.count1) if c == b'1' else int(self.count2) if c == b'2' else 0
+        v1 = int(self.time * 1000)
+        if self._binary():
+            return struct.pack('<ll', v1, v2)
+        return b'%d %d' % (v1, v2)
+
+    def _cmd_P(self):
+        if self._binary():
+            return struct.pack('<hhhh', _int16(self.vitesse1), _int16(self.vitesse2), 0, 0)
+        return b'%d %d\r\n' % (self.vitesse1, self.vitesse2)
+
+    def _cmd_R(self):
+        v1 = int(self.time * 1000)
+        if self._binary():
+            return struct.pack('<lhh', v1, int(self.ir_value), 0)
+        return b'%d %d\r\n' % (v1, self.ir_value)
+
+    def _cmd_S(self):
+        # renvoie la mesure précédente et en lance une nouvelle (durée négligée)
+        t, dist, pos = self._us
+        self._us = (int(self.time * 1000), int(self.range_at(self.servopos)), self.servopos)
+        if self._binary():
+            return struct.pack('<lhh', t, dist, pos)
+        return b'%d %d %d\r\n' % (t, dist, pos)
+
+    def _cmd_T(self):
+        if self._binary():
+            return struct.pack('<hhhh', _int16(self.nivM1), _int16(self.nivM2), 0, 0)
+        return b'%d %d\r\n' % (self.nivM1, self.nivM2)
+
+    _cmd_B_lower = _cmd_B
+    _cmd_D_lower = _cmd_D
+    _cmd_I_lower = _cmd_I
+    _cmd_N_lower = _cmd_N
+    _cmd_O_lower = _cmd_O
+    _cmd_P_lower = _cmd_P
+    _cmd_R_lower = _cmd_R
+    _cmd_S_lower = _cmd_S
+    _cmd_T_lower = _cmd_T
+
+
+class _Arguments:
+    """Lecture des paramètres comme GetChar / GetInt / GetLong"""
+
+    def __init__(self, payload, commode):
+        self.data = bytes(payload)
+        self.pos = 0
+        self.ascii = commode == 0
+
+    def char(self, default):
+        if self.pos < len(self.data):
+            self.pos += 1
+            return self.data[self.pos - 1:self.pos]
+        return default
+
+    def _number(self, default):
+        data = self.data
+        while self.pos < len(data) and data[self.pos] == 32:
+            self.pos += 1
+        start = self.pos
+        if self.pos < len(data) and data[self.pos] == ord('-'):
+            self.pos += 1
+        digits = self.pos
+        while self.pos < len(data) and 48 <= data[self.pos] <= 57:
+            self.pos += 1
+        if self.pos == digits:
+            self.pos = start
+            return default
+        return int(data[start:self.pos])
+
+    def int(self, default):
+        if self.ascii:
+            return _int16(self._number(default))
+        if self.pos + 2 > len(self.data):
+            return default
+        self.pos += 2
+        return struct.unpack_from('<h', self.data, self.pos - 2)[0]
+
+    def long(self, default):
+        if self.ascii:
+            return self._number(default)
+        if self.pos + 4 > len(self.data):
+            return default
+        self.pos += 4
+        return struct.unpack_from('<l', self.data, self.pos - 4)[0]
+
+
+############################################
+# Port série émulé dans le même processus
+############################################
+
+class EmulatedSerial:
+    """
+    Objet compatible serial.Serial relié à un ArduinoEmulator
+
+    Chaque octet met byte_time(baudrate) à traverser la liaison, dans
+    chaque sens : une commande n'est décodée par la carte qu'à l'arrivée
+    de son dernier octet et la réponse n'est lisible qu'au fur et à
+    mesure de son émission.
+
+    realtime=False : horloge virtuelle, les attentes sont instantanées
+    (les durées mesurées avec .clock() restent celles de la liaison).
+    """
+
+    def __init__(self, emulator=None, baudrate=BAUDRATE, timeout=None, realtime=True,
+                 port='emul://'):
+        self.emulator = emulator or ArduinoEmulator()
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.realtime = realtime
+        self.port = port
+        self.is_open = True
+        self.bytes_written = 0
+        self.bytes_read = 0
+        self._byte = byte_time(baudrate)
+        self._t0 = time.monotonic()
+        self._virtual = 0.0
+        self._tx_free = 0.0        # fin d'émission du dernier octet envoyé à la carte
+        self._rx_free = 0.0        # fin d'émission du dernier octet de réponse
+        self._rx = []              # [date de début d'émission, octets] des réponses
+        self._lock = threading.Lock()
+
+    def clock(self):
+        """Date courante de la liaison (s)"""
+        if self.realtime:
+            return time.monotonic() - self._t0
+        return self._virtual
+
+    def sleep(self, duration):
+        """Attente sur l'horloge de la liaison (instantanée en horloge virtuelle)"""
+        if duration <= 0:
+            return
+        if self.realtime:
+            time.sleep(duration)
+        else:
+            self._virtual += duration
+
+    def _reply(self, data, start):
+        if data:
+            start = max(start, self._rx_free)
+            self._rx.append([start, bytearray(data)])
+            self._rx_free = start + len(data) * self._byte
+
+    def _update(self):
+        now = self.clock()
+        self._reply(self.emulator.poll(now), now)
+
+    def write(self, data):
+        """Envoie des octets (non bloquant, comme le buffer du système)"""
+        data = bytes(data)
+        with self._lock:
+            t = max(self.clock(), self._tx_free)
+            for b in data:
+                t += self._byte
+                self._reply(self.emulator.receive(bytes((b,)), t), t)
+            self._tx_free = t
+            self.bytes_written += len(data)
+        return len(data)
+
+    def _ready(self, now):
+        """Nombre d'octets de réponse déjà arrivés à la date now"""
+        count = 0
+        for start, data in self._rx:
+            n = int((now - start) / self._byte + 1e-9)
+            if n < len(data):
+                return count + max(n, 0)
+            count += len(data)
+        return count
+
+    def _when(self, count):
+        """Date d'arrivée du count-ième octet de réponse (None s'il n'est pas émis)"""
+        for start, data in self._rx:
+            if count <= len(data):
+                return start + count * self._byte
+            count -= len(data)
+        return None
+
+    def _take(self, count):
+        out = bytearray()
+        while count and self._rx:
+            start, data = self._rx[0]
+            n = min(count, len(data))
+            out += data[:n]
+            del data[:n]
+            self._rx[0][0] = start + n * self._byte
+            count -= n
+            if not data:
+                self._rx.pop(0)
+        self.bytes_read += len(out)
+        return bytes(out)
+
+    def _deadline(self):
+        return None if self.timeout is None else self.clock() + self.timeout
+
+    def _wait_for(self, count, deadline):
+        """Attend que count octets soient lisibles ou la fin du timeout"""
+        while True:
+            with self._lock:
+                self._update()
+                now = self.clock()
+                ready = self._ready(now)
+                if ready >= count:
+                    return count
+                when = self._when(count)
+            if deadline is not None and now >= deadline:
+                return ready
+            step = 0.001 if when is None else when - now
+            if deadline is not None:
+                step = min(step, deadline - now)
+            self.sleep(max(step, 1e-6))
+
+    def read(self, size=1):
+        count = self._wait_for(size, self._deadline())
+        with self._lock:
+            return self._take(count)
+
+    def readline(self):
+        deadline = self._deadline()
+        line = bytearray()
+        while not line.endswith(b'\n'):
+            if not self._wait_for(1, deadline):
+                break
+            with self._lock:
+                line += self._take(1)
+        return bytes(line)
+
+    @property
+    def in_waiting(self):
+        with self._lock:
+            self._update()
+            return self._ready(self.clock())
+
+    def inWaiting(self):
+        return self.in_waiting
+
+    def reset_input_buffer(self):
+        with self._lock:
+            self._take(self._ready(self.clock()))
+
+    def flush(self):
+        """Attend la fin d'émission des octets envoyés"""
+        self.sleep(self._tx_free - self.clock())
+
+    def close(self):
+        self.is_open = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+############################################
+# Port série émulé sur un pseudo-terminal
+############################################
+
+def serve_pty(emulator=None, baudrate=BAUDRATE):
+    """
+    Expose l'émulateur sur un pseudo-terminal, jusqu'à Ctrl+C
+    Les réponses sont émises au rythme de la liaison série.
+    """
+    import select
+    import tty
+
+    emulator = emulator or ArduinoEmulator()
+    master, slave = os.openpty()
+    tty.setraw(slave)
+    print(f"✓ Émulateur Arduino prêt sur {os.ttyname(slave)}")
+    print(f"  Exemple : python3 dialogue.py {os.ttyname(slave)}")
+
+    t0 = time.monotonic()
+    pace = byte_time(baudrate)
+    try:
+        while True:
+            readable, _, _ = select.select([master], [], [], 0.001)
+            now = time.monotonic() - t0
+            reply = emulator.poll(now)
+            if readable:
+                data = os.read(master, 256)
+                for i, b in enumerate(data):
+                    reply += emulator.receive(bytes((b,)), now + (i + 1) * pace)
+            for b in reply:
+                os.write(master, bytes((b,)))
+                time.sleep(pace)
+    except KeyboardInterrupt:
+        print("\nArrêt de l'émulateur")
+    finally:
+        os.close(master)
+        os.close(slave)
+
+
+############################################
+# Mesure du débit et de la latence
+############################################
+
+def benchmark(count=200, realtime=False):
+    """
+    Aller-retour commande moteur + acquittement, puis question T, dans chaque mode
+    Returns: liste de dict (mode, octets par commande, latence moyenne, commandes/s)
+    """
+    results = []
+    for commode, feedback in ((0, 1), (1, 1), (2, 1), (3, 1)):
+        link = EmulatedSerial(realtime=realtime, timeout=0.1)
+        link.write(encode_command('A', feedback, commode))
+        link.readline()
+        start = link.clock()
+        written = link.bytes_written
+        for i in range(count):
+            link.write(encode_command('C', i % 200, -(i % 200), commode=commode))
+            link.readline()
+            link.write(encode_command('T', commode=commode))
+            if commode >= 2:
+                link.read(8)
+            else:
+                link.readline()
+        elapsed = link.clock() - start
+        results.append({'mode': commode,
+                        'bytes': (link.bytes_written - written) / count,
+                        'latency': elapsed / count,
+                        'rate': count / elapsed})
+    return results
+
+
+def print_benchmark(results):
+    print(f"\n{'Mode':>4} | {'Octets/cycle':>12} | {'Latence (C+T)':>13} | {'Cycles/s':>8}")
+    print("-"*50)
+    for r in results:
+        print(f"{r['mode']:>4} | {r['bytes']:>12.1f} | {r['latency']*1000:>10.2f} ms | {r['rate']:>8.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Émulateur de la carte serial_link.ino")
+    parser.add_argument('--bench', action='store_true', help="mesure débit et latence de la liaison")
+    parser.add_argument('--count', type=int, default=200, help="nombre de cycles mesurés")
+    parser.add_argument('--realtime', action='store_true', help="mesure en temps réel (sinon horloge virtuelle)")
+    parser.add_argument('--baudrate', type=int, default=BAUDRATE)
+    args = parser.parse_args()
+
+    if args.bench:
+        print_benchmark(benchmark(args.count, args.realtime))
+    else:
+        serve_pty(baudrate=args.baudrate)
+
+
+if __name__ == "__main__":
+    main()
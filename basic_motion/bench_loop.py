@@ -0,0 +1,390 @@
+#!/usr/bin/env python3
+"""
+Banc de mesure de la boucle de suivi de ligne (autonomous_line_following)
+
+La vraie boucle de dialogue.py tourne sans robot :
+- images : un tour de piste simulé (simulation.py) ou les images d'une
+  session enregistrée (--session), rejouées au rythme de la caméra
+  (frames.ReplaySource)
+- carte : l'émulateur de serial_link.ino ('emul://', arduino_emulator.py),
+  en temps réel (temps de transmission de chaque octet compris)
+
+Les fonctions appelées par la boucle sont enveloppées pour chronométrer
+chaque étape : capture, vision, pilotage (loi de pilotage et navigation),
+écriture série, attente de l'acquittement et des encodeurs, pause et
+affichage. Le temps d'une étape imbriquée dans une autre (un print dans
+le pilotage) n'est compté qu'une fois ; le reste de l'itération
+(configuration, statistiques) est compté dans « autre ».
+
+Latence image -> commande : de la fin de l'image (timestamp de la
+capture) à l'écriture du dernier octet de la commande moteur. Avec la
+capture dans un thread, la boucle ne bloque plus sur la caméra (fréquence
+plus haute) mais prend une image qui a attendu dans le buffer pendant la
+pause de la boucle : la latence augmente de l'âge de l'image, jusqu'à une
+période de la caméra.
+
+Chaque combinaison d'optimisations est mesurée :
+- capture dans un thread (THREADED_CAPTURE, frames.LatestFrameSource)
+- masque fusionné (FUSED_MASK, vision.line_mask)
+- liaison série asynchrone (ASYNC_SERIAL, dialogue.Actuator)
+Le tableau comparatif (Markdown) est écrit dans bench_boucle.md, à
+commiter avec chaque modification de la boucle. Ce fichier n'est écrit
+que depuis le robot (Raspberry Pi, processeur ARM) et un arbre git propre,
+pour que les chiffres correspondent à une version et au matériel cibles ;
+ailleurs, donner un autre fichier avec --output.
+
+Les print de la boucle partent dans /dev/null (--console pour les garder
+à l'écran, leur coût dépend alors du terminal).
+
+Usage:
+    python3 bench_loop.py [--duration 5] [--session sessions/...] [--output bench_boucle.md]
+"""
+
+import argparse
+import builtins
+import contextlib
+import itertools
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+import config
+import dialogue
+import geometry
+import navigation
+import steering
+import vision
+from frames import FramePool, ReplaySource
+
+STAGES = ('capture', 'vision', 'pilotage', 'écriture', 'acquittement', 'pause', 'affichage')
+
+# Octets d'une commande moteur de send_motor_command : 'C' + 2 int16 + 1 int32
+COMMAND_BYTES = 9
+
+OUTPUT_DEFAULT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_boucle.md')
+
+# Images du tour simulé (à la fréquence de la caméra)
+SIM_FRAMES = 320
+
+_MISSING = object()
+
+
+class StageClock:
+    """
+    Temps propre de chaque étape de la boucle, pour le thread de la boucle seulement
+
+    mark() au début de chaque itération garde les totaux courants : les
+    temps par itération sont leurs différences (une itération inachevée
+    et l'arrêt des moteurs après la boucle ne comptent pas).
+    """
+
+    def __init__(self):
+        self.totals = dict.fromkeys(STAGES, 0.0)
+        self.marks = []             # (date, totaux) au début de chaque itération
+        self.latencies = []         # latence image -> commande (s)
+        self.glass = None           # timestamp de l'image en cours de traitement
+        self.thread = threading.current_thread()
+        self._stack = []
+
+    def wrap(self, stage, fn):
+        def timed(*args, **kwargs):
+            if not self.marks or threading.current_thread() is not self.thread:
+                return fn(*args, **kwargs)
+            self._stack.append(0.0)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                inner = self._stack.pop()
+                self.totals[stage] += elapsed - inner
+                if self._stack:
+                    self._stack[-1] += elapsed
+        return timed
+
+    def mark(self):
+        self.marks.append((time.perf_counter(), dict(self.totals)))
+
+    def iterations(self):
+        """Returns: (périodes des itérations complètes (s), {étape: temps par itération (s)})"""
+        t = np.array([m[0] for m in self.marks])
+        stages = {name: np.diff([m[1][name] for m in self.marks]) for name in STAGES}
+        return np.diff(t), stages
+
+
+class TimedLink:
+    """Liaison série dont les écritures et lectures sont chronométrées"""
+
+    def __init__(self, link, clock):
+        self.link = link
+        self.clock = clock
+        self.write = clock.wrap('écriture', self._write)
+        self.readline = clock.wrap('acquittement', link.readline)
+        self.read = clock.wrap('acquittement', link.read)
+        self._command = 0           # octets écrits de la commande en cours
+
+    def _write(self, data):
+        n = self.link.write(data)
+        # commandes écrites par la boucle ou par le thread d'envoi (ASYNC_SERIAL)
+        if self._command or data[:1] == b'C':
+            self._command += len(data)
+            if self._command >= COMMAND_BYTES:
+                self._command = 0
+                if self.clock.glass is not None:
+                    self.clock.latencies.append(time.monotonic() - self.clock.glass)
+                    self.clock.glass = None
+        return n
+
+    def __getattr__(self, name):
+        return getattr(self.link, name)
+
+
+class _TimeModule:
+    """Module time vu par dialogue.py, avec time.sleep chronométré"""
+
+    def __init__(self, sleep):
+        self.sleep = sleep
+
+    def __getattr__(self, name):
+        return getattr(time, name)
+
+
+class _Patches:
+    """Remplacements d'attributs de modules et de classes, annulés par restore()"""
+
+    def __init__(self):
+        self._saved = []
+
+    def set(self, obj, name, value):
+        self._saved.append((obj, name, vars(obj).get(name, _MISSING)))
+        setattr(obj, name, value)
+
+    def restore(self):
+        for obj, name, value in reversed(self._saved):
+            if value is _MISSING:
+                delattr(obj, name)
+            else:
+                setattr(obj, name, value)
+        self._saved = []
+
+
+def instrument(clock):
+    """Enveloppe les fonctions appelées par la boucle de dialogue.py ; Returns: _Patches"""
+    patches = _Patches()
+
+    capture = dialogue.capture_image
+
+    def timed_capture(frame_source):
+        clock.mark()
+        frame = clock.wrap('capture', capture)(frame_source)
+        if frame is not None:
+            clock.glass = frame.timestamp
+        return frame
+
+    patches.set(dialogue, 'capture_image', timed_capture)
+    for name in ('detect_line', 'compute_steering_command'):
+        stage = 'vision' if name == 'detect_line' else 'pilotage'
+        patches.set(dialogue, name, clock.wrap(stage, getattr(dialogue, name)))
+    for name in ('line_mask', 'centroid', 'detect_line', 'occupancy', 'detect_intersection'):
+        patches.set(vision, name, clock.wrap('vision', getattr(vision, name)))
+    patches.set(geometry.GeometryEstimator, 'from_mask',
+                clock.wrap('vision', geometry.GeometryEstimator.from_mask))
+    patches.set(navigation.Navigator, 'update', clock.wrap('pilotage', navigation.Navigator.update))
+
+    make_controller = steering.make_controller
+
+    def timed_controller(*args, **kwargs):
+        pilot = make_controller(*args, **kwargs)
+        pilot.update = clock.wrap('pilotage', pilot.update)
+        return pilot
+
+    patches.set(steering, 'make_controller', timed_controller)
+    patches.set(dialogue, 'print', clock.wrap('affichage', builtins.print))
+    patches.set(dialogue, 'time', _TimeModule(clock.wrap('pause', time.sleep)))
+    return patches
+
+
+############################################
+# Images rejouées
+############################################
+
+def simulated_frames(count=SIM_FRAMES, track=None):
+    """Vues caméra d'un tour de piste simulé, à la fréquence de la caméra"""
+    from simulation import Simulator, TRACK_DEFAULT
+
+    sim = Simulator(track or TRACK_DEFAULT, period=1.0 / config.CAMERA_FRAMERATE)
+    frames = []
+
+    def control(image):
+        frames.append(image.copy())
+        return sim.line_following_controller(image)
+
+    sim.controller = control
+    sim.run(duration=count * sim.period, laps=1)
+    return np.array(frames)
+
+
+def session_frames(path):
+    """Images d'une session enregistrée avec SESSION_RECORD_FRAMES (session_store.py)"""
+    from session_store import SessionStore
+
+    with SessionStore.open(path) as store:
+        if 'frame' not in store or not len(store['frame']):
+            raise ValueError(f"Pas d'images dans la session {path}")
+        return np.array(store['frame'].data['image'])
+
+
+############################################
+# Mesure
+############################################
+
+def run(images, threaded=False, fused=True, async_serial=False, duration=5.0,
+        controller=config.STEERING_CONTROLLER, port='emul://', console=False):
+    """
+    Une session de suivi de ligne sur les images rejouées
+    Returns: dict (rate en Hz, latencies en s, stages en s par itération, iterations)
+    """
+    clock = StageClock()
+    with tempfile.NamedTemporaryFile('w', suffix='.yaml', delete=False) as f:
+        f.write(f"fused_mask: {str(fused).lower()}\n")
+        config_path = f.name
+    out = contextlib.nullcontext() if console else contextlib.redirect_stdout(open(os.devnull, 'w'))
+    link = None
+    try:
+        with out:
+            link = dialogue.connect_arduino(port)
+            if link is None:
+                raise RuntimeError(f"La carte ne répond pas sur {port}")
+            pool = FramePool(images.shape[1:], count=4 + threaded)
+            source = ReplaySource(images, pool, config.CAMERA_FRAMERATE)
+            patches = instrument(clock)
+            try:
+                options = dialogue.FollowOptions(
+                    duration=duration, feedback=False, config_path=config_path,
+                    controller=controller, threaded_capture=threaded, async_serial=async_serial)
+                dialogue.follow(TimedLink(link, clock), options, frame_source=source)
+            finally:
+                patches.restore()
+    finally:
+        if link is not None:
+            dialogue.disconnect_arduino(link)
+        os.unlink(config_path)
+
+    periods, stages = clock.iterations()
+    return {'rate': 1.0 / periods.mean() if len(periods) else 0.0,
+            'period': periods,
+            'latencies': np.array(clock.latencies),
+            'stages': {name: values.mean() if len(values) else 0.0 for name, values in stages.items()},
+            'iterations': len(periods)}
+
+
+def combinations():
+    """(capture dans un thread, masque fusionné, série asynchrone), de aucune à toutes"""
+    return sorted(itertools.product((False, True), repeat=3), key=lambda c: (sum(c), c[::-1]))
+
+
+def source_version():
+    """Version git du code mesuré (suffixe -dirty si l'arbre est modifié)"""
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], capture_output=True,
+                              text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        return ''
+
+
+def describe_platform():
+    """Version du code et matériel de la mesure, pour l'en-tête d'un tableau"""
+    cv2_version = sys.modules['cv2'].__version__ if 'cv2' in sys.modules else '?'
+    return (f"Version {source_version() or '?'} — {platform.machine()}, {os.cpu_count()} cœur(s), "
+            f"Python {platform.python_version()}, OpenCV {cv2_version}")
+
+
+def not_committable():
+    """Raison pour laquelle un tableau commité ne doit pas être remplacé, ou None"""
+    version = source_version()
+    if not version or version.endswith('-dirty'):
+        return f"arbre git modifié ou inconnu ({version or '?'})"
+    if not platform.machine().startswith(('arm', 'aarch64')):
+        return f"mesure hors du Raspberry Pi ({platform.machine()})"
+    return None
+
+
+def table(results, source, duration):
+    """Tableau comparatif Markdown"""
+    lines = [
+        "# Boucle de suivi de ligne (bench_loop.py)",
+        "",
+        describe_platform(),
+        f"Images : {source}, rejouées à {config.CAMERA_FRAMERATE} images/s ; "
+        f"carte : émulateur temps réel ; {duration:g} s par combinaison",
+        "",
+        "Latence : de la fin de l'image à l'écriture de la commande (ms). "
+        "Étapes : ms par itération. Avec la capture dans un thread, la latence "
+        "comprend l'attente de l'image dans le buffer pendant la pause de la boucle.",
+        "",
+        "| thread | fusionné | async | boucle (Hz) | latence p50 | p90 | p99 | max | "
+        + " | ".join(STAGES) + " | autre |",
+        "|" + "---|" * (9 + len(STAGES)),
+    ]
+    for (threaded, fused, async_serial), r in results:
+        lat = r['latencies'] * 1000
+        p50, p90, p99 = np.percentile(lat, (50, 90, 99)) if len(lat) else (np.nan,) * 3
+        stages = [r['stages'][name] * 1000 for name in STAGES]
+        other = (r['period'].mean() * 1000 - sum(stages)) if len(r['period']) else np.nan
+        flags = ['✓' if flag else ' ' for flag in (threaded, fused, async_serial)]
+        lines.append("| " + " | ".join(flags) + f" | {r['rate']:.1f} | {p50:.1f} | {p90:.1f} | "
+                     f"{p99:.1f} | {lat.max() if len(lat) else np.nan:.1f} | "
+                     + " | ".join(f"{s:.2f}" for s in stages) + f" | {other:.2f} |")
+    return "\n".join(lines) + "\n"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Banc de mesure de la boucle de suivi de ligne")
+    parser.add_argument('--duration', type=float, default=5.0, help="durée de chaque mesure (s)")
+    parser.add_argument('--session', help="session enregistrée dont les images sont rejouées")
+    parser.add_argument('--track', help="piste du tour simulé (sans --session)")
+    parser.add_argument('--controller', default=config.STEERING_CONTROLLER,
+                        choices=sorted(steering.CONTROLLERS))
+    parser.add_argument('--port', default='emul://', help="liaison avec la carte")
+    parser.add_argument('--output', default=OUTPUT_DEFAULT, help="fichier du tableau ('-' : aucun)")
+    parser.add_argument('--console', action='store_true', help="garder les print de la boucle à l'écran")
+    args = parser.parse_args()
+    if os.path.abspath(args.output) == OUTPUT_DEFAULT:
+        reason = not_committable()
+        if reason is not None:
+            parser.error(f"{reason} : le tableau commité {os.path.basename(OUTPUT_DEFAULT)} "
+                         "n'est écrit que sur le robot depuis un arbre propre (--output pour un autre fichier)")
+
+    if args.session:
+        images, source = session_frames(args.session), f"session {os.path.basename(args.session)}"
+    else:
+        images, source = simulated_frames(track=args.track), "tour de piste simulé"
+    print(f"{len(images)} images ({source})")
+
+    results = []
+    for combo in combinations():
+        threaded, fused, async_serial = combo
+        r = run(images, threaded, fused, async_serial, args.duration, args.controller,
+                args.port, args.console)
+        print(f"  thread={threaded!s:5} fusionné={fused!s:5} async={async_serial!s:5} : "
+              f"{r['rate']:5.1f} Hz, latence médiane {np.median(r['latencies']) * 1000:5.1f} ms "
+              f"({r['iterations']} itérations)")
+        results.append((combo, r))
+
+    report = table(results, source, args.duration)
+    print()
+    print(report)
+    if args.output != '-':
+        with open(args.output, 'w') as f:
+            f.write(report)
+        print(f"✓ Tableau écrit dans {args.output}")
+
+
+if __name__ == "__main__":
+    main()
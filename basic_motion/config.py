@@ -3,6 +3,12 @@ Fichier de configuration pour le système de suivi de ligne
 Modifiez ces paramètres pour adapter le comportement du robot
 """
 
+import os
+import time
+from dataclasses import dataclass, field, fields, replace
+
+import numpy as np
+
 # ============================================
 # PARAMÈTRES CAMÉRA
 # ============================================
@@ -17,6 +23,25 @@ CAMERA_SENSOR_MODE = 2
 # Fréquence d'images (FPS)
 CAMERA_FRAMERATE = 32
 
+# Capture dans un thread (frames.LatestFrameSource) : la boucle de contrôle
+# prend la dernière image au lieu d'attendre la suivante
+THREADED_CAPTURE = False
+
+# Montage de la caméra (modèle nominal, simulation.py et geometry.CameraModel)
+# Hauteur de la caméra au-dessus du sol (m)
+CAMERA_HEIGHT = 0.12
+# Inclinaison de l'axe optique sous l'horizontale (degrés)
+CAMERA_TILT = 40.0
+# Avance de la caméra par rapport à l'axe des roues (m)
+CAMERA_OFFSET = 0.08
+# Champ de vision horizontal / vertical (degrés), PiCamera v2
+CAMERA_HFOV = 62.2
+CAMERA_VFOV = 48.8
+
+# Passage image -> sol calibré par rectification.py (homographie, objectif) ;
+# sans ce fichier les contrôleurs utilisent le modèle nominal ci-dessus
+RECTIFICATION_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'rectification.npz')
+
 
 # ============================================
 # PARAMÈTRES DE DÉTECTION DE LIGNE
@@ -44,6 +69,11 @@ ERODE_ITERATIONS = 1
 DILATE_KERNEL_SIZE = (4, 4)
 DILATE_ITERATIONS = 1
 
+# Seuillage et masque HSV fusionnés en un seul inRange sur l'image floutée
+# (résultat identique tant que la plage HSV ne retient que le blanc du
+# seuillage, voir vision.line_mask)
+FUSED_MASK = True
+
 
 # ============================================
 # PARAMÈTRES DE CONTRÔLE
@@ -67,6 +97,27 @@ CORRECTION_FACTOR = 0.5
 # Empêche les moteurs de s'arrêter complètement dans les virages
 MIN_SPEED = 50
 
+# Loi de pilotage (steering.make_controller) :
+# 'table' : correction proportionnelle au décalage du centroïde (ci-dessus)
+# 'pursuit' : poursuite pure d'un point de la ligne à PURSUIT_LOOKAHEAD devant
+# 'stanley' : cap de la ligne et écart latéral (gain STANLEY_GAIN)
+STEERING_CONTROLLER = 'table'
+
+# Distance d'anticipation de la poursuite pure (m)
+PURSUIT_LOOKAHEAD = 0.25
+
+# Gain de l'écart latéral du contrôleur de Stanley (1/s), et vitesse (m/s)
+# ajoutée au dénominateur pour qu'il reste doux à l'arrêt
+STANLEY_GAIN = 2.0
+STANLEY_SOFTENING = 0.1
+
+# Accélération latérale maximale (m/s²) : la vitesse n'est réduite que
+# lorsque la courbure de la ligne l'exige (v² × courbure <= MAX_LATERAL_ACCEL)
+MAX_LATERAL_ACCEL = 0.8
+
+# Vitesse de roue (m/s) pour une commande de 255 (valeur nominale)
+WHEEL_SPEED_AT_255 = 0.6
+
 
 # ============================================
 # PARAMÈTRES DE COMMUNICATION
@@ -74,6 +125,7 @@ MIN_SPEED = 50
 
 # Port série de l'Arduino
 # Valeurs possibles: '/dev/ttyACM0', '/dev/ttyUSB0', '/dev/ttyAMA0'
+# 'emul://' pour l'émulateur de la carte (arduino_emulator.py), sans matériel
 ARDUINO_PORT = '/dev/ttyACM0'
 
 # Baudrate (vitesse de communication)
@@ -82,6 +134,142 @@ ARDUINO_BAUDRATE = 115200
 # Timeout de lecture (secondes)
 ARDUINO_TIMEOUT = 0.1
 
+# Délai maximal de réponse de la carte à la connexion (secondes)
+# (elle redémarre à l'ouverture du port)
+ARDUINO_STARTUP_TIMEOUT = 3.0
+
+# Commandes moteur sans attendre l'acquittement : l'envoi, l'acquittement et
+# la lecture des encodeurs se font dans un thread (dialogue.Actuator)
+ASYNC_SERIAL = False
+
+# Socket Unix du démon de la liaison série (arduino_daemon.py, port 'daemon://')
+ARDUINO_DAEMON_SOCKET = '/tmp/arduino_daemon.sock'
+
+
+# ============================================
+# PARAMÈTRES DE GÉOMÉTRIE DE LA LIGNE (geometry.py)
+# ============================================
+
+# Degré du polynôme ajusté sur la ligne (1 = droite, 2 = avec courbure)
+GEOMETRY_DEGREE = 2
+
+# Une ligne du masque sur GEOMETRY_ROW_STEP est utilisée pour l'ajustement
+GEOMETRY_ROW_STEP = 4
+
+# Méthode d'ajustement : 'lsq' (moindres carrés) ou 'ransac' (robuste aux
+# branches des intersections)
+GEOMETRY_METHOD = 'ransac'
+
+# RANSAC : hypothèses au plus, écart maximal (pixels) d'un point conservé,
+# et part des pixels conservés au-delà de laquelle on s'arrête
+RANSAC_ITERATIONS = 32
+RANSAC_TOLERANCE = 6.0
+RANSAC_STOP_RATIO = 0.8
+
+
+# ============================================
+# PARAMÈTRES DE L'ODOMÉTRIE
+# ============================================
+
+# Nombre de ticks d'encodeur par tour de roue (front descendant de la voie B)
+ENCODER_TICKS_PER_REV = 360
+
+# Diamètre des roues (mètres)
+WHEEL_DIAMETER = 0.065
+
+# Entraxe des roues (mètres)
+WHEEL_BASE = 0.15
+
+# Fréquence d'échantillonnage des encodeurs (Hz)
+ODOMETRY_FREQUENCY = 100
+
+
+# ============================================
+# PARAMÈTRES DE L'ASSERVISSEMENT DE VITESSE
+# ============================================
+
+# Fréquence de la boucle de vitesse des roues (Hz), plus rapide que la vision
+SPEED_LOOP_FREQUENCY = 50
+
+# Gains du correcteur PI (commande PWM par m/s d'erreur, et par m)
+SPEED_KP = 150.0
+SPEED_KI = 600.0
+
+# Table PWM -> vitesse apprise par speed_control.py --calibrate
+SPEED_TABLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'table_vitesse.npz')
+
+
+# ============================================
+# PARAMÈTRES DE NAVIGATION (navigation.py)
+# ============================================
+
+# Durée (s) pendant laquelle la dernière commande est gardée après la perte de la ligne
+LOST_HOLD_TIME = 0.1
+
+# Amplitude (degrés) du balayage de recherche de chaque côté
+SEARCH_SWEEP_ANGLE = 70
+
+# Commandes des roues (extérieure, intérieure) pendant le balayage
+SEARCH_WHEELS = (200, -100)
+
+# Part des pixels blancs (image sous-échantillonnée) au-delà de laquelle
+# la détection complète est relancée pendant la recherche
+RECAPTURE_OCCUPANCY = 0.01
+
+# Une ligne et une colonne sur OCCUPANCY_STEP lues par vision.occupancy
+OCCUPANCY_STEP = 4
+
+# Nombre d'images consécutives où vision.detect_intersection doit voir une
+# intersection avant de la prendre en compte (détection isolée ignorée)
+INTERSECTION_FRAMES = 3
+
+# Distance (m) parcourue après la disparition d'une intersection de l'image
+# avant de reprendre le suivi (le croisement est alors sous le robot)
+INTERSECTION_DISTANCE = 0.14
+
+# Graphe de la piste (track_graph.py) : routes précalculées, gardées en cache
+TRACK_GRAPH_CACHE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'graphe_piste.json')
+
+# Pénalité de temps (s par radian) d'un virage à une intersection
+TURN_TIME_PER_RAD = 0.3
+
+# Distance (m) du croisement quand la vision le détecte devant le robot
+INTERSECTION_AHEAD = 0.3
+
+# Écart (m) admis entre la distance parcourue et la longueur de l'arête
+# pour rattacher une intersection détectée au nœud attendu
+ROUTE_TOLERANCE = 0.2
+
+
+# ============================================
+# PARAMÈTRES DE DÉTECTION D'OBSTACLES
+# ============================================
+
+# Balayage du servomoteur avant : angle min, angle max, pas (degrés)
+SWEEP_ANGLES = (30, 150, 15)
+
+# Temps laissé au servomoteur pour atteindre un angle (secondes)
+SERVO_SETTLE_TIME = 0.06
+
+# Durée maximale d'une mesure ultrasonore (secondes) : attente de l'écho
+# (30 ms au plus) puis impulsion de 50 µs par cm jusqu'à 5 m
+US_PING_TIME = 0.06
+
+# Nombre de mesures gardées par angle pour le filtrage médian
+RANGE_HISTORY = 5
+
+# Distance (cm) en dessous de laquelle un obstacle bloque la route
+OBSTACLE_DISTANCE = 25
+
+# Demi-largeur (degrés) du cône devant le robot considéré pour le blocage
+OBSTACLE_CONE = 20
+
+# Fréquence de publication de l'état des obstacles (Hz)
+OBSTACLE_RATE = 10
+
+# Table ADC -> distance du capteur infrarouge apprise par ir_calibration.py
+IR_LUT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'table_infrarouge.npy')
+
 
 # ============================================
 # PARAMÈTRES DE PERFORMANCE
@@ -115,11 +303,81 @@ DEBUG_PRINT_COMMANDS = True
 DEBUG_SAVE_IMAGES = False
 DEBUG_SAVE_PATH = "/tmp/line_tracking/"
 
+# Enregistrement des sessions de roulage (session_store.py)
+SESSION_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sessions")
+
+# Enregistrer aussi les images (61 Ko par image, soit ~1 Mo/s à 20 Hz)
+SESSION_RECORD_FRAMES = False
+
 
 # ============================================
 # PROFILS PRÉDÉFINIS
 # ============================================
 
+# Profils générés par l'optimisation automatique (tuning.py)
+TUNED_PROFILES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                   "profils_regles.yaml")
+
+# Paramètres qu'un profil peut modifier
+PROFILE_KEYS = ('BASE_SPEED', 'CORRECTION_FACTOR', 'DEAD_ZONE', 'MIN_SPEED',
+                'THRESHOLD_VALUE', 'BLUR_KERNEL_SIZE', 'HSV_LOWER_WHITE',
+                'HSV_UPPER_WHITE')
+
+PROFILES = {
+    'default': {
+        'BASE_SPEED': 100,
+        'CORRECTION_FACTOR': 0.5,
+        'DEAD_ZONE': 10,
+        'MIN_SPEED': 50
+    },
+    'aggressive': {
+        'BASE_SPEED': 120,
+        'CORRECTION_FACTOR': 0.7,
+        'DEAD_ZONE': 5,
+        'MIN_SPEED': 40
+    },
+    'smooth': {
+        'BASE_SPEED': 80,
+        'CORRECTION_FACTOR': 0.3,
+        'DEAD_ZONE': 15,
+        'MIN_SPEED': 60
+    },
+    'fast': {
+        'BASE_SPEED': 150,
+        'CORRECTION_FACTOR': 0.4,
+        'DEAD_ZONE': 8,
+        'MIN_SPEED': 80
+    },
+    'precise': {
+        'BASE_SPEED': 60,
+        'CORRECTION_FACTOR': 0.6,
+        'DEAD_ZONE': 5,
+        'MIN_SPEED': 30
+    }
+}
+
+
+def available_profiles():
+    """Profils prédéfinis et profils générés par tuning.py"""
+    profiles = dict(PROFILES)
+    if os.path.exists(TUNED_PROFILES_PATH):
+        import yaml
+        with open(TUNED_PROFILES_PATH) as f:
+            profiles.update(yaml.safe_load(f) or {})
+    return profiles
+
+
+def apply_parameters(params):
+    """Applique un dictionnaire {NOM_PARAMETRE: valeur} à la configuration"""
+    unknown = set(params) - set(PROFILE_KEYS)
+    if unknown:
+        raise KeyError(f"Paramètres inconnus: {', '.join(sorted(unknown))}")
+    for key, value in params.items():
+        if isinstance(globals()[key], tuple):
+            value = tuple(value)
+        globals()[key] = value
+
+
 def load_profile(profile_name):
     """
     Charge un profil de configuration prédéfini
@@ -130,48 +388,12 @@ def load_profile(profile_name):
     - 'smooth': Virages doux, idéal pour débutants
     - 'fast': Vitesse élevée, pour circuit simple
     - 'precise': Très précis mais lent
+    - les profils enregistrés par tuning.py dans profils_regles.yaml
     """
-    global BASE_SPEED, CORRECTION_FACTOR, DEAD_ZONE, MIN_SPEED
-    
-    profiles = {
-        'default': {
-            'BASE_SPEED': 100,
-            'CORRECTION_FACTOR': 0.5,
-            'DEAD_ZONE': 10,
-            'MIN_SPEED': 50
-        },
-        'aggressive': {
-            'BASE_SPEED': 120,
-            'CORRECTION_FACTOR': 0.7,
-            'DEAD_ZONE': 5,
-            'MIN_SPEED': 40
-        },
-        'smooth': {
-            'BASE_SPEED': 80,
-            'CORRECTION_FACTOR': 0.3,
-            'DEAD_ZONE': 15,
-            'MIN_SPEED': 60
-        },
-        'fast': {
-            'BASE_SPEED': 150,
-            'CORRECTION_FACTOR': 0.4,
-            'DEAD_ZONE': 8,
-            'MIN_SPEED': 80
-        },
-        'precise': {
-            'BASE_SPEED': 60,
-            'CORRECTION_FACTOR': 0.6,
-            'DEAD_ZONE': 5,
-            'MIN_SPEED': 30
-        }
-    }
+    profiles = available_profiles()
     
     if profile_name in profiles:
-        profile = profiles[profile_name]
-        BASE_SPEED = profile['BASE_SPEED']
-        CORRECTION_FACTOR = profile['CORRECTION_FACTOR']
-        DEAD_ZONE = profile['DEAD_ZONE']
-        MIN_SPEED = profile['MIN_SPEED']
+        apply_parameters(profiles[profile_name])
         print(f"✓ Profil '{profile_name}' chargé")
         print(f"  BASE_SPEED={BASE_SPEED}, CORRECTION_FACTOR={CORRECTION_FACTOR}")
         print(f"  DEAD_ZONE={DEAD_ZONE}, MIN_SPEED={MIN_SPEED}")
@@ -182,6 +404,177 @@ def load_profile(profile_name):
         return False
 
 
+# ============================================
+# OBJET DE CONFIGURATION (IMMUABLE)
+# ============================================
+
+# Fichier YAML relu à chaud par ConfigWatcher pendant le suivi de ligne
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "suivi_ligne.yaml")
+
+
+@dataclass(frozen=True, slots=True)
+class LineConfig:
+    """
+    Paramètres de détection et de pilotage, figés
+
+    Passé explicitement à vision.detect_line et steering.compute_steering_command.
+    Les valeurs dérivées (noyaux morphologiques, bornes HSV, table des
+    vitesses moteur) sont calculées une seule fois à la création.
+    Pour modifier un paramètre : cfg.replace(base_speed=120)
+    """
+
+    camera_resolution: tuple = CAMERA_RESOLUTION
+    blur_kernel_size: tuple = BLUR_KERNEL_SIZE
+    threshold_value: int = THRESHOLD_VALUE
+    hsv_lower_white: tuple = tuple(HSV_LOWER_WHITE)
+    hsv_upper_white: tuple = tuple(HSV_UPPER_WHITE)
+    erode_kernel_size: tuple = ERODE_KERNEL_SIZE
+    erode_iterations: int = ERODE_ITERATIONS
+    dilate_kernel_size: tuple = DILATE_KERNEL_SIZE
+    dilate_iterations: int = DILATE_ITERATIONS
+    dead_zone: int = DEAD_ZONE
+    base_speed: int = BASE_SPEED
+    correction_factor: float = CORRECTION_FACTOR
+    min_speed: int = MIN_SPEED
+    fused_mask: bool = FUSED_MASK
+
+    # Valeurs dérivées
+    erode_kernel: np.ndarray = field(init=False, repr=False, compare=False)
+    dilate_kernel: np.ndarray = field(init=False, repr=False, compare=False)
+    hsv_lower: np.ndarray = field(init=False, repr=False, compare=False)
+    hsv_upper: np.ndarray = field(init=False, repr=False, compare=False)
+    speed_table: np.ndarray = field(init=False, repr=False, compare=False)
+    white_lower: np.ndarray = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        for name in ('camera_resolution', 'blur_kernel_size', 'hsv_lower_white',
+                     'hsv_upper_white', 'erode_kernel_size', 'dilate_kernel_size'):
+            object.__setattr__(self, name, tuple(int(v) for v in getattr(self, name)))
+        if not 0 <= self.min_speed <= self.base_speed <= 255:
+            raise ValueError("Il faut 0 <= min_speed <= base_speed <= 255")
+
+        derived = {
+            'erode_kernel': np.ones(self.erode_kernel_size, np.uint8),
+            'dilate_kernel': np.ones(self.dilate_kernel_size, np.uint8),
+            'hsv_lower': np.array(self.hsv_lower_white, np.uint8),
+            'hsv_upper': np.array(self.hsv_upper_white, np.uint8),
+            'speed_table': self._speed_table(),
+        }
+        for name, value in derived.items():
+            value.flags.writeable = False
+            object.__setattr__(self, name, value)
+        object.__setattr__(self, 'white_lower', self._white_lower())
+
+    def _white_lower(self):
+        """
+        Borne basse du masque fusionné (vision.line_mask), ou None s'il ne
+        donne pas le même résultat que seuillage + HSV
+        Après le seuillage chaque canal vaut 0 ou 255 : le noir a V = 0,
+        les couleurs saturées S = 255 et le blanc S = 0, V = 255. Si la
+        plage HSV ne retient que le blanc, le masque se résume à « les
+        trois canaux flous au-dessus du seuil ».
+        """
+        lower, upper = self.hsv_lower_white, self.hsv_upper_white
+        white_only = (lower[0] == 0 and lower[1] == 0 and upper[2] == 255
+                      and lower[2] > 0 and upper[1] < 255)
+        if not self.fused_mask or not white_only or self.threshold_value >= 255:
+            return None
+        value = np.full(3, self.threshold_value + 1, np.uint8)
+        value.flags.writeable = False
+        return value
+
+    def _speed_table(self):
+        """Vitesses (gauche, droite) pour chaque colonne du centroïde"""
+        width = self.camera_resolution[0]
+        center_x = width / 2
+        error = np.arange(width) - center_x
+        correction = np.minimum(np.abs(error) / center_x, 1.0)
+        reduced = (self.base_speed * (1 - correction * self.correction_factor)).astype(int)
+        reduced = np.maximum(reduced, self.min_speed)
+
+        table = np.full((width, 2), self.base_speed, np.int16)
+        left_turn = (error < 0) & (np.abs(error) >= self.dead_zone)
+        right_turn = (error > 0) & (np.abs(error) >= self.dead_zone)
+        table[left_turn, 0] = reduced[left_turn]
+        table[right_turn, 1] = reduced[right_turn]
+        return table
+
+    def replace(self, **changes):
+        """Nouvelle configuration avec certains paramètres modifiés"""
+        return replace(self, **changes)
+
+    @classmethod
+    def from_dict(cls, values, base=None):
+        """
+        Configuration à partir d'un dict (clés en minuscules ou en
+        majuscules comme dans les profils : BASE_SPEED ou base_speed)
+        """
+        changes = {key.lower(): value for key, value in (values or {}).items()}
+        names = {f.name for f in fields(cls) if f.init}
+        unknown = set(changes) - names
+        if unknown:
+            raise KeyError(f"Paramètres inconnus: {', '.join(sorted(unknown))}")
+        return replace(base, **changes) if base is not None else cls(**changes)
+
+    @classmethod
+    def from_module(cls):
+        """Configuration reflétant les valeurs actuelles du module (après load_profile)"""
+        return cls.from_dict({key: globals()[key] for key in PROFILE_KEYS + (
+            'CAMERA_RESOLUTION', 'ERODE_KERNEL_SIZE', 'ERODE_ITERATIONS',
+            'DILATE_KERNEL_SIZE', 'DILATE_ITERATIONS', 'FUSED_MASK')})
+
+    @classmethod
+    def from_yaml(cls, path, base=None):
+        """Configuration lue dans un fichier YAML (les clés absentes gardent leur valeur)"""
+        import yaml
+        with open(path) as f:
+            values = yaml.safe_load(f) or {}
+        profile = values.pop('profile', None)
+        if profile is not None:
+            base = cls.from_dict(available_profiles()[profile], base)
+        return cls.from_dict(values, base)
+
+
+class ConfigWatcher:
+    """
+    Relecture à chaud du fichier de configuration YAML
+
+    poll() est appelé au début de chaque image : il renvoie la configuration
+    à utiliser pour toute l'image. Si le fichier a changé, la nouvelle
+    configuration remplace l'ancienne d'un seul coup ; si elle est invalide,
+    l'ancienne est conservée.
+    """
+
+    def __init__(self, path=CONFIG_PATH, base=None, interval=0.5):
+        self.path = path
+        self.base = base or LineConfig.from_module()
+        self.interval = interval
+        self.current = self.base
+        self.reloads = 0
+        self._mtime = None
+        self._next_check = 0.0
+        self.poll()
+
+    def poll(self):
+        now = time.monotonic()
+        if now < self._next_check:
+            return self.current
+        self._next_check = now + self.interval
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            return self.current
+        if mtime != self._mtime:
+            self._mtime = mtime
+            try:
+                self.current = LineConfig.from_yaml(self.path, self.base)
+                self.reloads += 1
+                print(f"✓ Configuration rechargée depuis {self.path}")
+            except Exception as e:
+                print(f"✗ Configuration invalide ({e}), ancienne conservée")
+        return self.current
+
+
 # ============================================
 # GUIDE D'AJUSTEMENT
 # ============================================
@@ -238,5 +631,5 @@ if __name__ == "__main__":
     print("="*50)
     
     print("\nProfils disponibles:")
-    for profile in ['default', 'aggressive', 'smooth', 'fast', 'precise']:
+    for profile in available_profiles():
         print(f"  - {profile}")
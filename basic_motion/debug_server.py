@@ -0,0 +1,262 @@
+"""
+Serveur de visualisation de debug hors de la boucle de contrôle
+
+La boucle de contrôle ne dessine plus rien et n'appelle plus cv2.imshow :
+elle publie seulement l'indice du buffer de l'image (FramePool partagé)
+et quelques informations (centroïde, texte), une image sur `every`.
+Un objet de contexte (la configuration courante par exemple) n'est
+transmis que lorsqu'il change.
+Un processus séparé lit l'image en mémoire partagée, dessine les
+overlays, encode en JPEG et sert un flux MJPEG consultable depuis un
+navigateur : http://<ip du robot>:8080/
+
+Si le processus de rendu est encore occupé, l'image est simplement
+ignorée : la boucle de contrôle n'attend jamais.
+"""
+
+import multiprocessing as mp
+import threading
+import time
+
+import cv2
+
+from frames import FramePool
+
+DEFAULT_PORT = 8080
+
+_PAGE = b"""<html><head><title>Robot - debug</title></head>
+<body style="background:#222;color:#eee;font-family:sans-serif">
+<h3>Suivi de ligne - vue de debug</h3>
+<img src="/stream" style="width:640px;image-rendering:pixelated">
+</body></html>"""
+
+
+def draw_overlay(image, info, context=None):
+    """
+    Overlays par défaut : centroïde, ligne centrale, zone morte et texte
+    info: dict avec les clés optionnelles 'cx', 'cy', 'dead_zone', 'text', 'fps'
+    """
+    h, w = image.shape[:2]
+    cv2.line(image, (w//2, 0), (w//2, h), (0, 0, 255), 1)
+
+    dead_zone = info.get('dead_zone')
+    if dead_zone:
+        cv2.line(image, (w//2 - dead_zone, 0), (w//2 - dead_zone, h), (128, 128, 128), 1)
+        cv2.line(image, (w//2 + dead_zone, 0), (w//2 + dead_zone, h), (128, 128, 128), 1)
+
+    cx, cy = info.get('cx'), info.get('cy')
+    if cx is not None:
+        cv2.circle(image, (cx, cy), 5, (255, 0, 0), -1)
+        cv2.putText(image, f"({cx},{cy})", (cx+10, cy-10),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.4, (255, 0, 0), 1)
+
+    if 'text' in info:
+        cv2.putText(image, info['text'], (5, 15),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.3, (255, 255, 255), 1)
+    if 'fps' in info:
+        cv2.putText(image, f"FPS: {info['fps']:.1f}", (5, h-5),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.3, (255, 255, 255), 1)
+    return image
+
+
+class DebugServer:
+    """
+    Publication des images de debug vers un processus de rendu
+
+    pool: FramePool créé avec shared=True
+    render: fonction render(image, info, context) -> image, exécutée dans
+            le processus de rendu (doit être définie au niveau d'un module)
+    every: décimation, une image publiée sur `every`
+    """
+
+    def __init__(self, pool, render=draw_overlay, port=DEFAULT_PORT, every=5, quality=70):
+        self.pool = pool
+        self.render = render
+        self.port = port
+        self.every = max(1, every)
+        self.quality = quality
+        self.published = 0
+        self.dropped = 0
+        self._count = 0
+        self._inflight = None
+        self._context = None
+        self._conn = None
+        self._process = None
+
+    def start(self):
+        """Lance le processus de rendu et le serveur HTTP"""
+        self._conn, child_conn = mp.Pipe()
+        self._process = mp.Process(target=_render_loop, daemon=True,
+                                   args=(child_conn, self.pool.shared_spec, self.render,
+                                         self.port, self.quality))
+        self._process.start()
+        print(f"✓ Serveur de debug sur http://0.0.0.0:{self.port}/")
+        return self
+
+    def publish(self, frame, context=None, **info):
+        """
+        Publie une image (appelé depuis la boucle de contrôle, non bloquant)
+        context: objet transmis au rendu seulement s'il a changé
+        Returns: True si l'image a été transmise au processus de rendu
+        """
+        self._count += 1
+        self._collect()
+        if self._count % self.every:
+            return False
+        if self._inflight is not None:
+            self.dropped += 1
+            return False
+        self._inflight = frame.retain()
+        if context is self._context:
+            context = None
+        else:
+            self._context = context
+        self._conn.send((frame.index, info, context))
+        self.published += 1
+        return True
+
+    def _collect(self):
+        # Le processus de rendu renvoie l'indice dès qu'il a copié l'image
+        while self._inflight is not None and self._conn.poll():
+            self._conn.recv()
+            self._inflight.release()
+            self._inflight = None
+
+    def close(self):
+        if self._process is None:
+            return
+        try:
+            self._conn.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self._process.join(timeout=1.0)
+        if self._process.is_alive():
+            self._process.terminate()
+        if self._inflight is not None:
+            self._inflight.release()
+            self._inflight = None
+        self._process = None
+
+
+############################################
+# Processus de rendu
+############################################
+
+class _LatestJpeg:
+    """Dernière image encodée, partagée entre les clients HTTP"""
+
+    def __init__(self):
+        self.data = None
+        self.number = 0
+        self.cond = threading.Condition()
+
+    def put(self, data):
+        with self.cond:
+            self.data = data
+            self.number += 1
+            self.cond.notify_all()
+
+    def wait(self, number, timeout=1.0):
+        with self.cond:
+            self.cond.wait_for(lambda: self.number != number, timeout)
+            return self.number, self.data
+
+
+def _make_handler(latest):
+    from http.server import BaseHTTPRequestHandler
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == '/':
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/html')
+                self.end_headers()
+                self.wfile.write(_PAGE)
+            elif self.path == '/frame.jpg':
+                number, data = latest.wait(-1, timeout=0)
+                if data is None:
+                    self.send_error(503)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', 'image/jpeg')
+                self.end_headers()
+                self.wfile.write(data)
+            elif self.path == '/stream':
+                self.send_response(200)
+                self.send_header('Content-Type', 'multipart/x-mixed-replace; boundary=frame')
+                self.end_headers()
+                number = 0
+                try:
+                    while True:
+                        number, data = latest.wait(number)
+                        if data is None:
+                            continue
+                        self.wfile.write(b'--frame\r\nContent-Type: image/jpeg\r\n\r\n')
+                        self.wfile.write(data)
+                        self.wfile.write(b'\r\n')
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+            else:
+                self.send_error(404)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def _render_loop(conn, spec, render, port, quality):
+    from http.server import ThreadingHTTPServer
+
+    shm, storage = FramePool.attach(spec)
+    latest = _LatestJpeg()
+    httpd = ThreadingHTTPServer(('', port), _make_handler(latest))
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+
+    params = [cv2.IMWRITE_JPEG_QUALITY, quality]
+    context = None
+    try:
+        while True:
+            msg = conn.recv()
+            if msg is None:
+                break
+            index, info, new_context = msg
+            if new_context is not None:
+                context = new_context
+            image = storage[index].copy()
+            conn.send(index)            # le buffer peut retourner dans le pool
+            image = render(image, info, context)
+            ok, jpg = cv2.imencode('.jpg', image, params)
+            if ok:
+                latest.put(jpg.tobytes())
+    except (EOFError, KeyboardInterrupt):
+        pass
+    finally:
+        httpd.shutdown()
+        del storage
+        shm.close()
+
+
+if __name__ == "__main__":
+    # Démonstration : image de test animée
+    import numpy as np
+
+    pool = FramePool((128, 160, 3), count=4, shared=True)
+    server = DebugServer(pool, every=1).start()
+    try:
+        t0 = time.time()
+        while True:
+            frame = pool.acquire()
+            buf = pool.buffer(frame)
+            buf[:] = 40
+            cx = int(80 + 60 * np.sin(time.time() - t0))
+            buf[:, max(cx-5, 0):cx+5] = 255
+            server.publish(frame, cx=cx, cy=64, dead_zone=10, text="demo")
+            frame.release()
+            time.sleep(0.05)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        pool.close()
@@ -16,6 +16,8 @@ except ImportError:
     print("Assurez-vous que config.py est dans le même dossier")
     sys.exit(1)
 
+import steering
+
 def print_banner():
     """Affiche une bannière d'accueil"""
     print("\n" + "="*70)
@@ -78,19 +80,24 @@ def load_profile_interactive():
     print("PROFILS DE CONFIGURATION DISPONIBLES")
     print("="*70)
     
-    profiles = {
-        '1': ('default', 'Configuration par défaut, équilibrée'),
-        '2': ('aggressive', 'Virages rapides, pour circuit avec virages serrés'),
-        '3': ('smooth', 'Virages doux, idéal pour débutants'),
-        '4': ('fast', 'Vitesse élevée, pour circuit simple'),
-        '5': ('precise', 'Très précis mais lent')
+    descriptions = {
+        'default': 'Configuration par défaut, équilibrée',
+        'aggressive': 'Virages rapides, pour circuit avec virages serrés',
+        'smooth': 'Virages doux, idéal pour débutants',
+        'fast': 'Vitesse élevée, pour circuit simple',
+        'precise': 'Très précis mais lent'
     }
     
+    # Profils prédéfinis puis profils générés par tuning.py
+    profiles = {}
+    for i, name in enumerate(config.available_profiles(), 1):
+        profiles[str(i)] = (name, descriptions.get(name, 'Profil réglé par simulation (tuning.py)'))
+    
     for key, (name, desc) in profiles.items():
         print(f"{key}. {name:12} - {desc}")
     
     print("-"*70)
-    choice = input("Choisissez un profil (1-5, ou Q pour annuler): ").strip().upper()
+    choice = input(f"Choisissez un profil (1-{len(profiles)}, ou Q pour annuler): ").strip().upper()
     
     if choice in profiles:
         profile_name = profiles[choice][0]
@@ -136,26 +143,24 @@ def test_arduino_communication():
     try:
         import serial
         print(f"\nTentative de connexion à {config.ARDUINO_PORT}...")
-        arduino = serial.Serial(
-            port=config.ARDUINO_PORT,
+        from serial_protocol import connect, encode_command
+        
+        # Test de communication (demande renvoyée jusqu'à ce que la carte réponde)
+        print("\nEnvoi de la commande de connexion...")
+        arduino, rep = connect(
+            config.ARDUINO_PORT, b'A20',
             baudrate=config.ARDUINO_BAUDRATE,
-            timeout=config.ARDUINO_TIMEOUT
+            timeout=config.ARDUINO_TIMEOUT,
+            startup=config.ARDUINO_STARTUP_TIMEOUT
         )
         print("✓ Connexion établie")
-        time.sleep(2)
-        
-        # Test de communication
-        print("\nEnvoi de la commande de connexion...")
-        arduino.write(b'A20')
-        time.sleep(0.1)
         
-        rep = arduino.readline()
         if rep:
             print(f"✓ Réponse reçue: {rep.decode().strip()}")
             
             # Test d'une commande moteur
             print("\nTest d'une commande moteur (vitesse 0)...")
-            arduino.write(b'M L0 R0\n')
+            arduino.write(encode_command('C', 0, 0))
             time.sleep(0.1)
             rep = arduino.readline()
             if rep:
@@ -206,10 +211,16 @@ def launch_autonomous_mode():
         print("="*70)
         
         try:
-            # Import et lancement du script principal
+            # dialogue s'importe sans se connecter : on ouvre la liaison ici
             import dialogue
-            # Cette partie nécessiterait d'adapter dialogue.py
-            print("Note: Lancez dialogue.py directement pour le mode autonome complet")
+            arduino = dialogue.connect_arduino(config.ARDUINO_PORT)
+            if arduino is None:
+                print(f"✗ Pas de réponse de l'Arduino sur {config.ARDUINO_PORT}")
+                return False
+            try:
+                dialogue.follow(arduino, dialogue.FollowOptions(duration=duration))
+            finally:
+                dialogue.disconnect_arduino(arduino)
             return True
         except Exception as e:
             print(f"✗ Erreur: {e}")
@@ -224,7 +235,8 @@ def simulate_steering_commands():
     print("SIMULATION DU CALCUL DES COMMANDES")
     print("="*70)
     
-    image_width = config.CAMERA_RESOLUTION[0]
+    cfg = config.LineConfig.from_module()
+    image_width = cfg.camera_resolution[0]
     center_x = image_width / 2
     
     print(f"\nLargeur d'image: {image_width} pixels")
@@ -252,22 +264,13 @@ def simulate_steering_commands():
     for cx, description in test_positions:
         error = cx - center_x
         
-        # Calcul des vitesses
-        if abs(error) < config.DEAD_ZONE:
-            left_speed = config.BASE_SPEED
-            right_speed = config.BASE_SPEED
+        # Calcul des vitesses (même loi que le suivi de ligne, via la table précalculée)
+        left_speed, right_speed = steering.compute_steering_command(cx, cfg)
+        if left_speed == right_speed:
             action = "Tout droit"
-        elif error < 0:
-            correction = min(abs(error) / center_x, 1.0)
-            left_speed = int(config.BASE_SPEED * (1 - correction * config.CORRECTION_FACTOR))
-            left_speed = max(left_speed, config.MIN_SPEED)
-            right_speed = config.BASE_SPEED
+        elif left_speed < right_speed:
             action = "Tourne gauche"
         else:
-            correction = min(error / center_x, 1.0)
-            left_speed = config.BASE_SPEED
-            right_speed = int(config.BASE_SPEED * (1 - correction * config.CORRECTION_FACTOR))
-            right_speed = max(right_speed, config.MIN_SPEED)
             action = "Tourne droite"
         
         print(f"{description:20} | {error:>8.1f} | {left_speed:>7} | {right_speed:>7} | {action:15}")
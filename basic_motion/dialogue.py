@@ -6,23 +6,21 @@
 #
 #########################################################################
 
-import serial 
+import argparse
 import time
-import numpy as np
-import cv2
 import struct
 import sys
-import os
+import threading
+from collections import deque
+from dataclasses import dataclass, fields, replace
 
-# Import de la caméra
-try:
-    from picamera import PiCamera
-    from picamera.array import PiRGBArray
-    PICAMERA_AVAILABLE = True
-except ImportError:
-    print("PiCamera non disponible, mode simulation")
-    PICAMERA_AVAILABLE = False
+import config
+import steering
+from serial_protocol import connect, connect_command, set_mode
 
+# Les modules lourds (cv2, picamera, multiprocessing) ne sont importés
+# qu'au lancement du suivi de ligne : la connexion à la carte et le menu
+# sont prêts dès le démarrage, et le module s'importe sans effet de bord
 
 
 def read_i16(f):
@@ -47,124 +45,63 @@ def write_i32(f, value):
 # Configuration de la caméra
 resolution_target = (160, 128)
 
-def init_camera():
-    """Initialise la caméra PiCamera"""
-    if not PICAMERA_AVAILABLE:
+def init_camera(shared=False, count=4):
+    """
+    Initialise la caméra PiCamera
+    Les images sont écrites directement dans un pool de buffers (pas de copie)
+    shared: pool en mémoire partagée (nécessaire pour le serveur de debug
+            et les processus de vision)
+    count: nombre de buffers du pool
+    """
+    try:
+        from picamera import PiCamera
+    except ImportError:
+        print("PiCamera non disponible, mode simulation")
         return None, None, None
+    from frames import FramePool, PiCameraSource
     
     camera = PiCamera(sensor_mode=2)
     camera.resolution = resolution_target
     camera.framerate = 32
-    rawCapture = PiRGBArray(camera, size=camera.resolution)
-    frame_source = camera.capture_continuous(rawCapture, format="bgr", use_video_port=True)
+    pool = FramePool((resolution_target[1], resolution_target[0], 3), count=count, shared=shared)
+    frame_source = PiCameraSource(camera, pool)
     
-    return camera, rawCapture, frame_source
+    return camera, pool, frame_source
 
-def capture_image(frame_source, rawCapture):
-    """Capture une image depuis la caméra"""
+def capture_image(frame_source):
+    """
+    Capture une image depuis la caméra
+    Returns: Frame du pool (à libérer avec frame.release()) ou None
+    """
     if frame_source is None:
         return None
     
-    image = next(frame_source).array
-    rawCapture.truncate(0)
-    return image
+    return frame_source.read()
 
-def detect_line(image, feedback=False):
+def detect_line(image, cfg, feedback=False):
     """
     Détecte la ligne blanche dans l'image et retourne les coordonnées du centroïde
     Returns: (cx, cy) ou (None, None) si aucune ligne détectée
     """
-    if image is None:
-        return None, None
-    
-    h, w = image.shape[:2]
-    
-    # Prétraitement: flou pour réduire le bruit
-    blur = cv2.blur(image, (5, 5))
-    
-    # Seuillage pour isoler les zones blanches
-    ret, thresh1 = cv2.threshold(blur, 168, 255, cv2.THRESH_BINARY)
-    
-    # Conversion en HSV
-    hsv = cv2.cvtColor(thresh1, cv2.COLOR_RGB2HSV)
-    
-    # Définition de la plage de blanc en HSV
-    lower_white = np.array([0, 0, 168])
-    upper_white = np.array([172, 111, 255])
-    
-    # Création du masque
-    mask = cv2.inRange(hsv, lower_white, upper_white)
-    
-    # Suppression du bruit avec morphologie
-    kernel_erode = np.ones((6, 6), np.uint8)
-    eroded_mask = cv2.erode(mask, kernel_erode, iterations=1)
-    kernel_dilate = np.ones((4, 4), np.uint8)
-    dilated_mask = cv2.dilate(eroded_mask, kernel_dilate, iterations=1)
-    
-    # Détection des contours
-    contours, hierarchy = cv2.findContours(dilated_mask, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
-    
-    if feedback:
-        im_debug = cv2.drawContours(image.copy(), contours, -1, (0, 255, 0), 2)
-        cv2.imshow("Contours détectés", im_debug)
-        cv2.waitKey(1)
-    
-    # Tri par aire (garder seulement le plus grand)
-    if len(contours) > 0:
-        contours = sorted(contours, key=cv2.contourArea, reverse=True)[:1]
-        M = cv2.moments(contours[0])
-        
-        if M['m00'] != 0:
-            # Calcul du centroïde
-            cx = int(M['m10'] / M['m00'])
-            cy = int(M['m01'] / M['m00'])
-            
-            if feedback:
-                print(f"Centroïde détecté à: ({cx}, {cy})")
-            
-            return cx, cy
+    import vision
+    cx, cy, _ = vision.detect_line(image, cfg)
     
     if feedback:
-        print("Aucune ligne détectée")
+        if cx is not None:
+            print(f"Centroïde détecté à: ({cx}, {cy})")
+        else:
+            print("Aucune ligne détectée")
     
-    return None, None
+    return cx, cy
 
-def compute_steering_command(cx, cy, image_width):
+def compute_steering_command(cx, cy, cfg):
     """
     Calcule la commande de direction basée sur la position du centroïde
     Returns: (left_speed, right_speed) - vitesses relatives entre -255 et 255
     """
-    if cx is None:
-        # Aucune ligne détectée, arrêt
-        return 0, 0
-    
-    # Centre de l'image
-    center_x = image_width / 2
-    
-    # Erreur de position (négatif = ligne à gauche, positif = ligne à droite)
-    error = cx - center_x
-    
-    # Zone morte pour éviter les oscillations
-    dead_zone = 10
-    
-    if abs(error) < dead_zone:
-        # Ligne centrée, avancer tout droit
-        left_speed = 100
-        right_speed = 100
-        print("✓ Ligne centrée - Avance tout droit")
-    elif error < 0:
-        # Ligne à gauche, tourner à gauche
-        correction = min(abs(error) / center_x, 1.0)  # Normaliser entre 0 et 1
-        left_speed = int(100 * (1 - correction * 0.5))
-        right_speed = 100
-        print(f"← Ligne à gauche (erreur: {error:.1f}) - Tourne à gauche")
-    else:
-        # Ligne à droite, tourner à droite
-        correction = min(error / center_x, 1.0)
-        left_speed = 100
-        right_speed = int(100 * (1 - correction * 0.5))
-        print(f"→ Ligne à droite (erreur: {error:.1f}) - Tourne à droite")
-    
+    left_speed, right_speed = steering.compute_steering_command(cx, cfg)
+    if cx is not None:
+        print(steering.describe(cx, left_speed, right_speed, cfg))
     return left_speed, right_speed
 
 def send_motor_command(arduino, left_speed, right_speed):
@@ -192,28 +129,346 @@ def send_motor_command(arduino, left_speed, right_speed):
 # Fonction de suivi de ligne autonome
 ############################################
 
-def autonomous_line_following(arduino, duration=60, feedback=True):
+@dataclass
+class FollowOptions:
+    """Réglages du suivi de ligne, choisis au menu ou en ligne de commande"""
+    duration: float = 60                    # durée en secondes (0 = infini)
+    feedback: bool = True                   # informations de débogage, images sur http://<ip du robot>:8080/
+    config_path: str = config.CONFIG_PATH   # fichier YAML relu à chaud s'il change
+    record: bool = False                    # enregistrement de la session (session_store.py)
+    controller: str = config.STEERING_CONTROLLER    # loi de pilotage (steering.CONTROLLERS)
+    vision_workers: int = 0                 # processus de détection (0 = dans la boucle)
+    threaded_capture: bool = config.THREADED_CAPTURE
+    async_serial: bool = config.ASYNC_SERIAL
+    speed_control: bool = False             # boucle de vitesse (speed_control.py)
+    route: bool = False                     # branches choisies par le graphe de la piste (track_graph.py)
+    route_target: int = -1                  # arête de destination (-1 = tour de piste)
+    obstacles: bool = False                 # arrêt devant un obstacle (obstacle.py)
+
+
+class Detection:
+    """Résultat de la détection sur une image"""
+
+    __slots__ = ('cx', 'cy', 'line', 'intersection')
+
+    def __init__(self, cx=None, cy=None, line=None, intersection=False):
+        self.cx = cx                        # centroïde de la ligne (None si pas de ligne)
+        self.cy = cy
+        self.line = line                    # geometry.LineGeometry (lois géométriques)
+        self.intersection = intersection
+
+
+class LineDetector:
+    """
+    Détection de la ligne sur les images de la boucle
+
+    controller: loi de pilotage ; les lois géométriques ont besoin de la
+                géométrie de la ligne (geometry.py), 'table' du centroïde
+    workers: VisionWorkers démarré, ou None pour détecter dans la boucle
+    intersections: détecter aussi les intersections (suivi d'une route)
+    """
+
+    def __init__(self, controller, workers=None, intersections=False, feedback=False):
+        import vision
+        from geometry import GeometryEstimator
+
+        self.workers = workers
+        self.intersections = intersections
+        self.feedback = feedback
+        self.estimator = None
+        if controller != 'table':
+            self.estimator = GeometryEstimator(config.CAMERA_RESOLUTION[::-1])
+            self.band_ys = vision.band_rows(config.CAMERA_RESOLUTION[1])
+
+    def detect(self, frame, cfg, searching=False):
+        """
+        frame: Frame du pool (lue sans copie)
+        searching: ligne perdue ; la détection complète attend que
+                   vision.occupancy voie à nouveau assez de blanc
+        """
+        import vision
+
+        image = frame.array
+        if searching and vision.occupancy(image, cfg) < config.RECAPTURE_OCCUPANCY:
+            # ligne toujours perdue : contrôle rapide seulement, sans détection complète
+            return Detection()
+        if self.workers is not None:
+            # l'image part vers un processus de détection ; on pilote
+            # avec le résultat le plus récent déjà disponible
+            self.workers.update_config(cfg)
+            self.workers.submit(frame)
+            result = self.workers.latest
+            if result is None:
+                return Detection()
+            line = (self.estimator.from_points(result.bands, self.band_ys)
+                    if self.estimator is not None else None)
+            return Detection(result.cx, result.cy, line, result.intersection)
+        if self.estimator is not None or self.intersections:
+            mask = vision.line_mask(image, cfg)
+            cx, cy = vision.centroid(mask)
+            line = self.estimator.from_mask(mask) if self.estimator is not None else None
+            return Detection(cx, cy, line, self.intersections and vision.detect_intersection(mask))
+        return Detection(*detect_line(image, cfg, feedback=self.feedback))
+
+
+class Pilot:
+    """
+    Commande des roues : loi de pilotage, puis navigation.Navigator
+    (intersections, ligne perdue, recherche)
+
+    controller: loi de pilotage, recréée quand la configuration change
+    decide: choix de la branche aux intersections (RouteFollower.decide)
+    """
+
+    def __init__(self, controller, cfg, decide=None, feedback=False):
+        from navigation import Navigator
+
+        self.controller = controller
+        self.feedback = feedback
+        self.nav = Navigator(cfg, decide=decide)
+        self._law = self._law_cfg = None
+
+    def steer(self, detection, cfg, speed=None):
+        """
+        Commande de la loi de pilotage seule
+        Returns: ((gauche, droite) ou None sans ligne, côté de la ligne)
+        """
+        from navigation import line_side
+
+        if self.controller == 'table':
+            cx = detection.cx
+            command = compute_steering_command(cx, detection.cy, cfg) if cx is not None else None
+            half_width = config.CAMERA_RESOLUTION[0] / 2
+            return command, line_side(None if cx is None else cx - half_width, cfg.dead_zone)
+        if cfg is not self._law_cfg:
+            self._law, self._law_cfg = steering.make_controller(self.controller, cfg), cfg
+        line = detection.line
+        command = self._law.update(line, speed) if line is not None else None
+        if self.feedback and command is not None:
+            print(f"{line} | L:{command[0]} R:{command[1]}")
+        return command, line_side(None if line is None else line.offset)
+
+    def command(self, detection, cfg, t, speed=None, pose=None, obstacle=None):
+        """
+        speed: vitesse mesurée (m/s) ; pose: (x, y, theta) de l'odométrie
+        obstacle: obstacle.ObstacleState le plus récent
+        Returns: (gauche, droite) à envoyer aux moteurs
+        """
+        command, side = self.steer(detection, cfg, speed)
+        nav = self.nav
+        state, failed = nav.state, nav.failed
+        nav.base_speed = cfg.base_speed
+        left, right = nav.update(t, command, side, detection.intersection, pose, obstacle)
+        if nav.state != state:
+            print(f"[Navigation] {state} -> {nav.state}"
+                  + (f" ({nav.branch})" if nav.state == 'intersection' else ""))
+        elif nav.failed and not failed:
+            print("[Navigation] Ligne non retrouvée - ARRÊT")
+        return left, right
+
+
+class Actuator:
+    """
+    Envoi des commandes aux moteurs et odométrie
+
+    speed_control: SpeedController démarré ; les commandes deviennent des
+                   consignes de vitesse asservies par les encodeurs, la
+                   pose vient de ses lectures d'encodeurs
+    sinon chaque commande 'C' est suivie de la lecture des encodeurs ('N')
+    async_serial: ces échanges se font dans un thread ; la boucle dépose
+                  la dernière commande sans attendre (une commande pas
+                  encore partie est remplacée par la suivante)
+    lock: verrou des échanges série, partagé avec les autres threads
+          (boucle de vitesse, obstacle.ObstacleMonitor)
+    record: garde les mesures à enregistrer dans self.record, {signal de
+            session_store: deque de (t, valeurs...)} : délai de
+            l'acquittement de chaque commande, lectures des encodeurs
+    """
+
+    def __init__(self, arduino, speed_control=None, async_serial=False, lock=None, record=False):
+        from odometry import Odometry
+
+        self.arduino = arduino
+        self.lock = lock or threading.Lock()
+        self.speed_control = speed_control
+        self.odometry = speed_control.odometry if speed_control is not None else Odometry()
+        self.record = {}
+        if record:
+            self.record['encoders'] = deque()
+            if speed_control is None:
+                self.record['ack'] = deque()
+            else:
+                speed_control.record = self.record['encoders']
+        self._pending = None
+        self._wakeup = threading.Condition()
+        self._running = False
+        self._thread = None
+        if async_serial and speed_control is None:
+            self._running = True
+            self._thread = threading.Thread(target=self._write_loop, name="commandes", daemon=True)
+            self._thread.start()
+
+    @property
+    def speed(self):
+        """Vitesse d'avance mesurée (m/s)"""
+        if self.speed_control is not None:
+            return float(self.speed_control.speed.mean())
+        return self.odometry.velocity[0]
+
+    @property
+    def pose(self):
+        """(x, y, theta) de l'odométrie"""
+        return self.odometry.pose
+
+    def send(self, left, right):
+        if self.speed_control is not None:
+            self.speed_control.set_command(left, right)
+        elif self._thread is not None:
+            with self._wakeup:
+                self._pending = (left, right)
+                self._wakeup.notify()
+        else:
+            self._exchange(left, right)
+
+    def _exchange(self, left, right):
+        from odometry import read_encoders
+
+        with self.lock:
+            sent = time.monotonic()
+            send_motor_command(self.arduino, left, right)
+            acked = time.monotonic()
+            sample = read_encoders(self.arduino)
+            if sample is None:
+                self.arduino.reset_input_buffer()      # réponse incomplète
+        if self.record:
+            self.record['ack'].append((acked, acked - sent))
+            if sample is not None:
+                self.record['encoders'].append(sample)
+        if sample is not None:
+            self.odometry.update(*sample)
+
+    def _write_loop(self):
+        while True:
+            with self._wakeup:
+                while self._running and self._pending is None:
+                    self._wakeup.wait()
+                if not self._running:
+                    return
+                command, self._pending = self._pending, None
+            self._exchange(*command)
+
+    def stop(self):
+        """Arrête les moteurs (la boucle de vitesse est arrêtée par qui l'a lancée)"""
+        if self._thread is not None:
+            with self._wakeup:
+                self._running = False
+                self._wakeup.notify()
+            self._thread.join()
+            self._thread = None
+        if self.speed_control is not None:
+            self.speed_control.set_target(0, 0)
+            self.speed_control.record = None
+        else:
+            self._exchange(0, 0)
+
+
+def record_samples(store, recorded):
+    """Ajoute à la session les mesures datées (t, valeurs...) des autres threads"""
+    for name, samples in recorded.items():
+        while samples:
+            t, *values = samples.popleft()
+            store.append(name, store.clock(t), *values)
+
+
+def autonomous_line_following(arduino, options=None, frame_source=None, speed_control=None,
+                              obstacles=None, lock=None):
     """
     Mode de suivi de ligne autonome
-    duration: durée en secondes (0 = infini)
-    feedback: afficher les informations de débogage
+    arduino: liaison en mode binaire (FOLLOW_HANDSHAKE), voir follow()
+    options: FollowOptions (réglages par défaut si None)
+    frame_source: source d'images à la place de la caméra (par ex.
+                  frames.ReplaySource pour bench_loop.py)
+    speed_control: SpeedController démarré (speed_control.py), à arrêter
+                   par l'appelant
+    obstacles: obstacle.ObstacleMonitor démarré ; arrêt tant que la route
+               est bloquée
+    lock: verrou des échanges série partagé par speed_control et obstacles
+    Avec options.route, la branche prise à chaque intersection vient des
+    routes précalculées du graphe de la piste (track_graph.RouteFollower,
+    odomètre branché sur l'odométrie des encodeurs, robot posé au départ)
+    La ligne perdue est recherchée par navigation.Navigator (balayage
+    borné, mesuré par l'odométrie des encodeurs)
     """
+    options = options or FollowOptions()
     print("\n" + "="*50)
     print("DÉMARRAGE DU MODE SUIVI DE LIGNE AUTONOME")
     print("="*50)
     print("Appuyez sur Ctrl+C pour arrêter")
     print()
     
+    from debug_server import DebugServer
+    from session_store import SessionStore
+    from vision_workers import VisionWorkers, IN_FLIGHT
+    from frames import LatestFrameSource
+    
+    feedback = options.feedback
     # Initialisation de la caméra
-    camera, rawCapture, frame_source = init_camera()
+    if frame_source is None:
+        camera, pool, frame_source = init_camera(shared=feedback or options.vision_workers > 0,
+                                                 count=4 + options.vision_workers * IN_FLIGHT
+                                                 + options.threaded_capture)
+        
+        if camera is None:
+            print("Erreur: Impossible d'initialiser la caméra")
+            return
+    else:
+        pool = frame_source.pool
+    if options.threaded_capture:
+        frame_source = LatestFrameSource(frame_source)
     
-    if camera is None:
-        print("Erreur: Impossible d'initialiser la caméra")
-        return
+    # Les overlays sont dessinés dans un autre processus
+    debug = DebugServer(pool).start() if feedback else None
     
     print("✓ Caméra initialisée")
     time.sleep(1)
     
+    store = None
+    if options.record:
+        store = SessionStore.create()
+        for name in ('centroid', 'command'):
+            store.add_signal(name)
+        if config.SESSION_RECORD_FRAMES:
+            store.add_signal('frame')
+        print(f"✓ Enregistrement de la session dans {store.path}")
+    
+    watcher = config.ConfigWatcher(options.config_path)
+    workers = None
+    if options.vision_workers > 0:
+        workers = VisionWorkers(pool, watcher.poll(), options.vision_workers).start()
+        print(f"✓ {options.vision_workers} processus de détection")
+    if options.controller != 'table':
+        print(f"✓ Pilotage : {options.controller}")
+    
+    actuator = Actuator(arduino, speed_control, options.async_serial, lock, record=store is not None)
+    # mesures faites par les autres threads, ajoutées à la session à chaque itération
+    recorded = dict(actuator.record)
+    if store is not None:
+        if obstacles is not None:
+            obstacles.record = recorded['ir'] = deque()
+        for name in recorded:
+            store.add_signal(name)
+    route = None
+    if options.route:
+        from track_graph import start_route
+        target = options.route_target if options.route_target >= 0 else None
+        route = start_route(lambda: actuator.odometry.distance, target)
+        print(f"✓ Route : {'tour de piste' if target is None else f'arête {target}'}")
+    detector = LineDetector(options.controller, workers, intersections=route is not None,
+                            feedback=feedback)
+    # Machine à états : recherche de la ligne au lieu de l'arrêt quand elle est perdue
+    pilot = Pilot(options.controller, watcher.poll(),
+                  decide=route.decide if route is not None else None, feedback=feedback)
+    duration = options.duration
     start_time = time.time()
     frame_count = 0
     
@@ -225,23 +480,43 @@ def autonomous_line_following(arduino, duration=60, feedback=True):
                 break
             
             # Capture d'image
-            image = capture_image(frame_source, rawCapture)
+            frame = capture_image(frame_source)
             
-            if image is None:
+            if frame is None:
                 print("Erreur de capture d'image")
                 time.sleep(0.1)
                 continue
             
             frame_count += 1
             
-            # Détection de la ligne
-            cx, cy = detect_line(image, feedback=feedback)
+            # Configuration de cette image (rechargée si le fichier a changé)
+            cfg = watcher.poll()
             
-            # Calcul de la commande de direction
-            left_speed, right_speed = compute_steering_command(cx, cy, image.shape[1])
+            with frame:
+                # Détection de la ligne (vue en lecture seule, sans copie)
+                detection = detector.detect(frame, cfg, pilot.nav.searching)
+                
+                # Commande : loi de pilotage et navigation
+                left_speed, right_speed = pilot.command(
+                    detection, cfg, time.monotonic(), actuator.speed, actuator.pose,
+                    obstacles.state if obstacles is not None else None)
+                
+                if debug is not None:
+                    debug.publish(frame, cx=detection.cx, cy=detection.cy, dead_zone=cfg.dead_zone,
+                                  text=f"L:{left_speed} R:{right_speed}")
+                
+                if store is not None:
+                    t = store.clock()
+                    if 'frame' in store:
+                        store.append('frame', t, frame.number, frame.array)
+                    store.append('centroid', t, float('nan') if detection.cx is None else detection.cx,
+                                 float('nan') if detection.cy is None else detection.cy)
+                    store.append('command', t, left_speed, right_speed)
             
-            # Envoi de la commande aux moteurs
-            send_motor_command(arduino, left_speed, right_speed)
+            # Envoi de la commande aux moteurs (ou consigne de la boucle de vitesse)
+            actuator.send(left_speed, right_speed)
+            if store is not None:
+                record_samples(store, recorded)
             
             # Affichage des statistiques
             if frame_count % 10 == 0:
@@ -255,15 +530,26 @@ def autonomous_line_following(arduino, duration=60, feedback=True):
     finally:
         # Arrêt des moteurs
         print("Arrêt des moteurs...")
-        send_motor_command(arduino, 0, 0)
+        actuator.stop()
         
-        # Fermeture de la caméra
-        if camera is not None:
-            camera.close()
+        # Fermeture du serveur de debug et de la caméra
+        if debug is not None:
+            debug.close()
+        if workers is not None:
+            workers.close()
+        if store is not None:
+            if obstacles is not None:
+                obstacles.record = None
+            record_samples(store, recorded)
+            store.close()
+            print(f"✓ Session enregistrée dans {store.path}")
+        frame_source.close()
+        pool.close()
         
         print("✓ Caméra fermée")
         print("="*50)
 
+
 ############################################
 # Fonction de dialogue direct avec l'arduino
 #############################################
@@ -297,33 +583,110 @@ def AttAcquit():
 # Programme principal
 ############################################
 
+arduino = None      # liaison avec la carte, ouverte par main()
 
+# Dialogue direct : mode 0, acquittement complet en ascii
+CONNECT_HANDSHAKE = connect_command(2, 0)
+# Suivi de ligne : acquittement simple, commandes et réponses binaires
+# (commande 'C' de send_motor_command, encodeurs de la boucle de vitesse)
+FOLLOW_HANDSHAKE = connect_command(1, 2)
 
 
+def connect_arduino(port=config.ARDUINO_PORT):
+    """
+    Connexion à la carte (CONNECT_HANDSHAKE)
+    Returns: la liaison série, ou None si la carte n'a pas répondu OK
+    """
+    link, rep = connect(port, CONNECT_HANDSHAKE, baudrate=config.ARDUINO_BAUDRATE,
+                        timeout=config.ARDUINO_TIMEOUT, startup=config.ARDUINO_STARTUP_TIMEOUT)
+    if not rep:
+        print("La carte ne répond pas")
+        link.close()
+        return None
+    print(rep.decode())
+    return link
 
 
+def disconnect_arduino(link):
+    link.write(b'a')	# deconnection de la carte
+    link.close()        # fermeture de la liaison série
 
 
-############################################################
-# initialisation de la liaison série connection à l'arduino
+def follow(arduino, options, **kwargs):
+    """
+    Suivi de ligne lancé par le menu ou main() : la liaison passe en mode
+    binaire (FOLLOW_HANDSHAKE) le temps du suivi, la boucle de vitesse et
+    la surveillance des obstacles sont démarrées si elles sont demandées ;
+    leurs échanges avec la carte et ceux de la boucle partagent un verrou
+    kwargs: passés à autonomous_line_following (frame_source)
+    """
+    if not set_mode(arduino, FOLLOW_HANDSHAKE):
+        print("La carte ne répond pas au passage en mode binaire")
+        return
+    lock = threading.Lock()
+    speed_control = obstacles = None
+    try:
+        if options.speed_control:
+            from speed_control import SpeedController, table_for
+            table = table_for(arduino)
+            if table is None:
+                print(f"Pas de table PWM -> vitesse ({config.SPEED_TABLE_PATH}) : "
+                      "lancer python3 speed_control.py --calibrate")
+                return
+            speed_control = SpeedController(arduino, table, lock=lock).start()
+            print("✓ Boucle de vitesse")
+        if options.obstacles:
+            from obstacle import ObstacleMonitor
+            obstacles = ObstacleMonitor(arduino, lock).start()
+            print("✓ Surveillance des obstacles")
+        autonomous_line_following(arduino, options, speed_control=speed_control,
+                                  obstacles=obstacles, lock=lock, **kwargs)
+    finally:
+        if obstacles is not None:
+            obstacles.stop()
+        if speed_control is not None:
+            speed_control.stop()
+        set_mode(arduino, CONNECT_HANDSHAKE)
 
-arduino = serial.Serial(port='/dev/ttyACM0', baudrate=115200, timeout=0.1)
-print ("Connection à l'arduino")
-time.sleep(2)			# on attend 2s pour que la carte soit initialisée
 
-arduino.write(b'A20')		# demande de connection avec acquitement complet en ascii
-rep = arduino.readline()
-if len(rep.split())>0:
-  if rep.split()[0]==b'OK':
-    print(rep.decode())
-    
-    # Menu principal
+def edit_options(options):
+    """Modification des réglages du suivi au clavier"""
+    names = [f.name for f in fields(options)]
+    while True:
+        print("\nRéglages du suivi de ligne")
+        for i, name in enumerate(names, 1):
+            print(f"{i}. {name} = {getattr(options, name)}")
+        choix = input("Réglage à modifier (Entrée pour revenir): ").strip()
+        if not choix:
+            return
+        try:
+            name = names[int(choix) - 1]
+        except (ValueError, IndexError):
+            print("Choix invalide!")
+            continue
+        value = getattr(options, name)
+        if isinstance(value, bool):
+            setattr(options, name, not value)       # bascule
+            continue
+        texte = input(f"{name} ({value}): ").strip()
+        if name == 'controller' and texte not in steering.CONTROLLERS:
+            print(f"Lois disponibles : {', '.join(sorted(steering.CONTROLLERS))}")
+            continue
+        try:
+            setattr(options, name, type(value)(texte))
+        except ValueError:
+            print("Valeur invalide!")
+
+
+def menu(options):
     while True:
         print("\n" + "="*50)
         print("MENU PRINCIPAL")
         print("="*50)
         print("1. Dialogue direct avec Arduino")
         print("2. Mode suivi de ligne autonome")
+        print("3. Suivi de ligne avec enregistrement de la session")
+        print("4. Réglages du suivi de ligne")
         print("Q. Quitter")
         print("="*50)
         
@@ -331,23 +694,76 @@ if len(rep.split())>0:
         
         if choix == "1":
             DialArduino()
-        elif choix == "2":
-            duree = input("Durée du suivi (en secondes, 0 pour infini): ").strip()
+        elif choix in ("2", "3"):
+            duree = input(f"Durée du suivi (en secondes, 0 pour infini) [{options.duration:g}]: ").strip()
             try:
-                duree = int(duree)
-            except:
-                duree = 60
-            autonomous_line_following(arduino, duration=duree, feedback=True)
+                options.duration = float(duree)
+            except ValueError:
+                pass
+            follow(arduino, replace(options, record=options.record or choix == "3"))
+        elif choix == "4":
+            edit_options(options)
         elif choix == "Q":
             break
         else:
             print("Choix invalide!")
 
-    
-#######################################
-#   deconnection de l'arduino
 
-arduino.write(b'a')	# deconnection de la carte
-arduino.close()         # fermeture de la liaison série
-print ("Fin de programme")
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Dialogue avec la carte et suivi de ligne")
+    # port de la carte (par ex. 'emul://' pour l'émulateur), sinon celui de config.py
+    parser.add_argument('port', nargs='?', default=config.ARDUINO_PORT,
+                        help="port série de l'Arduino ('emul://', 'daemon://')")
+    parser.add_argument('--follow', action='store_true',
+                        help="lance directement le suivi de ligne, sans le menu")
+    parser.add_argument('--duration', type=float, default=FollowOptions.duration,
+                        help="durée du suivi (s, 0 = infini)")
+    parser.add_argument('--quiet', action='store_true', help="sans informations de débogage")
+    parser.add_argument('--config', default=config.CONFIG_PATH, help="fichier YAML de configuration")
+    parser.add_argument('--record', action='store_true', help="enregistre la session")
+    parser.add_argument('--controller', default=config.STEERING_CONTROLLER,
+                        choices=sorted(steering.CONTROLLERS), help="loi de pilotage")
+    parser.add_argument('--workers', type=int, default=0, help="processus de détection")
+    parser.add_argument('--threaded-capture', action=argparse.BooleanOptionalAction,
+                        default=config.THREADED_CAPTURE, help="capture dans un thread")
+    parser.add_argument('--async-serial', action=argparse.BooleanOptionalAction,
+                        default=config.ASYNC_SERIAL, help="commandes sans attendre l'acquittement")
+    parser.add_argument('--speed-control', action='store_true',
+                        help="boucle de vitesse des roues (table de speed_control.py)")
+    parser.add_argument('--route', nargs='?', type=int, const=-1, metavar='ARÊTE',
+                        help="branches choisies par le graphe de la piste, vers une arête "
+                             "(tour de piste sans arête)")
+    parser.add_argument('--obstacles', action='store_true',
+                        help="arrêt devant un obstacle (ultrason balayé et infrarouge)")
+    args = parser.parse_args(argv)
+    options = FollowOptions(duration=args.duration, feedback=not args.quiet,
+                            config_path=args.config, record=args.record,
+                            controller=args.controller, vision_workers=args.workers,
+                            threaded_capture=args.threaded_capture,
+                            async_serial=args.async_serial, speed_control=args.speed_control,
+                            route=args.route is not None,
+                            route_target=-1 if args.route is None else args.route,
+                            obstacles=args.obstacles)
+    return args, options
+
+
+def main(argv=None):
+    global arduino
+    args, options = parse_args(argv)
+    print ("Connection à l'arduino")
+    arduino = connect_arduino(args.port)
+    if arduino is None:
+        return
+    try:
+        if args.follow:
+            follow(arduino, options)
+        else:
+            menu(options)
+    finally:
+        disconnect_arduino(arduino)
+        arduino = None
+    print ("Fin de programme")
+
 
+if __name__ == "__main__":
+    main()
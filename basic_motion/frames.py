@@ -0,0 +1,374 @@
+"""
+Transmission des images sans copie entre la capture et les consommateurs
+
+Les images sont stockées dans un pool fixe de buffers numpy alloués une
+seule fois. La capture écrit directement dans un buffer libre, puis la
+détection, l'enregistrement et l'affichage de debug reçoivent des vues
+en lecture seule sur ce même buffer. Chaque consommateur qui garde une
+image au-delà de l'itération courante appelle retain(), et release()
+quand il a fini : le buffer retourne dans le pool quand plus personne ne
+le référence.
+
+Une copie n'est faite que si un consommateur veut modifier l'image
+(Frame.writable()).
+
+Avec shared=True les buffers sont placés en mémoire partagée : un autre
+processus peut lire une image à partir de son seul indice (voir
+FramePool.attach et debug_server.py).
+"""
+
+import threading
+import time
+
+import numpy as np
+
+# Attente maximale d'un buffer libre par la capture (s) : au-delà l'image
+# est perdue (comptée dans dropped) plutôt que de bloquer la caméra
+ACQUIRE_TIMEOUT = 0.1
+
+
+class Frame:
+    """Référence comptée sur un buffer du pool"""
+
+    __slots__ = ('pool', 'index', 'number', 'timestamp', '_refs', '_view')
+
+    def __init__(self, pool, index, view):
+        self.pool = pool
+        self.index = index
+        self.number = 0
+        self.timestamp = 0.0
+        self._refs = 0
+        self._view = view
+
+    @property
+    def array(self):
+        """Vue numpy en lecture seule sur le buffer (aucune copie)"""
+        return self._view
+
+    @property
+    def shape(self):
+        return self._view.shape
+
+    def writable(self):
+        """Copie modifiable de l'image (pour dessiner dessus par exemple)"""
+        return self._view.copy()
+
+    def retain(self):
+        """Ajoute une référence : le buffer ne sera pas réutilisé avant release()"""
+        self.pool._retain(self)
+        return self
+
+    def release(self):
+        """Retire une référence ; le buffer est rendu au pool à 0"""
+        self.pool._release(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+        return False
+
+
+class FramePool:
+    """
+    Pool fixe de buffers images avec comptage de références
+
+    shape: forme d'une image, par ex. (128, 160, 3)
+    count: nombre de buffers (capture + consommateurs en parallèle)
+    shared: place les buffers en mémoire partagée (multiprocessing)
+    """
+
+    def __init__(self, shape, count=4, dtype=np.uint8, shared=False):
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.count = count
+        self.shm = None
+        if shared:
+            from multiprocessing import shared_memory
+            nbytes = count * int(np.prod(self.shape)) * self.dtype.itemsize
+            self.shm = shared_memory.SharedMemory(create=True, size=nbytes)
+            self._storage = np.ndarray((count,) + self.shape, dtype=self.dtype,
+                                       buffer=self.shm.buf)
+            self._storage[:] = 0
+        else:
+            self._storage = np.zeros((count,) + self.shape, dtype=self.dtype)
+        self._frames = []
+        for i in range(count):
+            view = self._storage[i].view()
+            view.flags.writeable = False
+            self._frames.append(Frame(self, i, view))
+        self._free = list(range(count - 1, -1, -1))
+        self._cond = threading.Condition()
+        self._counter = 0
+
+    @property
+    def shared_spec(self):
+        """Description transmissible à un autre processus (voir attach)"""
+        if self.shm is None:
+            raise ValueError("Pool non partagé (shared=False)")
+        return (self.shm.name, self.shape, self.dtype.str, self.count)
+
+    @staticmethod
+    def attach(spec):
+        """
+        Ouvre depuis un autre processus les buffers d'un pool partagé
+        Returns: (shm, storage) ; storage[i] est l'image d'indice i
+        """
+        from multiprocessing import shared_memory
+        name, shape, dtype, count = spec
+        shm = shared_memory.SharedMemory(name=name)
+        storage = np.ndarray((count,) + tuple(shape), dtype=np.dtype(dtype),
+                             buffer=shm.buf)
+        return shm, storage
+
+    def close(self):
+        """Libère la mémoire partagée (sans effet pour un pool local)"""
+        if self.shm is not None:
+            self._storage = None
+            self._frames = []
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+    @property
+    def available(self):
+        """Nombre de buffers libres"""
+        return len(self._free)
+
+    def buffer(self, frame):
+        """Buffer modifiable d'une image, réservé au producteur (capture)"""
+        return self._storage[frame.index]
+
+    def acquire(self, timeout=None):
+        """
+        Réserve un buffer libre pour une nouvelle image
+        Returns: Frame (1 référence) ou None si aucun buffer libre à temps
+        """
+        with self._cond:
+            if not self._free:
+                if timeout == 0:
+                    return None
+                if not self._cond.wait_for(lambda: self._free, timeout):
+                    return None
+            frame = self._frames[self._free.pop()]
+            frame._refs = 1
+            self._counter += 1
+            frame.number = self._counter
+            frame.timestamp = time.monotonic()
+            return frame
+
+    def _retain(self, frame):
+        with self._cond:
+            if frame._refs <= 0:
+                raise RuntimeError("Image %d déjà rendue au pool" % frame.index)
+            frame._refs += 1
+
+    def _release(self, frame):
+        with self._cond:
+            if frame._refs <= 0:
+                raise RuntimeError("Image %d déjà rendue au pool" % frame.index)
+            frame._refs -= 1
+            if frame._refs == 0:
+                self._free.append(frame.index)
+                self._cond.notify()
+
+
+############################################
+# Sources d'images écrivant dans le pool
+############################################
+
+class _PoolOutput:
+    """
+    Sortie picamera écrivant les octets bruts directement dans le pool
+    (remplace PiRGBArray, qui recopie le flux puis reconstruit .array)
+    """
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.frame = None
+        self.ready = None
+        self.dropped = 0            # images perdues faute de buffer libre
+        self._skip = False          # reste de l'image en cours ignoré
+        self._flat = None
+        self._offset = 0
+
+    def write(self, data):
+        if self._skip:
+            return len(data)
+        if self.frame is None:
+            self.frame = self.pool.acquire(timeout=ACQUIRE_TIMEOUT)
+            if self.frame is None:
+                # tous les buffers sont tenus par les consommateurs
+                self.dropped += 1
+                self._skip = True
+                return len(data)
+            self._flat = self.pool.buffer(self.frame).reshape(-1)
+            self._offset = 0
+        n = min(len(data), self._flat.size - self._offset)
+        self._flat[self._offset:self._offset + n] = np.frombuffer(data, np.uint8, n)
+        self._offset += n
+        return len(data)
+
+    def flush(self):
+        self._skip = False
+        if self.frame is not None:
+            self.frame.timestamp = time.monotonic()
+            self.ready, self.frame = self.frame, None
+
+
+class PiCameraSource:
+    """Capture PiCamera continue dans un FramePool"""
+
+    def __init__(self, camera, pool):
+        self.camera = camera
+        self.pool = pool
+        self._output = _PoolOutput(pool)
+        self._stream = camera.capture_continuous(self._output, format="bgr",
+                                                 use_video_port=True)
+
+    def read(self):
+        """Returns: Frame (à libérer par l'appelant) ou None (image perdue, pool plein)"""
+        next(self._stream)
+        frame, self._output.ready = self._output.ready, None
+        return frame
+
+    @property
+    def dropped(self):
+        return self._output.dropped
+
+    def close(self):
+        self._stream.close()
+        self.camera.close()
+
+
+class WebcamSource:
+    """Capture cv2.VideoCapture dans un FramePool, redimensionnée si besoin"""
+
+    def __init__(self, capture, pool):
+        self.capture = capture
+        self.pool = pool
+        self.size = (pool.shape[1], pool.shape[0])
+        self.dropped = 0            # images perdues faute de buffer libre
+
+    def read(self):
+        """Returns: Frame (à libérer par l'appelant) ou None"""
+        frame = self.pool.acquire(timeout=ACQUIRE_TIMEOUT)
+        if frame is None:
+            # tous les buffers sont tenus par les consommateurs : l'image est sautée
+            self.capture.grab()
+            self.dropped += 1
+            return None
+        buf = self.pool.buffer(frame)
+        ret, image = self.capture.read(buf)
+        if not ret:
+            frame.release()
+            return None
+        # VideoCapture réalloue si la webcam ne respecte pas la résolution
+        if image is not buf:
+            import cv2
+            cv2.resize(image, self.size, dst=buf)
+        frame.timestamp = time.monotonic()
+        return frame
+
+    def close(self):
+        self.capture.release()
+
+
+class ReplaySource:
+    """
+    Images enregistrées rejouées au rythme de la caméra (banc de mesure, sans caméra)
+
+    Comme capture_continuous, read() attend la fin de l'image suivante :
+    l'image k est prête à la date t0 + k / framerate, qui devient son
+    timestamp. Les images sont rejouées en boucle.
+    images: tableau (n, hauteur, largeur, 3) ou liste d'images
+    """
+
+    def __init__(self, images, pool, framerate=30.0):
+        self.images = images
+        self.pool = pool
+        self.period = 1.0 / framerate
+        self.t0 = time.monotonic()
+        self.count = 0
+
+    def read(self):
+        """Returns: Frame (à libérer par l'appelant) ou None"""
+        k = int((time.monotonic() - self.t0) / self.period) + 1
+        ready = self.t0 + k * self.period
+        time.sleep(max(0.0, ready - time.monotonic()))
+        frame = self.pool.acquire(timeout=1.0)
+        if frame is None:
+            return None
+        self.pool.buffer(frame)[:] = self.images[k % len(self.images)]
+        frame.timestamp = ready
+        self.count += 1
+        return frame
+
+    def close(self):
+        pass
+
+
+class LatestFrameSource:
+    """
+    Capture continue dans un thread : read() rend l'image la plus récente
+
+    La boucle de contrôle n'attend plus la fin de l'image suivante ; une
+    image qu'elle n'a pas eu le temps de prendre est rendue au pool (il
+    faut un buffer de plus que pour la capture directe).
+    """
+
+    def __init__(self, source):
+        self.source = source
+        self.pool = source.pool
+        self.dropped = 0
+        self._latest = None
+        self._cond = threading.Condition()
+        self._running = True
+        self._thread = threading.Thread(target=self._capture, name="capture", daemon=True)
+        self._thread.start()
+
+    def _capture(self):
+        while self._running:
+            try:
+                frame = self.source.read()
+            except Exception:
+                if self._running:
+                    raise
+                break               # source fermée par close()
+            if frame is None:
+                continue
+            with self._cond:
+                if self._latest is not None:
+                    self._latest.release()
+                    self.dropped += 1
+                self._latest = frame
+                self._cond.notify()
+
+    def read(self, timeout=1.0):
+        """
+        Dernière image pas encore lue (attend la suivante si elle a déjà été prise)
+        Returns: Frame (à libérer par l'appelant) ou None
+        """
+        with self._cond:
+            if self._latest is None:
+                self._cond.wait(timeout)
+            frame, self._latest = self._latest, None
+        return frame
+
+    def close(self):
+        self._running = False
+        self._thread.join(timeout=1.0)
+        stuck = self._thread.is_alive()
+        if stuck:
+            # capture bloquée dans source.read() : fermer la source la débloque
+            self.source.close()
+            self._thread.join(timeout=1.0)
+        if self._thread.is_alive():
+            return                  # le thread peut encore écrire : on ne touche pas au pool
+        with self._cond:
+            if self._latest is not None:
+                self._latest.release()
+                self._latest = None
+        if not stuck:
+            self.source.close()
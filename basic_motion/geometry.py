@@ -0,0 +1,281 @@
+"""
+Géométrie de la ligne : décalage, cap et courbure à partir du masque
+
+steering.compute_steering_command ne regarde que l'abscisse du centroïde :
+dans les virages du huit le robot réagit quand la ligne est déjà partie
+sur le côté. Ici on ajuste un polynôme x(d) sur la ligne vue par la
+caméra, d étant la distance (en lignes d'image) devant le bas de l'image
+et x l'abscisse par rapport au centre de l'image :
+
+    x(d) = c0 + c1 d + c2 d²
+
+- décalage latéral : c0 (pixels, > 0 ligne à droite)
+- cap : atan(c1) (radians, > 0 la ligne part vers la droite)
+- courbure : 2 c2 / (1 + c1²)^1.5 (1/pixel, > 0 virage à droite)
+
+et x(d) donne les points d'anticipation (look-ahead) du contrôleur.
+
+Coût borné et sans dépendance à l'image :
+- une ligne du masque sur GEOMETRY_ROW_STEP est lue ; pour chacune on
+  compte les pixels blancs et on fait la moyenne de leurs abscisses
+  (vectorisé sur toutes les lignes). Les moindres carrés pondérés par le
+  nombre de pixels sur ces moyennes donnent exactement les moindres
+  carrés sur tous les pixels blancs des lignes lues
+- la matrice de Vandermonde des lignes lues est calculée une fois
+- 'ransac' : hypothèses tirées par lots de RANSAC_BATCH (résolues
+  ensemble), arrêt dès que RANSAC_STOP_RATIO des lignes lues sont bien
+  expliquées, au plus RANSAC_ITERATIONS ; puis moindres carrés sur les
+  points conservés. Les lignes comptent chacune pour un dans le score :
+  la barre d'une intersection (beaucoup de pixels sur peu de lignes)
+  n'emporte pas l'ajustement. Les tirages sont précalculés (résultats
+  reproductibles, pas de générateur aléatoire par image)
+
+Mesure du temps par image et vérification sur des masques connus :
+    python3 geometry.py --bench
+"""
+
+import math
+import time
+
+import numpy as np
+
+import config
+
+RANSAC_BATCH = 8            # hypothèses résolues ensemble
+
+
+class LineGeometry:
+    """Ligne ajustée dans une image (unités : pixels de l'image)"""
+
+    __slots__ = ('coeffs', 'offset', 'heading', 'curvature', 'rows', 'support', 'depth')
+
+    def __init__(self, coeffs, rows, support, depth):
+        self.coeffs = coeffs                # c0, c1, c2 (0 pour un degré inférieur)
+        c1, c2 = coeffs[1], coeffs[2]
+        self.offset = float(coeffs[0])
+        self.heading = math.atan(c1)
+        self.curvature = 2 * c2 / (1 + c1 * c1) ** 1.5
+        self.rows = rows                    # lignes de l'image utilisées
+        self.support = support              # part des lignes lues expliquées par l'ajustement
+        self.depth = depth                  # distance la plus lointaine où la ligne est vue
+
+    def x_at(self, d):
+        """Abscisse (par rapport au centre) de la ligne à la distance d devant le bas de l'image"""
+        c0, c1, c2 = self.coeffs
+        return c0 + d * (c1 + d * c2)
+
+    def lookahead(self, d):
+        """Point d'anticipation (x, d), d limité à la partie de la ligne vue"""
+        d = min(d, self.depth)
+        return self.x_at(d), d
+
+    def __repr__(self):
+        return (f"LineGeometry(décalage={self.offset:.1f}px, cap={math.degrees(self.heading):.1f}°, "
+                f"courbure={self.curvature:.4f}/px, {self.rows} lignes)")
+
+
+class GeometryEstimator:
+    """
+    Ajustement de la ligne sur les masques d'une taille donnée
+
+    shape: (hauteur, largeur) du masque
+    Tout ce qui ne dépend que de la taille (lignes lues, abscisses,
+    Vandermonde, tirages RANSAC) est calculé ici une seule fois.
+    """
+
+    def __init__(self, shape, degree=config.GEOMETRY_DEGREE, row_step=config.GEOMETRY_ROW_STEP,
+                 method=config.GEOMETRY_METHOD, iterations=config.RANSAC_ITERATIONS,
+                 tolerance=config.RANSAC_TOLERANCE, stop_ratio=config.RANSAC_STOP_RATIO):
+        if method not in ('lsq', 'ransac'):
+            raise ValueError(f"Méthode inconnue : {method}")
+        h, w = shape
+        self.shape = (h, w)
+        self.degree = degree
+        self.method = method
+        self.tolerance = tolerance
+        self.stop_ratio = stop_ratio
+        self.rows = np.arange(h - 1 - row_step // 2, -1, -row_step)[::-1]
+        self.depths = (h - 1 - self.rows).astype(np.float64)
+        self.columns = np.arange(w, dtype=np.float64) - w / 2
+        self.vander = self.depths[:, None] ** np.arange(degree + 1)
+        # tirages RANSAC : une position dans chaque tranche des lignes valides
+        # (points distincts et étalés en profondeur : systèmes bien conditionnés)
+        batches = max(1, -(-iterations // RANSAC_BATCH))
+        self._draws = np.random.default_rng(0).random((batches, RANSAC_BATCH, degree + 1))
+
+    def row_points(self, mask):
+        """
+        Moyenne des abscisses des pixels blancs des lignes lues
+        Returns: (xs, counts) ; xs NaN pour une ligne sans pixel blanc
+        """
+        white = mask[self.rows] != 0
+        counts = np.count_nonzero(white, axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            xs = (white @ self.columns) / counts
+        return xs, counts
+
+    def from_mask(self, mask):
+        """Returns: LineGeometry, ou None si la ligne n'est pas vue sur assez de lignes"""
+        xs, counts = self.row_points(mask)
+        valid = counts > 0
+        return self._fit(xs[valid], counts[valid].astype(np.float64), self.vander[valid],
+                         self.depths[valid])
+
+    def from_points(self, xs, ys):
+        """
+        Ajustement sur des points de la ligne déjà extraits, par exemple
+        vision.band_points ou VisionResult.bands (abscisses en pixels de
+        l'image, NaN pour une bande sans ligne ; ys lignes de l'image)
+        """
+        xs = np.asarray(xs, np.float64)
+        valid = ~np.isnan(xs)
+        depths = self.shape[0] - 1 - np.asarray(ys, np.float64)[valid]
+        vander = depths[:, None] ** np.arange(self.degree + 1)
+        return self._fit(xs[valid] - self.shape[1] / 2, np.ones(valid.sum()), vander, depths)
+
+    def _fit(self, xs, weights, vander, depths):
+        n = len(xs)
+        degree = min(self.degree, n - 2)            # au moins un point de plus que d'inconnues
+        if degree < 1:
+            return None
+        vander = vander[:, :degree + 1]
+        if self.method == 'ransac' and n > degree + 2:
+            keep = self._ransac(xs, vander)
+            xs, weights, vander, depths = xs[keep], weights[keep], vander[keep], depths[keep]
+        coeffs = _weighted_lstsq(vander, xs, weights)
+        support = np.count_nonzero(np.abs(vander @ coeffs - xs) < self.tolerance) / n
+        coeffs = np.concatenate([coeffs, np.zeros(3 - len(coeffs))])
+        return LineGeometry(coeffs, n, support, float(depths.max()))
+
+    def _ransac(self, xs, vander):
+        """Points conservés par la meilleure hypothèse"""
+        n, k = vander.shape
+        best, best_score = None, -1
+        strata = np.arange(k)
+        for draws in self._draws:
+            picks = ((strata + draws[:, :k]) * (n / k)).astype(np.intp)     # (lot, k) distincts
+            try:
+                hyps = np.linalg.solve(vander[picks], xs[picks][:, :, None])[:, :, 0]   # (lot, k)
+            except np.linalg.LinAlgError:
+                continue
+            inliers = np.abs(vander @ hyps.T - xs[:, None]) < self.tolerance     # (n, lot)
+            scores = np.count_nonzero(inliers, axis=0)
+            i = int(np.argmax(scores))
+            if scores[i] > best_score:
+                best, best_score = inliers[:, i], scores[i]
+            if best_score >= self.stop_ratio * n:
+                break                                               # arrêt anticipé
+        if best is None or best_score < k + 1:
+            return np.ones(n, bool)
+        return best
+
+
+class CameraModel:
+    """
+    Passage image -> sol pour le montage nominal de la caméra (config.py)
+
+    Repère robot : X devant l'axe des roues, Y à gauche (mètres), comme
+    simulation.camera_ground_points. Calcul sur quelques points seulement
+    (ceux des contrôleurs), jamais sur toute l'image.
+    """
+
+    def __init__(self, resolution=config.CAMERA_RESOLUTION, height=config.CAMERA_HEIGHT,
+                 tilt=config.CAMERA_TILT, offset=config.CAMERA_OFFSET,
+                 hfov=config.CAMERA_HFOV, vfov=config.CAMERA_VFOV):
+        w, h = resolution
+        self.resolution = (w, h)
+        self.height = height
+        self.offset = offset
+        self.fx = (w / 2) / math.tan(math.radians(hfov) / 2)
+        self.fy = (h / 2) / math.tan(math.radians(vfov) / 2)
+        self.sin = math.sin(math.radians(tilt))
+        self.cos = math.cos(math.radians(tilt))
+
+    def to_ground(self, col, row):
+        """Point au sol (X, Y) vu au pixel (col, row), None au-dessus de l'horizon"""
+        w, h = self.resolution
+        a = (row + 0.5 - h / 2) / self.fy
+        down = self.sin + a * self.cos
+        if down <= 1e-3:
+            return None
+        t = self.height / down
+        return self.offset + t * (self.cos - a * self.sin), -t * (col + 0.5 - w / 2) / self.fx
+
+    def depth_for(self, distance):
+        """Distance d (lignes d'image depuis le bas, geometry.py) où l'on voit le sol à `distance` m devant"""
+        w, h = self.resolution
+        r = (distance - self.offset) / self.height
+        a = (self.cos - r * self.sin) / (self.sin + r * self.cos)
+        return h - 1 - (a * self.fy + h / 2 - 0.5)
+
+    def line_point(self, geometry, d):
+        """Point au sol de la ligne ajustée à la distance d (lignes d'image)"""
+        w, h = self.resolution
+        return self.to_ground(geometry.x_at(d) + w / 2, h - 1 - d)
+
+
+def _weighted_lstsq(vander, xs, weights):
+    # équations normales (k x k, k <= 3) : bien moins cher que lstsq pour si peu d'inconnues
+    vw = vander * weights[:, None]
+    return np.linalg.solve(vw.T @ vander, vw.T @ xs)
+
+
+############################################
+# Mesures
+############################################
+
+def synthetic_mask(shape, coeffs, width=10):
+    """Masque d'une ligne x(d) = c0 + c1 d + c2 d² (coordonnées de geometry.py)"""
+    h, w = shape
+    d = (h - 1 - np.arange(h))[:, None]
+    x = coeffs[0] + d * (coeffs[1] + d * coeffs[2]) + w / 2
+    cols = np.arange(w)[None, :]
+    return np.where(np.abs(cols - x) <= width / 2, 255, 0).astype(np.uint8)
+
+
+def benchmark(frames=300):
+    """
+    Temps par image de chaque méthode sur des vues simulées, et erreur sur
+    des masques synthétiques de géométrie connue
+    Returns: {méthode: (µs par image, erreur de cap max en degrés, erreur de courbure max)}
+    """
+    import vision
+    from simulation import Simulator
+
+    sim = Simulator()
+    cfg = sim.cfg
+    masks = []
+    for _ in range(64):
+        image = sim.render()
+        masks.append(vision.line_mask(image, cfg))
+        sim.step(*sim.controller(image))
+    shape = masks[0].shape
+    known = [(0, 0, 0), (-20, 0.3, 0), (15, -0.2, 0.002), (5, 0.1, -0.003)]
+
+    results = {}
+    for method in ('lsq', 'ransac'):
+        estimator = GeometryEstimator(shape, method=method)
+        start = time.perf_counter()
+        for i in range(frames):
+            estimator.from_mask(masks[i % len(masks)])
+        elapsed = (time.perf_counter() - start) / frames * 1e6
+        heading_error = curvature_error = 0.0
+        for c in known:
+            geo = estimator.from_mask(synthetic_mask(shape, c))
+            c1, c2 = c[1], c[2]
+            heading_error = max(heading_error, abs(math.degrees(geo.heading - math.atan(c1))))
+            curvature_error = max(curvature_error,
+                                  abs(geo.curvature - 2 * c2 / (1 + c1 * c1) ** 1.5))
+        results[method] = (elapsed, heading_error, curvature_error)
+    return results
+
+
+if __name__ == "__main__":
+    import sys
+
+    if '--bench' in sys.argv:
+        for method, (us, heading, curvature) in benchmark().items():
+            print(f"  {method:7s} : {us:6.1f} µs/image   erreur de cap {heading:.2f}°   "
+                  f"erreur de courbure {curvature:.5f}/px")
+    else:
+        print(__doc__)
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Calibration du capteur infrarouge Sharp GP2Y0A21 (distance en cm)
+
+La carte ne renvoie que la valeur brute de l'ADC (analogRead(IR_pin),
+question 'R'). Cet outil :
+1. enregistre des mesures (valeur ADC, distance réelle) en plaçant un
+   obstacle à des distances connues : mode --collect
+2. ajuste la courbe non linéaire du capteur, d = 1 / (m*V + q) - k
+   (V la tension, forme de la documentation : la distance est inversement
+   proportionnelle à la tension)
+3. précalcule une table de 1024 entrées, une par valeur de l'ADC :
+   la conversion devient un simple index, vectorisé sur des tableaux
+   numpy côté Raspberry (lut[adc])
+4. exporte la table en en-tête C (serial_link/ir_lut.h) : recompilé avec
+   cet en-tête, serial_link.ino compare des distances dans la tâche 4
+
+Usage:
+    python3 ir_calibration.py --collect --port /dev/ttyACM0
+    python3 ir_calibration.py --fit mesures_ir.csv --header
+"""
+
+import argparse
+import os
+
+import numpy as np
+
+import config
+
+ADC_LEVELS = 1024
+ADC_VOLTS = 5.0
+
+# Portée utile du capteur (cm) : la table est bornée à cette plage
+IR_MIN_RANGE = 10
+IR_MAX_RANGE = 80
+
+_DIR = os.path.dirname(os.path.abspath(__file__))
+SAMPLES_PATH = os.path.join(_DIR, 'mesures_ir.csv')
+HEADER_PATH = os.path.join(_DIR, 'serial_link', 'ir_lut.h')
+
+_default_lut = None
+
+
+def volts(adc):
+    return np.asarray(adc, dtype=float) * ADC_VOLTS / ADC_LEVELS
+
+
+def datasheet_distance(adc):
+    """Loi approchée de test_infrared.ino, utilisée tant qu'aucune calibration n'existe"""
+    v = np.maximum(volts(adc), 1e-3)
+    return np.where(v < 1, 28.0 / v, 20.2 / np.maximum(v - 0.28, 1e-3))
+
+
+############################################
+# Ajustement de la courbe
+############################################
+
+def fit_curve(adc, distance, offsets=np.linspace(0.0, 5.0, 51)):
+    """
+    Ajuste d = 1 / (m*V + q) - k sur les mesures
+    Pour chaque k candidat, 1/(d + k) est une droite en V (moindres carrés) ;
+    on garde le k de plus petite erreur sur les distances.
+    Returns: (m, q, k, erreur quadratique moyenne en cm)
+    """
+    v = volts(adc)
+    distance = np.asarray(distance, dtype=float)
+    best = None
+    for k in offsets:
+        m, q = np.polyfit(v, 1.0 / (distance + k), 1)
+        with np.errstate(divide='ignore'):
+            predicted = 1.0 / (m * v + q) - k
+        rms = float(np.sqrt(np.mean((predicted - distance) ** 2)))
+        if best is None or rms < best[3]:
+            best = (float(m), float(q), float(k), rms)
+    return best
+
+
+def build_lut(m, q, k):
+    """Table des 1024 distances (cm, float32), une par valeur de l'ADC"""
+    v = volts(np.arange(ADC_LEVELS))
+    with np.errstate(divide='ignore'):
+        denominator = m * v + q
+        distance = np.where(denominator > 0, 1.0 / denominator - k, IR_MAX_RANGE)
+    return np.clip(distance, IR_MIN_RANGE, IR_MAX_RANGE).astype(np.float32)
+
+
+def load_lut(path=config.IR_LUT_PATH):
+    """Table calibrée si elle existe, sinon table de la loi approchée"""
+    global _default_lut
+    if os.path.exists(path):
+        return np.load(path)
+    if _default_lut is None:
+        _default_lut = np.clip(datasheet_distance(np.arange(ADC_LEVELS)),
+                               IR_MIN_RANGE, IR_MAX_RANGE).astype(np.float32)
+    return _default_lut
+
+
+def export_header(lut, path=HEADER_PATH):
+    """En-tête C : table en cm arrondis, en mémoire programme (PROGMEM)"""
+    values = np.rint(lut).astype(np.uint8)
+    lines = [", ".join(str(v) for v in values[i:i + 16]) for i in range(0, len(values), 16)]
+    with open(path, 'w') as f:
+        f.write("// Table de conversion ADC -> distance (cm) du capteur infrarouge\n")
+        f.write("// générée par basic_motion/ir_calibration.py, ne pas modifier\n")
+        f.write("#ifndef IR_LUT_H\n#define IR_LUT_H\n\n#include <avr/pgmspace.h>\n\n")
+        f.write(f"#define IR_LUT_SIZE {len(values)}\n\n")
+        f.write("const uint8_t IR_LUT[IR_LUT_SIZE] PROGMEM = {\n  ")
+        f.write(",\n  ".join(lines))
+        f.write("\n};\n\n#endif\n")
+
+
+############################################
+# Enregistrement des mesures
+############################################
+
+def collect(arduino, distances=(10, 15, 20, 25, 30, 40, 50, 60, 70, 80), count=20):
+    """
+    Enregistre `count` lectures de l'ADC pour chaque distance, l'obstacle
+    étant placé par l'opérateur
+    Returns: tableau (n, 2) adc, distance
+    """
+    import struct
+    import time
+
+    samples = []
+    for distance in distances:
+        input(f"Placez l'obstacle à {distance} cm puis appuyez sur Entrée...")
+        for _ in range(count):
+            arduino.write(b'R')
+            _, raw, _ = struct.unpack('<lhh', arduino.read(8))
+            samples.append((raw, distance))
+            time.sleep(0.04)       # le capteur se rafraîchit toutes les ~40 ms
+        raws = [s[0] for s in samples[-count:]]
+        print(f"  {distance} cm : ADC médian {np.median(raws):.0f}")
+    return np.array(samples, dtype=float)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Calibration du capteur infrarouge")
+    parser.add_argument('--collect', action='store_true', help="enregistre des mesures sur le robot")
+    parser.add_argument('--port', default=config.ARDUINO_PORT)
+    parser.add_argument('--fit', metavar='CSV', nargs='?', const=SAMPLES_PATH,
+                        help="ajuste la courbe sur les mesures et enregistre la table")
+    parser.add_argument('--header', action='store_true',
+                        help=f"exporte la table pour serial_link.ino ({HEADER_PATH})")
+    args = parser.parse_args()
+
+    if args.collect:
+        from serial_protocol import open_serial
+        arduino = open_serial(args.port, baudrate=config.ARDUINO_BAUDRATE, timeout=0.5)
+        arduino.write(b'A12')
+        arduino.readline()
+        try:
+            samples = collect(arduino)
+        finally:
+            arduino.write(b'a')
+            arduino.close()
+        np.savetxt(SAMPLES_PATH, samples, fmt='%d', delimiter=',', header='adc,distance_cm')
+        print(f"✓ {len(samples)} mesures enregistrées dans {SAMPLES_PATH}")
+        args.fit = args.fit or SAMPLES_PATH
+
+    if args.fit:
+        samples = np.loadtxt(args.fit, delimiter=',', ndmin=2)
+        m, q, k, rms = fit_curve(samples[:, 0], samples[:, 1])
+        print(f"Courbe : d = 1 / ({m:.4f}*V + {q:.4f}) - {k:.2f}   (erreur {rms:.2f} cm)")
+        lut = build_lut(m, q, k)
+        np.save(config.IR_LUT_PATH, lut)
+        print(f"✓ Table enregistrée dans {config.IR_LUT_PATH}")
+    else:
+        lut = load_lut()
+
+    if args.header:
+        export_header(lut)
+        print(f"✓ En-tête exporté dans {HEADER_PATH} (recompiler serial_link.ino)")
+
+
+if __name__ == "__main__":
+    main()
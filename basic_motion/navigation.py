@@ -0,0 +1,318 @@
+"""
+Navigation : suivi, intersection, ligne perdue, recherche, obstacle
+
+Sans ligne détectée, compute_steering_command renvoie (0, 0) et le robot
+s'arrête au milieu du parcours. Navigator enveloppe la loi de pilotage
+(steering.py) dans une machine à états :
+
+- FOLLOW : la commande de la loi de pilotage est appliquée telle quelle
+- INTERSECTION : intersection vue devant ; la ligne est suivie jusqu'au
+  croisement (distance mesurée par l'odométrie), puis la branche choisie
+  (decide, 'straight' par défaut) est prise : virage de l'angle prévu,
+  ou encore INTERSECTION_DISTANCE tout droit, sans déclencher de
+  recherche si la ligne est masquée par la barre transversale
+- LOST : ligne perdue depuis moins de LOST_HOLD_TIME ; la dernière
+  commande est gardée (la ligne réapparaît souvent d'elle-même)
+- SEARCH : balayage en arc borné, d'abord du côté où la ligne a été vue
+  pour la dernière fois (ou à l'opposé de la rotation du robot depuis,
+  d'après l'odométrie), jusqu'à SEARCH_SWEEP_ANGLE mesurés par
+  l'odométrie, puis de l'autre côté ; arrêt si la ligne n'est pas
+  retrouvée
+- OBSTACLE : route bloquée (obstacle.ObstacleState.blocked), arrêt
+
+Pendant LOST et SEARCH, la boucle de contrôle remplace la détection
+complète par vision.occupancy (part de pixels blancs sur une image
+sous-échantillonnée) et ne relance la détection que lorsque la ligne
+réapparaît (searching).
+
+Vérification sur la simulation (robot désorienté en cours de parcours,
+échoue si la ligne n'est pas retrouvée en RECOVERY_TARGET) :
+    python3 navigation.py --check
+"""
+
+import math
+
+import config
+
+FOLLOW = 'follow'
+INTERSECTION = 'intersection'
+LOST = 'lost'
+SEARCH = 'search'
+OBSTACLE = 'obstacle'
+
+# Commande des roues pour chaque branche d'une intersection, en fraction
+# de la vitesse de base (gauche, droite)
+BRANCH_WHEELS = {'straight': (1.0, 1.0), 'left': (0.35, 1.0), 'right': (1.0, 0.35)}
+
+# Part du virage d'une intersection faite en boucle ouverte avant de rendre
+# la main à la loi de pilotage
+TURN_COMPLETION = 0.8
+
+# Rotation (rad) depuis la dernière détection au-delà de laquelle
+# l'odométrie, plutôt que l'image, indique le côté de la ligne
+SIDE_TURN = math.radians(10)
+
+# Temps maximal (s) pour retrouver la ligne dans la vérification --check
+RECOVERY_TARGET = 0.5
+
+
+def line_side(x, dead_zone=0.0):
+    """Côté de la ligne pour un écart x au centre de l'image : +1 à droite, -1 à gauche, 0 au centre"""
+    if x is None or abs(x) <= dead_zone:
+        return 0
+    return 1 if x > 0 else -1
+
+
+class Navigator:
+    """
+    Machine à états de navigation autour d'une loi de pilotage
+
+    update(t, command, side, intersection, pose, obstacle) -> (left, right)
+    command: commande de la loi de pilotage, None si la ligne n'est pas vue
+    side: côté de la ligne dans l'image (line_side), pour la recherche
+    pose: (x, y, theta) de l'odométrie, ou None (durées estimées à partir
+          des commandes)
+    decide: fonction decide(t) appelée à chaque intersection détectée
+            (track_graph.RouteFollower.decide) -> (branche de BRANCH_WHEELS,
+            distance du croisement en m, virage en rad), ou None pour
+            ignorer une fausse détection ; par défaut tout droit, croisement
+            à INTERSECTION_AHEAD
+    """
+
+    def __init__(self, cfg, decide=None, lost_hold=config.LOST_HOLD_TIME,
+                 sweep=config.SEARCH_SWEEP_ANGLE, search_wheels=config.SEARCH_WHEELS,
+                 crossing_distance=config.INTERSECTION_DISTANCE, ahead=config.INTERSECTION_AHEAD,
+                 confirm=config.INTERSECTION_FRAMES,
+                 speed_at_255=config.WHEEL_SPEED_AT_255, wheel_base=config.WHEEL_BASE):
+        self.base_speed = cfg.base_speed
+        self.decide = decide
+        self.lost_hold = lost_hold
+        self.sweep = math.radians(sweep)
+        self.search_wheels = search_wheels
+        self.crossing_distance = crossing_distance
+        self.ahead = ahead
+        self.confirm = confirm
+        self.wheel_base = wheel_base
+        self.mps_per_pwm = speed_at_255 / 255.0
+        # durée d'un balayage sans odométrie : angle / vitesse de rotation de l'arc
+        outer, inner = search_wheels
+        self.sweep_time = self.sweep / ((outer - inner) * self.mps_per_pwm / wheel_base)
+        self.reset()
+
+    def reset(self):
+        self.state = FOLLOW
+        self.since = None               # date d'entrée dans l'état
+        self.command = (0, 0)           # dernière commande envoyée
+        self.side = 0                   # côté de la ligne à la dernière détection
+        self.branch = None
+        self.crossing_at = 0.0          # distance du croisement à l'entrée dans INTERSECTION (m)
+        self.turn = 0.0                 # virage à faire au croisement (rad)
+        self.failed = False             # recherche terminée sans retrouver la ligne
+        self.transitions = []           # (t, état)
+        self.seen = 0                   # images consécutives avec une intersection détectée
+        self._anchor = None             # cap au début du balayage ou du virage, pose à l'intersection
+        self._phase = 0
+        self._travelled = 0.0           # distance estimée sans odométrie
+        self._last_t = None
+        self._seen_heading = None       # cap de l'odométrie à la dernière détection
+
+    @property
+    def searching(self):
+        """True tant que la ligne est perdue : la détection complète peut attendre vision.occupancy"""
+        return self.state in (LOST, SEARCH)
+
+    def _enter(self, state, t):
+        if state != self.state:
+            self.state = state
+            self.transitions.append((t, state))
+        self.since = t
+        self._phase = 0
+        self._anchor = None
+        self._travelled = 0.0
+
+    def update(self, t, command, side=0, intersection=False, pose=None, obstacle=None):
+        dt = 0.0 if self._last_t is None else t - self._last_t
+        self._last_t = t
+        # distance estimée à partir de la commande précédente (sans odométrie)
+        self._travelled += abs(self.command[0] + self.command[1]) / 2 * self.mps_per_pwm * dt
+        if self.since is None:
+            self.since = t
+
+        if obstacle is not None and obstacle.blocked:
+            self._enter(OBSTACLE, t)
+            return self._send((0, 0))
+        if self.state == OBSTACLE:
+            self._enter(FOLLOW if command is not None else LOST, t)
+
+        if command is not None:
+            self.side = side or self.side
+            self.failed = False
+            self._seen_heading = None if pose is None else pose[2]
+
+        if self.state == INTERSECTION:
+            result = self._crossing(t, command, pose)
+            if result is not None:
+                return self._send(result)
+        self.seen = self.seen + 1 if intersection and command is not None else 0
+        if command is not None:
+            decision = None
+            if self.seen >= self.confirm and self.state != INTERSECTION:
+                # intersection confirmée sur `confirm` images : une seule décision
+                self.seen = 0
+                decision = self.decide(t) if self.decide is not None else ('straight', self.ahead, 0.0)
+            if decision is not None:
+                self._enter(INTERSECTION, t)
+                self.branch, self.crossing_at, self.turn = decision
+                self._anchor = pose
+                return self._send(self._crossing(t, command, pose))
+            if self.state != FOLLOW:
+                self._enter(FOLLOW, t)
+            return self._send(command)
+
+        # ligne non vue
+        if self.state == FOLLOW:
+            self._enter(LOST, t)
+        if self.state == LOST:
+            if t - self.since < self.lost_hold:
+                return self._send(self.command)
+            self._enter(SEARCH, t)
+            turned = 0.0 if pose is None or self._seen_heading is None else pose[2] - self._seen_heading
+            if abs(turned) > SIDE_TURN:
+                # le robot a tourné depuis la dernière détection : la ligne est de l'autre côté
+                self.side = -1 if turned < 0 else 1
+            elif self.side == 0:
+                # côté inconnu : celui vers lequel le robot tournait
+                self.side = 1 if self.command[0] > self.command[1] else -1
+        return self._send(self._search(t, pose))
+
+    def _send(self, command):
+        self.command = command
+        return command
+
+    def _crossing(self, t, command, pose):
+        """
+        Commande au passage d'une intersection : suivi de la ligne jusqu'au
+        croisement, puis virage de l'angle prévu (ou encore
+        crossing_distance tout droit) ; None une fois le croisement passé
+        """
+        if pose is not None and self._anchor is not None:
+            travelled = math.hypot(pose[0] - self._anchor[0], pose[1] - self._anchor[1])
+        else:
+            travelled = self._travelled
+        straight = command if command is not None else self._branch_wheels('straight')
+        if travelled < self.crossing_at:
+            return straight                     # croisement encore devant
+        if self.branch == 'straight':
+            if travelled < self.crossing_at + self.crossing_distance:
+                return straight
+        elif not self._turned(t, pose):
+            return self._branch_wheels(self.branch)
+        self._enter(FOLLOW if command is not None else LOST, t)
+        return None
+
+    def _turned(self, t, pose):
+        """True quand le virage du croisement est fait (à TURN_COMPLETION près, la loi de pilotage finit)"""
+        if self._phase == 0:
+            self._phase = 1
+            self._turn_start = pose[2] if pose is not None else t
+        goal = TURN_COMPLETION * self.turn
+        if pose is not None:
+            return abs(pose[2] - self._turn_start) >= goal
+        left, right = self._branch_wheels(self.branch)
+        rate = abs(right - left) * self.mps_per_pwm / self.wheel_base
+        return t - self._turn_start >= goal / rate
+
+    def _branch_wheels(self, branch):
+        left, right = BRANCH_WHEELS[branch]
+        return int(left * self.base_speed), int(right * self.base_speed)
+
+    def _search(self, t, pose):
+        """Balayage en arc : côté de la dernière détection, puis côté opposé"""
+        if self._phase > 1:
+            self.failed = True
+            return 0, 0
+        direction = self.side if self._phase == 0 else -self.side
+        if pose is not None:
+            if self._anchor is None:
+                self._anchor = pose[2]
+            # angle tourné dans le sens du balayage (cap > 0 vers la gauche)
+            turned = -direction * (pose[2] - self._anchor)
+            done = turned >= self.sweep
+        else:
+            done = t - self.since >= self.sweep_time * (1 if self._phase == 0 else 2)
+        if done:
+            # phase 1 : retour jusqu'à la même amplitude de l'autre côté
+            self._phase += 1
+            self.since = t
+            return self._search(t, pose)
+        outer, inner = self.search_wheels
+        return (outer, inner) if direction > 0 else (inner, outer)
+
+
+############################################
+# Vérification sur la simulation
+############################################
+
+def check(kick=55.0, at=6.0, duration=40.0):
+    """
+    Parcours simulé où le robot est tourné de `kick` degrés à la date `at`
+    (la ligne sort du champ de la caméra), avec et sans Navigator
+    Returns: {mode: (ligne retrouvée en s ou None, tours, SimResult)}
+    """
+    import steering
+    import vision
+    from simulation import Simulator
+
+    results = {}
+    for mode in ('arrêt', 'navigation'):
+        sim = Simulator()
+        cfg = sim.cfg
+        w = cfg.camera_resolution[0]
+        nav = Navigator(cfg)
+        state = {'kicked': False, 'lost': None, 'found': None, 'full': 0, 'cheap': 0}
+
+        def control(image):
+            if not state['kicked'] and sim.t >= at:
+                sim.theta += math.radians(kick)
+                state['kicked'] = True
+                image = sim.render()
+            cx = None
+            if mode == 'arrêt' or not nav.searching or \
+                    vision.occupancy(image, cfg) >= config.RECAPTURE_OCCUPANCY:
+                cx, _, _ = vision.detect_line(image, cfg)
+                state['full'] += 1
+            else:
+                state['cheap'] += 1
+            if state['kicked']:
+                if cx is None and state['lost'] is None:
+                    state['lost'] = sim.t
+                elif cx is not None and state['lost'] is not None and state['found'] is None:
+                    state['found'] = sim.t - state['lost']
+            command = None if cx is None else steering.compute_steering_command(cx, cfg)
+            if mode == 'arrêt':
+                return command or (0, 0)
+            return nav.update(sim.t, command, line_side(None if cx is None else cx - w / 2),
+                              pose=(sim.x, sim.y, sim.theta))
+
+        sim.controller = control
+        result = sim.run(duration, laps=1)
+        results[mode] = (state['found'], len(result.lap_times), result, state)
+    return results
+
+
+if __name__ == "__main__":
+    import sys
+
+    if '--check' in sys.argv:
+        results = check()
+        for mode, (found, laps, result, state) in results.items():
+            recovered = (f"ligne retrouvée en {found * 1000:.0f} ms" if found is not None
+                         else "ligne non retrouvée")
+            print(f"  {mode:10s} : {recovered:28s} tours: {laps}  "
+                  f"images : {state['full']} détections, {state['cheap']} contrôles rapides")
+        found, laps, _, _ = results['navigation']
+        assert found is not None and found <= RECOVERY_TARGET, \
+            f"ligne retrouvée en plus de {RECOVERY_TARGET * 1000:.0f} ms (LOST_HOLD_TIME, SEARCH_WHEELS)"
+        assert laps >= 1, "tour non terminé après la recherche"
+    else:
+        print(__doc__)
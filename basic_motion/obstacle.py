@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+"""
+Détection d'obstacles : capteur ultrasonore URM37 balayé par le
+servomoteur avant, fusionné avec le capteur infrarouge Sharp
+
+Un thread fait tourner le servomoteur d'un angle à l'autre (commande 'G')
+et lit à chaque pas la mesure ultrasonore ('S', faite sur la carte sans
+bloquer sa boucle) et le capteur infrarouge ('R'). 'S' renvoie la mesure
+précédente et en lance une nouvelle : une fois le servomoteur arrêté, un
+premier 'S' lance la mesure à cet angle, un second la relit US_PING_TIME
+plus tard ; seules les mesures faites à l'angle courant sont gardées
+(aucun écho n'est mesuré pendant que le servomoteur tourne). Les mesures sont
+rangées dans une carte des distances par angle (tableau numpy, les
+RANGE_HISTORY dernières mesures de chaque angle) ; la médiane des
+mesures cohérentes rejette les valeurs aberrantes (reflets du soleil sur
+l'infrarouge, échos parasites).
+
+Un second thread publie à fréquence fixe (OBSTACLE_RATE) un état
+ObstacleState pour le planificateur. Les mesures de plus de STALE_SWEEPS
+balayages sont oubliées ; une réponse incomplète de la carte fait
+abandonner le pas en cours, et si le balayage ne progresse plus (erreurs
+répétées) l'état est périmé (stale) et la route considérée comme bloquée. La boucle de perception et de
+commande ne fait que lire monitor.state : aucune attente ni calcul.
+
+Les échanges sur la liaison série sont protégés par un verrou partagé
+avec les autres utilisateurs de la carte (lock). La carte doit être
+connectée en mode binaire avec acquittement simple ('A12').
+"""
+
+import struct
+import threading
+import time
+import warnings
+
+import numpy as np
+
+import config
+from ir_calibration import IR_MAX_RANGE, load_lut
+
+# Portée utile du capteur ultrasonore (cm)
+US_MAX_RANGE = 500
+
+# Tolérance du rejet des valeurs aberrantes : écart à la médiane admis,
+# en écarts absolus médians (MAD), plus une marge fixe en cm
+OUTLIER_MADS = 3.0
+OUTLIER_MARGIN = 3.0
+
+# Une mesure plus vieille que STALE_SWEEPS balayages est ignorée ; sans
+# aucun pas de balayage depuis STALE_SWEEPS durées d'un pas, l'état est
+# périmé et la route considérée comme bloquée
+STALE_SWEEPS = 3
+
+
+def ir_distance(raw, lut=None):
+    """
+    Distance (cm) du capteur Sharp GP2Y0A21 à partir de la valeur ADC
+    Simple lecture de la table de ir_calibration.py, scalaire ou tableau
+    """
+    if lut is None:
+        lut = load_lut()
+    return lut[np.clip(np.asarray(raw, dtype=int), 0, len(lut) - 1)]
+
+
+def robust_median(values, axis=-1):
+    """
+    Médiane en ignorant les NaN et les valeurs trop éloignées des autres
+    Returns: NaN là où il n'y a aucune mesure
+    """
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)     # tranches vides
+        median = np.nanmedian(values, axis=axis, keepdims=True)
+        deviation = np.abs(values - median)
+        mad = np.nanmedian(deviation, axis=axis, keepdims=True)
+        keep = deviation <= OUTLIER_MADS * 1.4826 * mad + OUTLIER_MARGIN
+        return np.nanmedian(np.where(keep, values, np.nan), axis=axis)
+
+
+class RangeMap:
+    """
+    Dernières mesures de distance par angle du servomoteur
+
+    angles: angles du balayage (degrés)
+    depth: nombre de mesures gardées par angle (buffer circulaire)
+    """
+
+    def __init__(self, angles, depth=config.RANGE_HISTORY):
+        self.angles = np.asarray(angles, dtype=float)
+        self.ranges = np.full((len(self.angles), depth), np.nan)
+        self.stamps = np.zeros(len(self.angles))
+        self._next = np.zeros(len(self.angles), dtype=int)
+
+    def add(self, angle, distance, t):
+        """Range une mesure (cm, -1 sans écho) à l'angle le plus proche"""
+        i = int(np.argmin(np.abs(self.angles - angle)))
+        if distance < 0 or distance > US_MAX_RANGE:
+            distance = US_MAX_RANGE      # pas d'écho : rien dans la portée
+        self.ranges[i, self._next[i]] = distance
+        self._next[i] = (self._next[i] + 1) % self.ranges.shape[1]
+        self.stamps[i] = t
+
+    def filtered(self):
+        """Distance filtrée par angle (NaN pour un angle jamais mesuré)"""
+        return robust_median(self.ranges)
+
+
+class ObstacleState:
+    """État publié pour le planificateur"""
+
+    __slots__ = ('t', 'nearest', 'angle', 'front', 'blocked', 'ranges', 'stale')
+
+    def __init__(self, t, nearest, angle, front, blocked, ranges, stale=False):
+        self.t = t                  # date de publication (time.monotonic)
+        self.nearest = nearest      # distance (cm) de l'obstacle le plus proche
+        self.angle = angle          # angle du servomoteur correspondant
+        self.front = front          # distance (cm) devant le robot, infrarouge et ultrason fusionnés
+        self.blocked = blocked      # True si la route est bloquée
+        self.ranges = ranges        # distances filtrées par angle (lecture seule, NaN si périmée)
+        self.stale = stale          # balayage arrêté ou devant jamais mesuré : blocked est forcé
+
+    def __repr__(self):
+        return (f"ObstacleState(front={self.front:.0f}cm, nearest={self.nearest:.0f}cm "
+                f"à {self.angle:.0f}°, blocked={self.blocked}"
+                + (", stale" if self.stale else "") + ")")
+
+
+class ObstacleMonitor:
+    """
+    Balayage et publication de l'état des obstacles en tâche de fond
+
+    arduino: liaison avec la carte (mode binaire, acquittement simple)
+    lock: verrou des échanges série, partagé avec les autres threads
+    angles: (min, max, pas) du balayage
+    callback: fonction appelée avec chaque ObstacleState publié
+    """
+
+    def __init__(self, arduino, lock=None, angles=config.SWEEP_ANGLES,
+                 rate=config.OBSTACLE_RATE, settle=config.SERVO_SETTLE_TIME,
+                 ping=config.US_PING_TIME,
+                 distance=config.OBSTACLE_DISTANCE, cone=config.OBSTACLE_CONE,
+                 callback=None):
+        low, high, step = angles
+        self.arduino = arduino
+        self.lock = lock or threading.Lock()
+        self.map = RangeMap(np.arange(low, high + 1, step))
+        self.ir = np.full(config.RANGE_HISTORY, np.nan)
+        self.ir_lut = load_lut()
+        self._ir_next = 0
+        self.period = 1.0 / rate
+        self.settle = settle
+        self.ping = ping
+        self.order = np.concatenate([self.map.angles, self.map.angles[-2:0:-1]])
+        self.step_time = settle + ping                  # durée d'un pas (échanges série négligés)
+        self.sweep_time = len(self.order) * self.step_time
+        self.distance = distance
+        self.center = (low + high) / 2
+        self.cone = cone
+        self.callback = callback
+        self.state = None
+        self.sweeps = 0
+        self.errors = 0             # pas de balayage abandonnés (réponse incomplète, erreur série)
+        self.updated = None         # date du dernier pas de balayage terminé
+        self.record = None          # deque où ajouter les lectures (t, brut, cm) de l'infrarouge
+        self._running = False
+        self._threads = []
+
+    def start(self):
+        self._running = True
+        self._threads = [threading.Thread(target=self._sweep_loop, daemon=True),
+                         threading.Thread(target=self._publish_loop, daemon=True)]
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def stop(self):
+        self._running = False
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    ############################################
+    # Balayage (thread de mesure)
+    ############################################
+
+    def _query(self, cmd):
+        """Returns: (date, valeur, valeur) de la carte, ou None si la réponse est incomplète"""
+        with self.lock:
+            self.arduino.write(cmd)
+            data = self.arduino.read(8)
+            if len(data) < 8:
+                self.arduino.reset_input_buffer()
+                return None
+        return struct.unpack('<lhh', data)
+
+    def _move(self, angle):
+        with self.lock:
+            self.arduino.write(b'G' + struct.pack('<hhl', int(angle), 0, 0))
+            self.arduino.readline()           # acquittement
+
+    def _step(self, angle):
+        """Un pas du balayage ; False si une réponse de la carte manque (pas abandonné)"""
+        self._move(angle)
+        time.sleep(self.settle)
+        # lance la mesure à cet angle (la réponse est celle d'avant l'arrêt du servomoteur)
+        if self._query(b'S') is None:
+            return False
+        time.sleep(self.ping)
+        # relit la mesure lancée, avec l'angle où elle a été faite
+        reply = self._query(b'S')
+        if reply is None:
+            return False
+        _, dist, pos = reply
+        if pos == int(angle):
+            self.map.add(pos, dist, time.monotonic())
+        reply = self._query(b'R')
+        if reply is None:
+            return False
+        raw = reply[1]
+        self.ir[self._ir_next] = ir_distance(raw, self.ir_lut)
+        if self.record is not None:
+            self.record.append((time.monotonic(), raw, self.ir[self._ir_next]))
+        self._ir_next = (self._ir_next + 1) % len(self.ir)
+        return True
+
+    def _sweep_loop(self):
+        while self._running:
+            for angle in self.order:
+                if not self._running:
+                    break
+                try:
+                    done = self._step(angle)
+                except Exception:
+                    # erreur de la liaison : le thread continue, l'état devient
+                    # périmé (stale) si elle dure
+                    done = False
+                    time.sleep(self.step_time)
+                if done:
+                    self.updated = time.monotonic()
+                else:
+                    self.errors += 1
+            self.sweeps += 1
+
+    ############################################
+    # Publication (thread à fréquence fixe)
+    ############################################
+
+    def compute_state(self):
+        now = time.monotonic()
+        ranges = self.map.filtered()
+        # angles non remesurés depuis STALE_SWEEPS balayages : inconnus
+        ranges[now - self.map.stamps > STALE_SWEEPS * self.sweep_time] = np.nan
+        ranges.flags.writeable = False
+        known = ~np.isnan(ranges)
+        if known.any():
+            i = int(np.nanargmin(ranges))
+            nearest, angle = float(ranges[i]), float(self.map.angles[i])
+        else:
+            nearest, angle = float('inf'), self.center
+        cone = known & (np.abs(self.map.angles - self.center) <= self.cone)
+        front = float(np.min(ranges[cone])) if cone.any() else float('inf')
+        ir = float(robust_median(self.ir))
+        if not np.isnan(ir) and ir < IR_MAX_RANGE:
+            front = min(front, ir)
+        # balayage arrêté, ou aucune mesure récente devant : la route n'est pas vue libre
+        stale = (self.updated is None or now - self.updated > STALE_SWEEPS * self.step_time
+                 or not cone.any())
+        return ObstacleState(now, nearest, angle, front, stale or front < self.distance,
+                             ranges, stale)
+
+    def _publish_loop(self):
+        next_time = time.monotonic()
+        while self._running:
+            self.state = self.compute_state()
+            if self.callback is not None:
+                self.callback(self.state)
+            next_time += self.period
+            time.sleep(max(0.0, next_time - time.monotonic()))
+
+
+if __name__ == "__main__":
+    # Démonstration sur l'émulateur : un obstacle à 20 cm entre 75° et 105°,
+    # et des reflets du soleil sur l'infrarouge une lecture sur trois
+    import itertools
+    from serial_protocol import open_serial
+
+    link = open_serial('emul://', timeout=0.5)
+    link.write(b'A12')
+    link.readline()
+    board = link.emulator
+    board.range_at = lambda angle: 20 if 75 <= angle <= 105 else -1
+    glare = itertools.cycle((120, 120, 900))
+    board_cmd_R = board._cmd_R
+
+    def glaring_R():
+        board.ir_value = next(glare)
+        return board_cmd_R()
+    board._cmd_R = glaring_R
+
+    monitor = ObstacleMonitor(link).start()
+    try:
+        for _ in range(8):
+            time.sleep(0.5)
+            print(f"[{monitor.sweeps} balayages] {monitor.state}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        monitor.stop()
+        print("Distances filtrées par angle :")
+        for angle, dist in zip(monitor.map.angles, monitor.state.ranges):
+            print(f"  {angle:5.0f}° : {dist:5.0f} cm")
@@ -0,0 +1,216 @@
+"""
+Odométrie des roues à partir des compteurs d'encodeurs de l'Arduino
+
+La carte compte les ticks des encodeurs (IntIncrem1 / IntIncrem2) et les
+renvoie avec la question 'N'. Les échantillons datés (t, enc1, enc2) sont
+intégrés par paquets (tableaux numpy) : position (x, y) et cap theta du
+robot, vitesse linéaire et vitesse de rotation.
+
+Chaque pas est intégré le long d'un arc de cercle (cap au milieu du pas),
+ce qui reste exact tant que les vitesses des roues sont constantes sur le
+pas. L'historique des poses est gardé dans un buffer circulaire de taille
+fixe : la mémoire reste bornée quelle que soit la durée du parcours.
+
+Usage:
+    odo = Odometry()
+    odo.update(t, enc1, enc2)           # scalaires ou tableaux numpy
+    x, y, theta = odo.pose
+    v, omega = odo.velocity
+"""
+
+import math
+import struct
+import time
+
+import numpy as np
+
+import config
+
+# Les compteurs de la carte sont des entiers 32 bits signés
+_COUNTER_RANGE = 1 << 32
+
+
+class Odometry:
+    """
+    Intégration de la pose d'un robot à roues différentielles
+
+    ticks_per_rev: ticks d'encodeur par tour de roue
+    wheel_diameter: diamètre des roues (m)
+    wheel_base: entraxe des roues (m)
+    history: nombre de poses gardées dans le buffer circulaire
+    window: durée (s) sur laquelle la vitesse est estimée
+    """
+
+    def __init__(self, ticks_per_rev=config.ENCODER_TICKS_PER_REV,
+                 wheel_diameter=config.WHEEL_DIAMETER, wheel_base=config.WHEEL_BASE,
+                 history=1024, window=0.1):
+        self.meters_per_tick = math.pi * wheel_diameter / ticks_per_rev
+        self.wheel_base = wheel_base
+        self.window = window
+        # colonnes : t, x, y, theta, abscisse curviligne (signée)
+        self._history = np.zeros((history, 5))
+        self._count = 0
+        self._last_ticks = None
+        self.reset()
+
+    def reset(self, x=0.0, y=0.0, theta=0.0):
+        """Repart de la pose donnée ; le prochain échantillon sert de référence"""
+        self.x = x
+        self.y = y
+        self.theta = theta
+        self.distance = 0.0        # distance totale parcourue (m)
+        self._s = 0.0              # abscisse curviligne, négative en marche arrière
+        self.t = None
+        self._last_ticks = None
+        self._count = 0
+
+    @property
+    def pose(self):
+        """(x, y, theta) en mètres et radians"""
+        return self.x, self.y, self.theta
+
+    def update(self, t, left, right):
+        """
+        Intègre un ou plusieurs échantillons d'encodeurs
+        t: date(s) en secondes, croissantes
+        left, right: valeurs brutes des compteurs (enc1, enc2)
+        Returns: pose (x, y, theta) après le dernier échantillon
+        """
+        t = np.atleast_1d(np.asarray(t, dtype=float))
+        ticks = np.stack([np.atleast_1d(np.asarray(left, dtype=np.int64)),
+                          np.atleast_1d(np.asarray(right, dtype=np.int64))], axis=1)
+        if not len(t):
+            return self.pose
+
+        if self._last_ticks is None:
+            # premier échantillon : référence des compteurs
+            self._last_ticks = ticks[0]
+            self.t = float(t[0])
+            self._record(t[:1], np.array([self.x]), np.array([self.y]),
+                         np.array([self.theta]), np.array([self._s]))
+            t, ticks = t[1:], ticks[1:]
+            if not len(t):
+                return self.pose
+
+        # écarts de ticks, en tenant compte du débordement des compteurs 32 bits
+        steps = np.diff(np.vstack([self._last_ticks, ticks]), axis=0)
+        steps = (steps + _COUNTER_RANGE // 2) % _COUNTER_RANGE - _COUNTER_RANGE // 2
+        self._last_ticks = ticks[-1]
+
+        d_left = steps[:, 0] * self.meters_per_tick
+        d_right = steps[:, 1] * self.meters_per_tick
+        ds = (d_left + d_right) / 2
+        dtheta = (d_right - d_left) / self.wheel_base
+
+        theta = self.theta + np.cumsum(dtheta)
+        mid = theta - dtheta / 2
+        x = self.x + np.cumsum(ds * np.cos(mid))
+        y = self.y + np.cumsum(ds * np.sin(mid))
+        s = self._s + np.cumsum(ds)
+
+        self.x, self.y, self.theta = float(x[-1]), float(y[-1]), float(theta[-1])
+        self._s = float(s[-1])
+        self.distance += float(np.abs(ds).sum())
+        self.t = float(t[-1])
+        self._record(t, x, y, theta, s)
+        return self.pose
+
+    def _record(self, t, x, y, theta, s):
+        size = len(self._history)
+        rows = np.column_stack([t, x, y, theta, s])[-size:]
+        start = self._count % size
+        first = min(len(rows), size - start)
+        self._history[start:start + first] = rows[:first]
+        self._history[:len(rows) - first] = rows[first:]
+        self._count += len(rows)
+
+    def trajectory(self):
+        """Poses de l'historique, de la plus ancienne à la plus récente : (n, 4) t, x, y, theta"""
+        size = len(self._history)
+        if self._count <= size:
+            return self._history[:self._count, :4].copy()
+        start = self._count % size
+        return np.roll(self._history, -start, axis=0)[:, :4]
+
+    @property
+    def velocity(self):
+        """(v, omega) moyennés sur la fenêtre `window`, en m/s et rad/s"""
+        size = len(self._history)
+        n = min(self._count, size)
+        if n < 2:
+            return 0.0, 0.0
+        last = (self._count - 1) % size
+        # on remonte l'historique jusqu'au début de la fenêtre
+        t_end = self._history[last, 0]
+        k = 1
+        while k < n - 1 and t_end - self._history[(last - k) % size, 0] < self.window:
+            k += 1
+        first = self._history[(last - k) % size]
+        end = self._history[last]
+        dt = end[0] - first[0]
+        if dt <= 0:
+            return 0.0, 0.0
+        return float((end[4] - first[4]) / dt), float((end[3] - first[3]) / dt)
+
+    def pose_at(self, t):
+        """Pose interpolée à la date t (dans l'historique), pour le recalage"""
+        traj = self.trajectory()
+        if not len(traj):
+            return self.pose
+        return tuple(float(np.interp(t, traj[:, 0], traj[:, i])) for i in (1, 2, 3))
+
+
+############################################
+# Lecture des encodeurs sur la liaison série
+############################################
+
+def read_encoders(arduino, binary=True):
+    """
+    Demande les compteurs à la carte (question 'N')
+    binary: réponse binaire (commode >= 2) ou ASCII
+    Returns: (t, enc1, enc2), t étant la date de réception côté Raspberry
+    """
+    arduino.write(b'N')
+    if binary:
+        data = arduino.read(8)
+        t = time.monotonic()
+        if len(data) < 8:
+            return None
+        enc1, enc2 = struct.unpack('<ll', data)
+    else:
+        line = arduino.readline().split()
+        t = time.monotonic()
+        if len(line) < 2:
+            return None
+        enc1, enc2 = int(line[0]), int(line[1])
+    return t, enc1, enc2
+
+
+if __name__ == "__main__":
+    # Démonstration sur l'émulateur de la carte : rotation sur place puis ligne droite
+    from arduino_emulator import EmulatedSerial
+
+    link = EmulatedSerial(timeout=0.1, realtime=False)
+    link.write(b'A12')
+    link.readline()
+    odo = Odometry()
+    period = 1.0 / config.ODOMETRY_FREQUENCY
+
+    samples = []
+    for left, right, duration in ((120, -120, 1.0), (150, 150, 2.0), (0, 0, 0.5)):
+        link.write(b'C' + struct.pack('<hhl', left, right, 0))
+        link.readline()
+        for _ in range(int(duration / period)):
+            link.sleep(period)
+            link.write(b'N')
+            enc1, enc2 = struct.unpack('<ll', link.read(8))
+            samples.append((link.clock(), enc1, enc2))
+        # intégration par paquet
+        t, enc1, enc2 = np.array(samples).T
+        odo.update(t, enc1, enc2)
+        samples = []
+        x, y, theta = odo.pose
+        v, omega = odo.velocity
+        print(f"Moteurs {left:4d} {right:4d} : x={x:.3f} m  y={y:.3f} m  "
+              f"cap={math.degrees(theta):7.1f}°  v={v:.2f} m/s  omega={omega:.2f} rad/s")
+    print(f"Distance parcourue : {odo.distance:.2f} m ({len(odo.trajectory())} poses gardées)")
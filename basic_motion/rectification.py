@@ -0,0 +1,359 @@
+"""
+Rectification de la vue caméra : passage image -> sol calibré
+
+La caméra regarde le sol en biais : un écart en pixels ne correspond pas
+au même écart en centimètres en bas et en haut de l'image, ni au centre
+et sur les bords. geometry.CameraModel corrige cela avec le montage
+nominal (config.py) ; ici la correspondance est mesurée sur le robot :
+
+- une photo d'un damier posé à plat devant le robot (ou des repères de
+  la piste dont on a mesuré la position) donne l'homographie image -> sol
+  (vue de dessus), enregistrée dans config.RECTIFICATION_PATH
+- en option, quelques photos du damier sous différents angles (--lens)
+  donnent la distorsion de l'objectif (cv2.calibrateCamera)
+
+En fonctionnement, Rectifier ne transforme que les quelques points
+utilisés par les contrôleurs (steering.py), jamais l'image entière : un
+produit par une matrice 3x3 par point, plus cv2.undistortPoints si la
+distorsion a été calibrée. Même interface que geometry.CameraModel
+(to_ground, depth_for, line_point) ; load_camera() revient au modèle
+nominal sans fichier de calibration.
+
+Les photos peuvent être prises à une résolution plus élevée que celle du
+suivi de ligne : les points sont ramenés à la résolution de calibration.
+
+Usage:
+    python3 rectification.py damier.jpg --pattern 7x5 --square 0.02 --distance 0.17
+    python3 rectification.py damier.jpg --pattern 7x5 --square 0.02 --distance 0.17 \\
+        --lens objectif/*.jpg --preview vue_dessus.png
+    python3 rectification.py piste.jpg --points reperes.json
+    python3 rectification.py --check
+"""
+
+import argparse
+import json
+import os
+
+import numpy as np
+
+import config
+from geometry import CameraModel
+
+
+class Rectifier:
+    """
+    Passage image -> sol par homographie calibrée
+
+    homography: matrice 3x3, pixel (colonne, ligne) à la résolution de
+                calibration -> point au sol (X devant l'axe des roues,
+                Y à gauche, mètres), repère de geometry.CameraModel
+    resolution: résolution du suivi de ligne (points reçus par to_ground)
+    calibration_resolution: résolution des photos de calibration
+    camera_matrix, dist_coeffs: objectif calibré (cv2), None sans distorsion
+    """
+
+    def __init__(self, homography, resolution=config.CAMERA_RESOLUTION,
+                 calibration_resolution=None, camera_matrix=None, dist_coeffs=None):
+        w, h = resolution
+        self.resolution = (w, h)
+        cw, ch = calibration_resolution or resolution
+        self.calibration_resolution = (cw, ch)
+        self.sx, self.sy = cw / w, ch / h
+        H = np.asarray(homography, np.float64)
+        # normalisation : w = 1 au bas de l'image, > 0 sous l'horizon
+        bottom = H @ ((w / 2) * self.sx, (h - 0.5) * self.sy, 1.0)
+        H = H / bottom[2]
+        self.homography = H
+        self.inverse = np.linalg.inv(H)
+        self._h = tuple(float(v) for v in H.ravel())
+        self.camera_matrix = None if camera_matrix is None else np.asarray(camera_matrix, np.float64)
+        self.dist_coeffs = None if dist_coeffs is None else np.asarray(dist_coeffs, np.float64)
+
+    @classmethod
+    def load(cls, path=config.RECTIFICATION_PATH, resolution=config.CAMERA_RESOLUTION):
+        data = np.load(path)
+        lens = 'camera_matrix' in data.files
+        return cls(data['homography'], resolution, tuple(int(v) for v in data['resolution']),
+                   data['camera_matrix'] if lens else None, data['dist_coeffs'] if lens else None)
+
+    def save(self, path=config.RECTIFICATION_PATH):
+        arrays = {'homography': self.homography, 'resolution': np.array(self.calibration_resolution)}
+        if self.camera_matrix is not None:
+            arrays.update(camera_matrix=self.camera_matrix, dist_coeffs=self.dist_coeffs)
+        np.savez(path, **arrays)
+
+    def _to_calibration(self, col, row):
+        # pixel (centre) à la résolution du suivi -> photo de calibration, sans distorsion
+        u = (col + 0.5) * self.sx
+        v = (row + 0.5) * self.sy
+        if self.camera_matrix is not None:
+            import cv2
+            point = cv2.undistortPoints(np.array([[[u, v]]]), self.camera_matrix,
+                                        self.dist_coeffs, P=self.camera_matrix)
+            u, v = point[0, 0]
+        return u, v
+
+    def to_ground(self, col, row):
+        """Point au sol (X, Y) vu au pixel (col, row), None au-dessus de l'horizon"""
+        a, b, c, d, e, f, g, h, i = self._h
+        u, v = self._to_calibration(col, row)
+        w = g * u + h * v + i
+        if w <= 1e-3:
+            return None
+        return (a * u + b * v + c) / w, (d * u + e * v + f) / w
+
+    def depth_for(self, distance):
+        """Distance d (lignes d'image depuis le bas, geometry.py) où l'on voit le sol à `distance` m devant"""
+        u, v, w = self.inverse @ (distance, 0.0, 1.0)
+        u, v = u / w, v / w
+        if self.camera_matrix is not None:
+            import cv2
+            K = self.camera_matrix
+            ray = np.array([[(u - K[0, 2]) / K[0, 0], (v - K[1, 2]) / K[1, 1], 1.0]])
+            points, _ = cv2.projectPoints(ray, np.zeros(3), np.zeros(3), K, self.dist_coeffs)
+            v = points[0, 0, 1]
+        return self.resolution[1] - 1 - (v / self.sy - 0.5)
+
+    def line_point(self, geometry, d):
+        """Point au sol de la ligne ajustée à la distance d (lignes d'image)"""
+        w, h = self.resolution
+        return self.to_ground(geometry.x_at(d) + w / 2, h - 1 - d)
+
+    def birdseye(self, image, extent=(0.1, 0.5, -0.2, 0.2), pixels_per_meter=800):
+        """
+        Vue de dessus de l'image de calibration (vérification visuelle
+        seulement : le suivi de ligne ne transforme jamais l'image)
+        extent: (X min, X max, Y min, Y max) en m
+        """
+        import cv2
+        x0, x1, y0, y1 = extent
+        k = pixels_per_meter
+        if self.camera_matrix is not None:
+            K = self.camera_matrix.copy()
+            K[:2, 2] -= 0.5                 # cv2 : centre du premier pixel en 0
+            image = cv2.undistort(image, K, self.dist_coeffs)
+        # sol -> vue de dessus : X vers le haut, Y vers la gauche
+        top = np.array([[0, -k, k * y1], [-k, 0, k * x1], [0, 0, 1]])
+        # homographie en coordonnées continues (coin du pixel) -> indices de pixels
+        shift = np.array([[1, 0, 0.5], [0, 1, 0.5], [0, 0, 1]])
+        size = (int(k * (y1 - y0)), int(k * (x1 - x0)))
+        return cv2.warpPerspective(image, top @ self.homography @ shift, size)
+
+
+def load_camera(resolution=config.CAMERA_RESOLUTION, path=config.RECTIFICATION_PATH):
+    """Rectification calibrée si le fichier existe, sinon modèle nominal (geometry.CameraModel)"""
+    if path and os.path.exists(path):
+        return Rectifier.load(path, resolution)
+    return CameraModel(resolution)
+
+
+############################################
+# Calibration
+############################################
+
+def board_corners(image, pattern):
+    """
+    Coins intérieurs du damier, rangés du haut vers le bas et de gauche à
+    droite de l'image
+    pattern: (coins par rangée, rangées)
+    Returns: tableau (rangées, coins, 2) en coordonnées continues
+             (bord du pixel en 0), None si le damier n'est pas trouvé
+    """
+    import cv2
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    found, corners = cv2.findChessboardCorners(gray, pattern)
+    if not found:
+        return None
+    corners = cv2.cornerSubPix(gray, corners, (5, 5), (-1, -1),
+                               (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 30, 0.01))
+    nx, ny = pattern
+    grid = corners.reshape(ny, nx, 2).astype(np.float64) + 0.5
+    if grid[0, 0, 1] > grid[-1, 0, 1]:
+        grid = grid[::-1]
+    if grid[0, 0, 0] > grid[0, -1, 0]:
+        grid = grid[:, ::-1]
+    return grid
+
+
+def board_ground(pattern, square, distance, lateral=0.0):
+    """
+    Position au sol des coins d'un damier posé à plat, rangées
+    perpendiculaires à l'axe du robot
+    distance: X de la rangée de coins la plus proche (m, depuis l'axe des roues)
+    lateral: Y du milieu du damier (m, > 0 à gauche)
+    Returns: tableau (rangées, coins, 2), même ordre que board_corners
+    """
+    nx, ny = pattern
+    j, i = np.mgrid[0:ny, 0:nx]
+    X = distance + (ny - 1 - j) * square
+    Y = lateral + ((nx - 1) / 2 - i) * square
+    return np.dstack([X, Y]).astype(np.float64)
+
+
+def lens_calibration(images, pattern, square):
+    """
+    Matrice de la caméra et distorsion de l'objectif à partir de photos
+    du damier sous différents angles
+    Returns: (camera_matrix, dist_coeffs, erreur RMS en pixels)
+    """
+    import cv2
+    nx, ny = pattern
+    board = np.zeros((nx * ny, 3), np.float32)
+    board[:, :2] = np.mgrid[0:nx, 0:ny].T.reshape(-1, 2) * square
+    object_points, image_points = [], []
+    for image in images:
+        grid = board_corners(image, pattern)
+        if grid is not None:
+            # cv2 : coordonnées dont le centre du premier pixel est 0
+            image_points.append((grid - 0.5).reshape(-1, 1, 2).astype(np.float32))
+            object_points.append(board)
+    if len(image_points) < 3:
+        raise ValueError(f"damier trouvé sur {len(image_points)} photos, il en faut au moins 3")
+    h, w = images[0].shape[:2]
+    rms, K, dist, _, _ = cv2.calibrateCamera(object_points, image_points, (w, h), None, None)
+    # coordonnées continues (bord du pixel en 0), comme le reste du module
+    K = K.copy()
+    K[0, 2] += 0.5
+    K[1, 2] += 0.5
+    return K, dist, rms
+
+
+def fit_homography(pixels, ground, camera_matrix=None, dist_coeffs=None):
+    """
+    Homographie image -> sol par moindres carrés sur des correspondances
+    pixels: (n, 2) coordonnées continues ; ground: (n, 2) en m ; n >= 4
+    Returns: (homographie, erreur par point en m)
+    """
+    import cv2
+    pixels = np.asarray(pixels, np.float64).reshape(-1, 1, 2)
+    ground = np.asarray(ground, np.float64).reshape(-1, 1, 2)
+    if len(pixels) < 4:
+        raise ValueError("il faut au moins 4 points")
+    if camera_matrix is not None:
+        pixels = cv2.undistortPoints(pixels, camera_matrix, dist_coeffs, P=camera_matrix)
+    H, _ = cv2.findHomography(pixels, ground, 0)
+    projected = cv2.perspectiveTransform(pixels, H)
+    return H, np.linalg.norm(projected - ground, axis=2).ravel()
+
+
+def calibrate_board(image, pattern, square, distance, lateral=0.0, lens_images=None,
+                    resolution=config.CAMERA_RESOLUTION):
+    """
+    Rectification à partir d'une photo du damier posé devant le robot
+    Returns: (Rectifier, erreur par coin en m)
+    """
+    K = dist = None
+    if lens_images:
+        K, dist, rms = lens_calibration(lens_images, pattern, square)
+        print(f"✓ Objectif : erreur RMS {rms:.2f} px, distorsion {np.round(dist.ravel(), 3)}")
+    grid = board_corners(image, pattern)
+    if grid is None:
+        raise ValueError(f"damier {pattern[0]}x{pattern[1]} introuvable sur la photo")
+    H, errors = fit_homography(grid.reshape(-1, 2), board_ground(pattern, square, distance, lateral)
+                               .reshape(-1, 2), K, dist)
+    h, w = image.shape[:2]
+    return Rectifier(H, resolution, (w, h), K, dist), errors
+
+
+def calibrate_points(image_size, points, resolution=config.CAMERA_RESOLUTION):
+    """
+    Rectification à partir de repères de la piste relevés à la main
+    points: liste de [colonne, ligne, X, Y] (pixels de la photo, m au sol)
+    Returns: (Rectifier, erreur par point en m)
+    """
+    points = np.asarray(points, np.float64)
+    H, errors = fit_homography(points[:, :2] + 0.5, points[:, 2:])
+    return Rectifier(H, resolution, image_size), errors
+
+
+############################################
+# Vérification sur une vue simulée
+############################################
+
+def synthetic_board(size, pattern, square, distance, lateral=0.0):
+    """Photo simulée d'un damier au sol vu par la caméra nominale (simulation.camera_ground_points)"""
+    from simulation import camera_ground_points
+
+    X, Y, valid = camera_ground_points(size)
+    nx, ny = pattern
+    i = np.floor((lateral + (nx + 1) / 2 * square - Y) / square)
+    j = np.floor((distance + ny * square - X) / square)
+    inside = valid & (i >= 0) & (i <= nx) & (j >= 0) & (j <= ny)
+    black = inside & ((i + j) % 2 == 0)
+    image = np.full(X.shape, 235, np.uint8)
+    image[black] = 20
+    return np.dstack([image] * 3)
+
+
+def check(size=(640, 512), pattern=(7, 5), square=0.02, distance=0.17):
+    """
+    Calibre sur une photo simulée et compare à geometry.CameraModel
+    Returns: (erreur max par coin, écart max au modèle en m, µs par point Rectifier, µs CameraModel)
+    """
+    import time
+
+    image = synthetic_board(size, pattern, square, distance)
+    rectifier, errors = calibrate_board(image, pattern, square, distance)
+    model = CameraModel()
+    w, h = config.CAMERA_RESOLUTION
+    worst = 0.0
+    for row in range(h // 2, h, 4):
+        for col in range(0, w, 8):
+            a, b = rectifier.to_ground(col, row), model.to_ground(col, row)
+            worst = max(worst, float(np.hypot(a[0] - b[0], a[1] - b[1])))
+    timings = []
+    for camera in (rectifier, model):
+        start = time.perf_counter()
+        for k in range(2000):
+            camera.to_ground(k % w, h - 1 - k % (h // 2))
+        timings.append((time.perf_counter() - start) / 2000 * 1e6)
+    return float(errors.max()), worst, timings[0], timings[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Calibration image -> sol (vue de dessus)")
+    parser.add_argument('photo', nargs='?', help="photo du damier posé devant le robot, ou de la piste")
+    parser.add_argument('--pattern', default='7x5', help="coins intérieurs du damier : par rangée x rangées")
+    parser.add_argument('--square', type=float, default=0.02, help="côté d'une case (m)")
+    parser.add_argument('--distance', type=float, default=0.17,
+                        help="distance de la rangée de coins la plus proche à l'axe des roues (m)")
+    parser.add_argument('--lateral', type=float, default=0.0, help="décalage du damier à gauche (m)")
+    parser.add_argument('--lens', nargs='+', metavar='PHOTO', help="photos du damier pour l'objectif")
+    parser.add_argument('--points', help="repères de la piste : JSON [[colonne, ligne, X, Y], ...]")
+    parser.add_argument('--preview', help="enregistre la vue de dessus (png)")
+    parser.add_argument('--output', default=config.RECTIFICATION_PATH)
+    parser.add_argument('--check', action='store_true', help="vérification sur une photo simulée")
+    args = parser.parse_args()
+
+    if args.check:
+        corner, worst, us, us_model = check()
+        print(f"Damier simulé : erreur max par coin {corner * 1000:.2f} mm")
+        print(f"Écart au modèle nominal (moitié basse de l'image) : {worst * 1000:.2f} mm")
+        print(f"Coût par point : {us:.2f} µs (modèle nominal {us_model:.2f} µs)")
+        return
+    if not args.photo:
+        parser.error("photo requise (ou --check)")
+
+    import cv2
+    image = cv2.imread(args.photo)
+    if image is None:
+        parser.error(f"impossible de lire {args.photo}")
+    if args.points:
+        with open(args.points) as f:
+            rectifier, errors = calibrate_points(image.shape[1::-1], json.load(f))
+    else:
+        pattern = tuple(int(v) for v in args.pattern.split('x'))
+        lens = [cv2.imread(path) for path in args.lens] if args.lens else None
+        rectifier, errors = calibrate_board(image, pattern, args.square, args.distance,
+                                            args.lateral, lens)
+    print(f"✓ {len(errors)} points, erreur moyenne {errors.mean() * 1000:.1f} mm, "
+          f"max {errors.max() * 1000:.1f} mm")
+    rectifier.save(args.output)
+    print(f"✓ Rectification enregistrée dans {args.output}")
+    if args.preview:
+        cv2.imwrite(args.preview, rectifier.birdseye(image))
+        print(f"✓ Vue de dessus enregistrée dans {args.preview}")
+
+
+if __name__ == "__main__":
+    main()
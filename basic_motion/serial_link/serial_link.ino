@@ -22,6 +22,13 @@
 #include <Servo.h>
 //#include "SR04.h"
 
+// table ADC -> distance (cm) du capteur infrarouge, générée par
+// basic_motion/ir_calibration.py --header ; sans elle, seuil brut sur l'ADC
+#if __has_include("ir_lut.h")
+#include "ir_lut.h"
+#define IR_STOP_CM 12       // distance d'arrêt (cm), le seuil brut 500 correspond à ~10 cm
+#endif
+
 #define digitalPinToInterrupt(p)  ((p) == 2 ? 0 : ((p) == 3 ? 1 : -1))
 
 char feedback ;   // si non nul indique que les commandes doivent renvoyer un acquittement
@@ -40,11 +47,22 @@ bool task4on=false ;        // lancement de la tache 4 de détection de collisio
 bool task5on=false ;        // lancement de la tache 5 de rotation du servomoteur
 bool obst=false ;           // obstacle détecté
 
-char c,CharIn,m;
+char c,m;
 bool ConnOn ;          // indique si la carte est connectée
-int commode=0 ;        // indique le mode de communication 0=tout en ASCII, 1 les commandes sont en binaire et les retours en ascii, 2 tout est en binaire  
+int commode=0 ;        // indique le mode de communication 0=tout en ASCII, 1 les commandes sont en binaire et les retours en ascii, 2 tout est en binaire
+                       // 3 les commandes sont en trames binaires préfixées par leur longueur et les retours en binaire
 char retstring[96] ;   // chaine de retour de commande
 
+// réception non bloquante des commandes
+#define RX_SIZE 32                 // taille du buffer de réception
+#define ASCII_GAP_US 2000          // silence (us) qui termine une commande ASCII sans fin de ligne
+#define FRAME_TIMEOUT_US 20000L    // silence (us) au-delà duquel une trame binaire incomplète est abandonnée
+uint8_t rxbuf[RX_SIZE] ;   // octets reçus en attente de décodage
+uint8_t rxlen=0 ;          // nombre d'octets dans rxbuf
+uint8_t rxpos=0 ;          // position de lecture des paramètres de la commande en cours
+uint8_t rxend=0 ;          // fin de la commande en cours dans rxbuf
+unsigned long rxlast ;     // date (us) de réception du dernier octet
+
 // variables de la gestion des moteurs 
 long int volatile CountIncr1,CountIncr2 =0 ;  // valeur des compteurs incrémentaux en 32 bits
 int nivM1,nivM2 ;         // tension appliquée au moteur
@@ -59,7 +77,14 @@ long int v2,lv2 ;
 long int v3,lv3 ;
 int vitesse1,vitesse2 ;
 
-//SR04 sr04 = SR04(ECHO_PIN,TRIG_PIN);  // gestion du capteur ultrasonore
+// gestion du capteur ultrasonore URM37 en mode PWM : l'écho est une impulsion
+// à l'état bas de 50 us par cm, mesurée dans loop() sans pulseIn bloquant
+#define US_TIMEOUT_US 30000L   // pas d'écho au-delà (portée max ~5 m)
+char usstate=0 ;               // 0 repos, 1 attente du début de l'impulsion, 2 impulsion en cours
+unsigned long ustrig,usstart ; // date (us) du déclenchement et du début de l'impulsion
+int usdist=-1 ;                // dernière distance mesurée en cm (-1 si pas d'écho)
+long ustime=0 ;                // date (ms) de cette mesure
+int uspos=0 ;                  // position du servomoteur lors de cette mesure
 long a;
 int v;
 
@@ -128,6 +153,9 @@ void setup() {
   tim4 = (int)millis()+del4;
   tim5 = (int)millis()+del5;
   frontServo.attach(ServofrontPin);
+  pinMode(TRIG_PIN, OUTPUT);
+  digitalWrite(TRIG_PIN, HIGH);   // déclenchement sur un front descendant
+  pinMode(ECHO_PIN, INPUT);
 
   init_arduino() ;
 
@@ -144,12 +172,11 @@ void setup() {
 
 void loop() {
  
-  if (Serial.available() > 0) {
-    // on lit le premier caractère qui arrive
-    CharIn = Serial.read();
-    if (CharIn=='A') CONNECT_code();        // demande de connection
-    else if (ConnOn)     decod_serial(CharIn);  // on ne fait un decodage de commande que si on est connecté
-  }
+  // réception des octets et exécution des commandes complètes, sans jamais attendre
+  read_serial() ;
+
+  // mesure ultrasonore en cours
+  if (usstate) ultrason_poll() ;
 
   // lancement des differentes taches périodiques
   if (task1on) task1() ;   // tache periodique non définie
@@ -167,53 +194,146 @@ void loop() {
 //
 //////////////////////////////////////////////////////////////////////////
 
-// Routine de recuperation d'un caractere
+// Les commandes sont accumulées dans rxbuf et ne sont exécutées que
+// lorsqu'elles sont complètes : la boucle principale ne bloque jamais
+// et les tâches périodiques restent à l'heure.
+//   - 'A' (connexion) et 'a' (déconnexion) : toujours en clair, 'A' suivi de 2 caractères
+//   - mode 0 (ASCII)  : la commande se termine par une fin de ligne ou un silence de ASCII_GAP_US
+//   - modes 1 et 2    : longueur connue par commande (paramètres binaires, voir payload_len)
+//   - mode 3 (trames) : un octet de longueur puis la commande et ses paramètres binaires
+
+// nombre d'octets de paramètres binaires de chaque commande (modes 1 et 2)
+uint8_t payload_len(char cmd)
+{
+  switch (cmd) {
+    case 'A' :                      return 2 ;   // mode de retour et mode de communication
+    case 'I' : case 'i' :
+    case 'O' : case 'o' :           return 1 ;   // un caractère
+    case 'c' :                      return 9 ;   // numéro du moteur + 2 int + 1 long
+    case 'B' : case 'b' : case 'C' :
+    case 'D' : case 'd' : case 'G' :
+    case 'g' :                      return 8 ;   // 2 int + 1 long, 4 int ou 2 long
+    default :                       return 0 ;   // questions sans paramètre
+  }
+}
+
+// longueur de la commande complète en tête de rxbuf, 0 si elle n'est pas encore arrivée
+uint8_t frame_length()
+{
+  uint8_t i ;
+  if (rxbuf[0]=='A')                       // connexion, valable dans tous les modes
+    return (rxlen>=3) ? 3 : 0 ;
+  if (rxbuf[0]=='a')                       // déconnexion, valable dans tous les modes
+    return 1 ;
+  if ((commode==0) || !ConnOn) {           // ASCII : jusqu'à la fin de ligne
+    for (i=0; i<rxlen; i++)
+      if ((rxbuf[i]=='\n') || (rxbuf[i]=='\r')) return i+1 ;
+    return 0 ;
+  }
+  if (commode==3)                          // trame : octet de longueur en tête
+    return (rxlen>rxbuf[0]) ? rxbuf[0]+1 : 0 ;
+  i = 1+payload_len(rxbuf[0]) ;            // binaire : longueur connue par commande
+  return (rxlen>=i) ? i : 0 ;
+}
+
+// exécute la commande rxbuf[0..n-1] puis la retire du buffer
+void execute_frame(uint8_t n)
+{
+  uint8_t start = 0 ;
+  if ((commode==3) && ConnOn && (rxbuf[0]!='A') && (rxbuf[0]!='a'))
+    start = 1 ;                            // on saute l'octet de longueur
+  rxpos = start+1 ;
+  rxend = n ;
+  if (n>start) {
+    char cmd = rxbuf[start] ;
+    if (cmd=='A') CONNECT_code();              // demande de connection
+    else if (ConnOn) decod_serial(cmd);        // on ne fait un decodage de commande que si on est connecté
+  }
+  rxlen -= n ;
+  memmove(rxbuf, rxbuf+n, rxlen) ;
+}
+
+// lecture non bloquante de la liaison série
+void read_serial()
+{
+  uint8_t n ;
+  while ((Serial.available()>0) && (rxlen<RX_SIZE)) {
+    rxbuf[rxlen++] = Serial.read() ;
+    rxlast = micros() ;
+  }
+  // en ASCII on ignore les fins de ligne et espaces entre deux commandes
+  while ((rxlen>0) && ((commode==0) || !ConnOn) &&
+         ((rxbuf[0]=='\n') || (rxbuf[0]=='\r') || (rxbuf[0]==' '))) {
+    rxlen-- ;
+    memmove(rxbuf, rxbuf+1, rxlen) ;
+  }
+  while (rxlen>0) {
+    n = frame_length() ;
+    if (n==0) {
+      unsigned long silence = micros()-rxlast ;
+      if (((commode==0) || !ConnOn || (rxbuf[0]=='A')) && ((silence>ASCII_GAP_US) || (rxlen==RX_SIZE)))
+        n = rxlen ;                        // commande ASCII sans fin de ligne
+      else if ((silence>FRAME_TIMEOUT_US) || (rxlen==RX_SIZE)) {
+        rxlen = 0 ;                        // trame binaire tronquée : on resynchronise
+        dummy() ;
+        return ;
+      }
+      else
+        return ;                           // on attend la suite sans bloquer
+    }
+    execute_frame(n) ;
+  }
+}
+
+// Routine de recuperation d'un caractere de la commande en cours
 char GetChar(char def)
 {   
-    if (Serial.available()>0)  // liaison série vide 
-      return(Serial.read());
+    if (rxpos<rxend)
+      return(rxbuf[rxpos++]);
     else
       return(def) ;
 }
 
-// routine de récupération d'un nombre entier sur la liaison série
+// lecture d'un nombre ASCII dans la commande en cours (sans attente)
+long ParseAscii(long def)
+{
+    long val=0 ;
+    bool neg=false ;
+    while ((rxpos<rxend) && (rxbuf[rxpos]==' ')) rxpos++ ;
+    if ((rxpos<rxend) && (rxbuf[rxpos]=='-')) { neg=true ; rxpos++ ; }
+    if ((rxpos>=rxend) || (rxbuf[rxpos]<'0') || (rxbuf[rxpos]>'9'))
+      return(def) ;                        // renvoie la valeur par défaut
+    while ((rxpos<rxend) && (rxbuf[rxpos]>='0') && (rxbuf[rxpos]<='9'))
+      val = val*10 + (rxbuf[rxpos++]-'0') ;
+    return(neg ? -val : val) ;
+}
+
+// routine de récupération d'un nombre entier dans la commande en cours
 // le codage sera ascii ou binaire selon la variable 'commode'
 int GetInt(int def)
 {   
     int tmp ;
-    if (commode==0) {
-      c=Serial.peek() ;
-      if (c==' ') {Serial.read(); c=Serial.peek() ;}
-      if ((c=='-') || ((c>='0') && (c<='9'))) 
-        return(Serial.parseInt()); // on recupere la commande du moteur
-      else
-        return(def) ; }  // renvoie la valeur par défaut 
-    else {
-      Serial.readBytes((char*)&tmp,2);
-      return(tmp) ;
-    }
-    
+    if (commode==0)
+      return((int)ParseAscii(def)) ;
+    if (rxpos+2>rxend)
+      return(def) ;
+    memcpy(&tmp, rxbuf+rxpos, 2) ;
+    rxpos += 2 ;
+    return(tmp) ;
 }
 
-// routine de récupération d'un nombre entier long (32 bits) sur la liaison série
+// routine de récupération d'un nombre entier long (32 bits) dans la commande en cours
 // le codage sera ascii ou binaire selon la variable 'commode'
 long int GetLong(long def)
 {
     long int tmp ;
-    if (commode==0) {
-      c=Serial.peek() ;
-      if (c==' ') {Serial.read(); c=Serial.peek() ;}
-      if ((c=='-') || ((c>='0') && (c<='9'))) 
-      {
-        tmp=Serial.parseInt() ;
-        return(tmp); // on recupere la commande du moteur
-      }
-      else
-        return(def) ; }  // renvoie la valeur par défaut
-    else {
-      Serial.readBytes((char*)&tmp,4);
-      return(tmp) ;
-    }
+    if (commode==0)
+      return(ParseAscii(def)) ;
+    if (rxpos+4>rxend)
+      return(def) ;
+    memcpy(&tmp, rxbuf+rxpos, 4) ;
+    rxpos += 4 ;
+    return(tmp) ;
 }
 
 // bibliothèque de renvoi de valeurs binaires sur la liaison série
@@ -262,12 +382,11 @@ inline void RetAcquitSimpl()
 
 // code de connection de la carte
 void CONNECT_code() {
-  delay(1); // indispensable et pas trop long sinon le caractère suivant n'est pas arrivé
   c=GetChar(0);
   feedback=c-'0' ;
   ConnOn = true ;
   commode= GetChar(0);
-  if (commode>0) commode-='0'; else commode=0 ;
+  if ((commode>='0') && (commode<='3')) commode-='0'; else commode=0 ;
   init_arduino() ;
 
   RetAcquitSimpl();
@@ -301,7 +420,6 @@ void RESETENC_code() {
 // code pour commander 1 moteur
 void SINGLEMOTOR_code() {
   char s ;
-  delay(1); // indispensable et pas trop long
   m=GetChar(0);
   if (m=='1') { nivM=nivM1 ; motA=motor1PWM; s=0; motB=motor1SNS; }
   else if (m=='2') { nivM=nivM2 ; motA=motor2PWM; s=1; motB=motor2SNS; }
@@ -320,7 +438,7 @@ void SINGLEMOTOR_code() {
         Serial.println("OB stacle détecté moteur non allumé"); 
   }
   else
-  { Serial.readString() ;
+  { rxpos=rxend ;       // on ignore le reste de la commande
     Serial.println("Erreur commande incomplète"); 
   
   }
@@ -329,7 +447,6 @@ void SINGLEMOTOR_code() {
  
 // code pour commander les 2 moteurs en même temps
 void DUALMOTOR_code() {
-  delay(1); // indispensable et pas trop long
 
   // on recupere les parametres
   nivM1=GetInt(0) ;   // on lit la valeur du premier moteur
@@ -355,7 +472,6 @@ void DUALMOTOR_code() {
 
 // code pour la mise en route progressive des 2 moteurs en même temps
 void DUALMOTORSLOW_code() {
-  delay(1); // indispensable et pas trop long
 
   // on recupere les parametres
   nivE1=GetInt(0) ;   // on lit la valeur du premier moteur ;
@@ -381,7 +497,6 @@ void DUALMOTORSLOW_code() {
 
 // code pour régler la consigne de vitesse pour envoyer les 2 moteurs à une certaine position
 void SERVO_code() {
-  delay(1); // indispensable et pas trop long
   
   // onn recupere les paramètres 
   servopos=GetInt(0) ;  // on recupere la vitesse pour positionner le moteur
@@ -402,7 +517,6 @@ void SERVO_code() {
 
 // code pour régler la consigne min et max des servomoteurs
 void SERVO_minmax() {
-  delay(1); // indispensable et pas trop long
   
   // onn recupere les paramètres 
   servomin=GetInt(0) ;  // on recupere la vitesse pour positionner le moteur
@@ -423,7 +537,6 @@ void SERVO_minmax() {
 // code de mise en route de la protection moteur
 // chaque appel à cette commande réinitialise la détection et autorise le redémarrage des moteurs 
 void PROTECT_IR_code() {
-  delay(1); // indispensable et pas trop long
   m=GetChar(0);
   if (m=='0')   { task4on=false ; obst=false ;   }
   else if (m=='1')  { Task4On() ;  obst=false ; }    
@@ -444,7 +557,7 @@ void PROTECT_IR_code() {
 // renvoie la position de 2 encodeurs
 void  ENCODER_DUAL_code() {
   v1=CountIncr1; v2=CountIncr2 ;
-  if (commode==2)
+  if (commode>=2)
   {  write_i32(v1); write_i32(v2); }
   else
   {
@@ -456,7 +569,6 @@ void  ENCODER_DUAL_code() {
 
 // renvoie le temps courant et la position d'un encodeur
 void  ENCODERS_TIME_code() {
-  delay(1); // indispensable et pas trop long sinon le caractère suivant n'est pas arrivé
   c=GetChar(0);
   if (c=='1') 
     v2=CountIncr1; 
@@ -464,7 +576,7 @@ void  ENCODERS_TIME_code() {
     v2=CountIncr2 ;
 
   v1=millis() ;
-  if (commode==2)
+  if (commode>=2)
   {  write_i32(v1); write_i32(v2); }
   else
   { Serial.print(v1);
@@ -474,7 +586,7 @@ void  ENCODERS_TIME_code() {
 
 // renvoie la vitesse des 2 moteurs
 void SPEED_DUAL_code() {
-  if (commode==2)
+  if (commode>=2)
   {  write_i16(vitesse1); write_i16(vitesse2); write_i16(0);  write_i16(0); }
   else
   { Serial.print(vitesse1);
@@ -485,7 +597,7 @@ void SPEED_DUAL_code() {
 // renvoie le temps courant et la valeur du capteur infrarouge
 void  INFRARED_TIME_code() {
   v1=millis() ;
-  if (commode==2)
+  if (commode>=2)
   {  write_i32(v1); write_i16(analogRead(IR_pin));  write_i16(0);   }
   else
   { 
@@ -494,18 +606,24 @@ void  INFRARED_TIME_code() {
     Serial.println(analogRead(IR_pin)); }
 }
 
-// renvoie la valeur du capteur ultrasons
+// renvoie la dernière mesure ultrasonore (date, distance en cm, position du servomoteur)
+// et lance la mesure suivante
 void  ULTRASON_code() {
-//  a=sr04.Distance();
-//  if (commode==2)
-//    write_i16(a); 
-//  else
-//    Serial.println(a);
+  if (commode>=2)
+  {  write_i32(ustime); write_i16(usdist);  write_i16(uspos);   }
+  else
+  { 
+    Serial.print(ustime);
+    Serial.print(" ");
+    Serial.print(usdist);
+    Serial.print(" ");
+    Serial.println(uspos); }
+  ultrason_trigger() ;
 }
 
 // renvoie la tension sur le moteur
 void  VALMOTOR_code() {
-  if (commode==2)
+  if (commode>=2)
   { write_i16(nivM1); 
     write_i16(nivM2);  write_i16(0);  write_i16(0);}
   else
@@ -633,7 +751,11 @@ inline void task3() {
 inline void task4() {
   if (((int)millis()-tim4)>0)  // si on a atteint le temps programmé
   { 
+#ifdef IR_STOP_CM
+    if (pgm_read_byte(&IR_LUT[analogRead(IR_pin)])<IR_STOP_CM)   // on a détecté un obstacle
+#else
     if (analogRead(IR_pin)>500)     // on a détecté un obstacle
+#endif
     {
       obst=true ;                   // indique que l'on a détecté un obstacle
       nivM1=0 ; nivM2=0 ;
@@ -661,6 +783,34 @@ inline void task5() {
   }
 }
 
+////////////////////////////////////////////////////////////
+//
+// la mesure ultrasonore non bloquante
+//
+////////////////////////////////////////////////////////////
+
+// déclenche une mesure si aucune n'est en cours
+void ultrason_trigger() {
+  if (usstate!=0) return ;
+  digitalWrite(TRIG_PIN, LOW);
+  digitalWrite(TRIG_PIN, HIGH);
+  uspos=servopos ;
+  ustrig=micros() ;
+  usstate=1 ;
+}
+
+// suit l'impulsion d'écho à chaque passage dans loop()
+inline void ultrason_poll() {
+  unsigned long now=micros() ;
+  int echo=digitalRead(ECHO_PIN) ;
+  if (usstate==1) {
+    if (echo==LOW) { usstart=now ; usstate=2 ; }              // début de l'impulsion
+    else if (now-ustrig>US_TIMEOUT_US) { usdist=-1 ; ustime=millis() ; usstate=0 ; }
+  }
+  else if (echo==HIGH) { usdist=(now-usstart)/50 ; ustime=millis() ; usstate=0 ; }   // fin de l'impulsion
+  else if (now-usstart>US_TIMEOUT_US) { usdist=-1 ; ustime=millis() ; usstate=0 ; }
+}
+
 ////////////////////////////////////////////////////////////
 //
 // les routines d'interruption
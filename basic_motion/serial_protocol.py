@@ -0,0 +1,261 @@
+"""
+Protocole série de serial_link.ino, côté Raspberry Pi
+
+Encodage des commandes pour chaque mode de communication (commode) et
+modèle Python du décodeur non bloquant de la carte (read_serial dans
+serial_link.ino) :
+- mode 0 : tout en ASCII, une commande se termine par une fin de ligne
+           (ou par un silence de ASCII_GAP_US)
+- mode 1 : commandes binaires, retours en ASCII
+- mode 2 : commandes et retours binaires
+- mode 3 : commandes en trames binaires préfixées par leur longueur,
+           retours binaires
+La connexion 'A' (2 caractères : feedback puis commode) et la
+déconnexion 'a' sont toujours envoyées en clair.
+
+Les entiers binaires sont en little-endian : int16 pour GetInt, int32
+pour GetLong, comme sur l'Arduino.
+"""
+
+import struct
+import time
+
+# Constantes identiques à serial_link.ino
+RX_SIZE = 32
+ASCII_GAP_US = 2000
+FRAME_TIMEOUT_US = 20000
+
+# Nombre d'octets de paramètres binaires de chaque commande (payload_len)
+PAYLOAD_LEN = {
+    'A': 2,
+    'I': 1, 'i': 1, 'O': 1, 'o': 1,
+    'c': 9,
+    'B': 8, 'b': 8, 'C': 8, 'D': 8, 'd': 8, 'G': 8, 'g': 8,
+}
+
+# Format struct des paramètres de chaque commande ('c' = un caractère)
+FORMATS = {
+    'B': '<ll',      # remise à 0 des encodeurs (2 long ignorés)
+    'b': '<ll',
+    'C': '<hhl',     # 2 moteurs : gauche, droite, long ignoré
+    'D': '<hhhh',    # démarrage progressif : gauche, droite, accélération, ignoré
+    'd': '<hhhh',
+    'G': '<hhl',     # servomoteur : position, ignoré, ignoré
+    'g': '<hhl',     # servomoteur min, max, ignoré
+    'c': '<chhl',    # 1 moteur : numéro ('1' ou '2'), tension, ignoré, ignoré
+    'I': '<c',       # protection infrarouge '0' ou '1'
+    'i': '<c',
+    'O': '<c',       # temps et encodeur '1' ou '2'
+    'o': '<c',
+}
+
+# Format des réponses binaires des questions (commode >= 2)
+REPLY_FORMATS = {
+    'N': '<ll',      # encodeurs 1 et 2
+    'O': '<ll',      # temps (ms) et encodeur demandé
+    'P': '<hhhh',    # vitesses 1 et 2 (ticks par période de la tâche 2)
+    'R': '<lhh',     # temps (ms) et capteur infrarouge
+    'S': '<lhh',     # temps (ms), distance ultrasonore (cm, -1 sans écho), position du servomoteur
+    'T': '<hhhh',    # tensions des moteurs 1 et 2
+}
+
+
+def connect_command(feedback=2, commode=0):
+    """Commande de connexion 'A' : feedback (0, 1, 2) et commode (0 à 3)"""
+    return b'A%d%d' % (feedback, commode)
+
+
+def _fields(cmd, values):
+    fmt = FORMATS.get(cmd, '<')
+    values = list(values)
+    # Les paramètres non donnés valent 0 (le caractère vaut '0')
+    codes = fmt[1:]
+    values += [b'0' if code == 'c' else 0 for code in codes[len(values):]]
+    return [v.encode() if code == 'c' and isinstance(v, str) else v
+            for code, v in zip(codes, values)]
+
+
+def encode_command(cmd, *values, commode=0):
+    """
+    Encode une commande pour le mode de communication donné
+    cmd: lettre de la commande ('C', 'N', ...)
+    values: paramètres de la commande (entiers, ou caractères pour 'c', 'I', 'O')
+    Returns: bytes à écrire sur la liaison série
+    """
+    if cmd in ('A', 'a'):
+        return connect_command(*values) if cmd == 'A' else b'a'
+    if commode == 0:
+        text = ''.join(v.decode() if isinstance(v, bytes) else
+                       (v if isinstance(v, str) else ' %d' % v)
+                       for v in values)
+        return (cmd + text + '\n').encode()
+    payload = struct.pack(FORMATS.get(cmd, '<'), *_fields(cmd, values))
+    frame = cmd.encode() + payload
+    if commode == 3:
+        return bytes([len(frame)]) + frame
+    return frame
+
+
+def decode_values(cmd, payload):
+    """Décode les paramètres binaires d'une commande (inverse de encode_command)"""
+    fmt = FORMATS.get(cmd, '<')
+    size = struct.calcsize(fmt)
+    payload = bytes(payload[:size]).ljust(size, b'\0')
+    return struct.unpack(fmt, payload)
+
+
+class CommandParser:
+    """
+    Modèle du décodeur non bloquant de serial_link.ino
+
+    Les octets reçus sont accumulés et une commande n'est rendue que
+    lorsqu'elle est complète. Les dates sont en microsecondes.
+    """
+
+    def __init__(self):
+        self.commode = 0
+        self.connected = False
+        self.buffer = bytearray()
+        self.last_us = 0
+        self.errors = 0
+
+    def _ascii(self):
+        return self.commode == 0 or not self.connected
+
+    def frame_length(self):
+        """Longueur de la commande en tête du buffer, 0 si incomplète"""
+        buf = self.buffer
+        if buf[0] == ord('A'):
+            return 3 if len(buf) >= 3 else 0
+        if buf[0] == ord('a'):
+            return 1
+        if self._ascii():
+            for i, b in enumerate(buf):
+                if b in (10, 13):
+                    return i + 1
+            return 0
+        if self.commode == 3:
+            return buf[0] + 1 if len(buf) > buf[0] else 0
+        n = 1 + PAYLOAD_LEN.get(chr(buf[0]), 0)
+        return n if len(buf) >= n else 0
+
+    def feed(self, data, now_us):
+        """
+        Ajoute des octets reçus à la date now_us
+        Returns: liste des commandes complètes (cmd, paramètres bruts)
+        """
+        free = RX_SIZE - len(self.buffer)
+        if data:
+            self.buffer += data[:free]
+            self.last_us = now_us
+        return self.poll(now_us)
+
+    def poll(self, now_us):
+        """Rend les commandes terminées par un silence (ASCII) ou abandonne une trame tronquée"""
+        commands = []
+        while self.buffer and self._ascii() and self.buffer[0] in (10, 13, 32):
+            del self.buffer[0]
+        while self.buffer:
+            n = self.frame_length()
+            if n == 0:
+                silence = now_us - self.last_us
+                full = len(self.buffer) == RX_SIZE
+                if (self._ascii() or self.buffer[0] == ord('A')) and (silence > ASCII_GAP_US or full):
+                    n = len(self.buffer)
+                elif silence > FRAME_TIMEOUT_US or full:
+                    self.buffer.clear()
+                    self.errors += 1
+                    commands.append(('ER', b''))
+                    break
+                else:
+                    break
+            commands.append(self._execute(n))
+        return commands
+
+    def _execute(self, n):
+        frame = bytes(self.buffer[:n])
+        del self.buffer[:n]
+        if self.commode == 3 and self.connected and frame[:1] not in (b'A', b'a'):
+            frame = frame[1:]
+        cmd, payload = chr(frame[0]) if frame else '', frame[1:]
+        if cmd == 'A':
+            mode = payload[1:2]
+            self.commode = int(mode) if mode and mode in b'0123' else 0
+            self.connected = True
+        elif cmd == 'a':
+            self.connected = False
+        return cmd, payload
+
+
+############################################
+# Ouverture de la liaison
+############################################
+
+EMULATOR_URL = 'emul://'
+DAEMON_URL = 'daemon://'
+
+STARTUP_TIMEOUT = 3.0       # redémarrage de la carte à l'ouverture du port (s)
+HANDSHAKE_RETRY = 0.25      # période de renvoi de la demande de connexion (s)
+
+
+def open_serial(port, baudrate=115200, timeout=0.1):
+    """
+    Ouvre la liaison avec la carte
+    port: '/dev/ttyACM0', une URL pyserial ('loop://', 'rfc2217://...')
+          'emul://' pour l'émulateur de la carte (arduino_emulator.py)
+          ou 'daemon://[socket]' pour la liaison partagée par arduino_daemon.py
+    """
+    if port.startswith(EMULATOR_URL):
+        from arduino_emulator import EmulatedSerial
+        return EmulatedSerial(baudrate=baudrate, timeout=timeout, port=port)
+    if port.startswith(DAEMON_URL):
+        from arduino_daemon import DaemonSerial
+        return DaemonSerial(port[len(DAEMON_URL):] or None, timeout=timeout, baudrate=baudrate)
+    import serial
+    return serial.serial_for_url(port, baudrate=baudrate, timeout=timeout)
+
+
+def connect(port, handshake=b'A20', baudrate=115200, timeout=0.1, startup=STARTUP_TIMEOUT):
+    """
+    Ouvre la liaison et envoie la demande de connexion (handshake)
+    La carte redémarre à l'ouverture du port : au lieu d'attendre 2 s
+    dans tous les cas, la demande est renvoyée toutes les HANDSHAKE_RETRY s
+    jusqu'à la première réponse, puis les réponses en double sont vidées.
+    Returns: (liaison, réponse) ; réponse b'' si la carte n'a pas répondu
+             dans les startup s (liaison ouverte quand même)
+    """
+    link = open_serial(port, baudrate=baudrate, timeout=timeout)
+    link.reset_input_buffer()
+    deadline = time.monotonic() + startup
+    rep = b''
+    sent = 0
+    while time.monotonic() < deadline:
+        link.write(handshake)
+        sent += 1
+        retry = time.monotonic() + HANDSHAKE_RETRY
+        while time.monotonic() < retry:
+            rep = link.readline()
+            if rep.split()[:1] == [b'OK']:
+                while sent > 1 and link.readline():     # acquittements des demandes renvoyées
+                    pass
+                return link, rep
+            if rep.split()[:1] == [b'KO']:
+                return link, b''                        # refusée (arduino_daemon.py)
+    return link, b''
+
+
+def set_mode(link, handshake, timeout=1.0):
+    """
+    Change le mode d'une liaison déjà connectée : la demande 'A' est
+    reconnue par la carte quel que soit le mode en cours
+    Returns: réponse de la carte, b'' sans réponse OK dans les timeout s
+    """
+    link.reset_input_buffer()
+    link.write(handshake)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        rep = link.readline()
+        if rep.split()[:1] == [b'OK']:
+            return rep
+    return b''
+
@@ -0,0 +1,247 @@
+"""
+Enregistrement des sessions de roulage (séries temporelles sur la carte SD)
+
+Chaque signal (images, centroïdes, commandes, acquittements, encodeurs,
+infrarouge...) est écrit dans son propre fichier binaire : des
+enregistrements de taille fixe (date, puis les champs du signal), lus et
+écrits à travers np.memmap. Toutes les dates viennent de la même horloge
+monotone (secondes depuis le début de la session) : la colonne t de
+chaque signal est triée et sert d'index.
+
+- écriture : ajout en fin de fichier depuis la boucle de contrôle, champ
+  par champ dans le memmap (aucun tableau alloué par échantillon) ; le
+  fichier est agrandi par blocs de GROW_BYTES
+- lecture : window(t0, t1) trouve les bornes par recherche dichotomique
+  dans la colonne t (O(log n)) et renvoie une vue sur le memmap ; seules
+  les pages lues sont chargées en mémoire
+
+Un petit manifeste JSON (manifest.json) décrit les signaux et leur nombre
+d'enregistrements. Il est réécrit à chaque flush() : après un arrêt brutal
+on retrouve au moins les données du dernier flush.
+
+Usage:
+    store = SessionStore.create()
+    store.add_signal('centroid', [('cx', 'f4'), ('cy', 'f4')])
+    store.append('centroid', store.clock(), cx, cy)
+    store.close()
+
+    session = SessionStore.open(path)
+    rows = session['centroid'].window(10.0, 12.5)    # rows['t'], rows['cx']...
+"""
+
+import json
+import os
+import time
+
+import numpy as np
+
+import config
+
+MANIFEST = 'manifest.json'
+GROW_BYTES = 1 << 20            # agrandissement des fichiers par blocs de 1 Mo
+FLUSH_INTERVAL = 2.0            # réécriture du manifeste au plus toutes les 2 s
+
+# Signaux usuels de la boucle de suivi de ligne
+SIGNALS = {
+    'frame':     [('number', 'u4'), ('image', 'u1', config.CAMERA_RESOLUTION[::-1] + (3,))],
+    'centroid':  [('cx', 'f4'), ('cy', 'f4')],              # NaN sans ligne
+    'command':   [('left', 'i2'), ('right', 'i2')],
+    'ack':       [('latency', 'f4')],                       # délai de l'acquittement de chaque commande (s)
+    'encoders':  [('enc1', 'i4'), ('enc2', 'i4')],          # lectures 'N' (boucle ou boucle de vitesse)
+    'ir':        [('raw', 'i2'), ('distance', 'f4')],       # lectures 'R' du balayage (obstacle.py)
+}
+
+
+def _dtype(fields):
+    return np.dtype([('t', '<f8')] + [tuple(f) for f in fields])
+
+
+class Signal:
+    """
+    Fichier d'un signal : enregistrements (t, champs...) de taille fixe
+
+    En écriture le fichier est plus grand que les données (capacité) ;
+    len(signal) est le nombre d'enregistrements valides.
+    """
+
+    def __init__(self, path, fields, count=0, writable=False):
+        self.path = path
+        self.fields = [list(f) for f in fields]
+        self.dtype = _dtype(fields)
+        self.count = count
+        self.writable = writable
+        self._grow = max(16, GROW_BYTES // self.dtype.itemsize)
+        self._map = None
+        self._columns = ()
+        if writable:
+            open(path, 'ab').close()
+            self._reserve(max(count, self._grow))
+        elif count:
+            self._map = np.memmap(path, dtype=self.dtype, mode='r', shape=(count,))
+
+    def __len__(self):
+        return self.count
+
+    def _reserve(self, capacity):
+        # le memmap ne peut pas grandir : on agrandit le fichier et on le rouvre
+        if self._map is not None:
+            self._map.flush()
+            self._map = None
+        with open(self.path, 'r+b') as f:
+            f.truncate(capacity * self.dtype.itemsize)
+        self._map = np.memmap(self.path, dtype=self.dtype, mode='r+', shape=(capacity,))
+        self._columns = tuple(self._map[name] for name in self.dtype.names)
+
+    def append(self, t, *values):
+        """Ajoute un enregistrement ; t doit être croissant"""
+        i = self.count
+        if i == len(self._map):
+            self._reserve(i + self._grow)
+        columns = self._columns
+        columns[0][i] = t
+        for column, value in zip(columns[1:], values):
+            column[i] = value
+        self.count = i + 1
+
+    @property
+    def data(self):
+        """Tous les enregistrements (vue sur le memmap, sans copie)"""
+        if self._map is None:
+            return np.empty(0, dtype=self.dtype)
+        return self._map[:self.count]
+
+    def index(self, t):
+        """Position du premier enregistrement de date >= t (recherche dichotomique)"""
+        return int(np.searchsorted(self.data['t'], t, side='left'))
+
+    def window(self, t0, t1):
+        """Enregistrements de dates dans [t0, t1[ (vue, sans copie)"""
+        return self.data[self.index(t0):self.index(t1)]
+
+    def at(self, t):
+        """Dernier enregistrement de date <= t (None avant le premier)"""
+        i = int(np.searchsorted(self.data['t'], t, side='right')) - 1
+        return self.data[i] if i >= 0 else None
+
+    def flush(self):
+        if self._map is not None and self.writable:
+            self._map.flush()
+
+    def close(self):
+        if self.writable and self._map is not None:
+            self._map.flush()
+            self._map = None
+            self._columns = ()
+            with open(self.path, 'r+b') as f:
+                f.truncate(self.count * self.dtype.itemsize)     # capacité inutilisée
+        self._map = None
+
+
+class SessionStore:
+    """Répertoire d'une session : manifeste et un fichier par signal"""
+
+    def __init__(self, path, manifest, writable):
+        self.path = path
+        self.manifest = manifest
+        self.writable = writable
+        self.signals = {}
+        self._start = time.monotonic()
+        self._last_flush = self._start
+        for name, info in manifest['signals'].items():
+            self.signals[name] = Signal(os.path.join(path, name + '.bin'), info['fields'],
+                                        info['count'], writable=False)
+
+    @classmethod
+    def create(cls, root=config.SESSION_PATH, name=None):
+        """Nouvelle session dans root/<name> (date et heure par défaut)"""
+        name = name or time.strftime('%Y%m%d_%H%M%S')
+        path = os.path.join(root, name)
+        os.makedirs(path, exist_ok=False)
+        manifest = {'name': name, 'created': time.time(), 'clock': 'monotonic',
+                    'signals': {}}
+        store = cls(path, manifest, writable=True)
+        store.flush()
+        return store
+
+    @classmethod
+    def open(cls, path):
+        """Session existante, en lecture seule"""
+        with open(os.path.join(path, MANIFEST)) as f:
+            return cls(path, json.load(f), writable=False)
+
+    def clock(self, t=None):
+        """
+        Date de la session (s) : l'horloge commune de tous les signaux
+        t: date time.monotonic() d'une mesure faite plus tôt (par un autre
+           thread), maintenant par défaut
+        """
+        return (time.monotonic() if t is None else t) - self._start
+
+    def add_signal(self, name, fields=None):
+        """Déclare un signal ; fields: [(nom, dtype[, forme])], par défaut ceux de SIGNALS"""
+        fields = fields if fields is not None else SIGNALS[name]
+        signal = Signal(os.path.join(self.path, name + '.bin'), fields, writable=True)
+        self.signals[name] = signal
+        self.manifest['signals'][name] = {'fields': signal.fields, 'count': 0}
+        return signal
+
+    def append(self, name, t, *values):
+        self.signals[name].append(t, *values)
+        if time.monotonic() - self._last_flush > FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        """Écrit les données et le manifeste (nombre d'enregistrements de chaque signal)"""
+        for name, signal in self.signals.items():
+            signal.flush()
+            self.manifest['signals'][name]['count'] = len(signal)
+        tmp = os.path.join(self.path, MANIFEST + '.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(self.manifest, f, indent=1)
+        os.replace(tmp, os.path.join(self.path, MANIFEST))
+        self._last_flush = time.monotonic()
+
+    def close(self):
+        if self.writable:
+            self.flush()
+        for signal in self.signals.values():
+            signal.close()
+
+    def __getitem__(self, name):
+        return self.signals[name]
+
+    def __contains__(self, name):
+        return name in self.signals
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def window(self, t0, t1):
+        """Tous les signaux sur [t0, t1[ : {nom: enregistrements}"""
+        return {name: signal.window(t0, t1) for name, signal in self.signals.items()}
+
+    @property
+    def duration(self):
+        ends = [signal.data['t'][-1] for signal in self.signals.values() if len(signal)]
+        return float(max(ends)) if ends else 0.0
+
+
+if __name__ == "__main__":
+    # Résumé d'une session enregistrée : python3 session_store.py <répertoire> [t0 t1]
+    import sys
+
+    session = SessionStore.open(sys.argv[1])
+    print(f"Session {session.manifest['name']} : {session.duration:.1f} s")
+    for name, signal in session.signals.items():
+        size = os.path.getsize(signal.path) / 1e6
+        print(f"  {name:10s} {len(signal):8d} enregistrements  {size:8.1f} Mo")
+    if len(sys.argv) > 3:
+        t0, t1 = float(sys.argv[2]), float(sys.argv[3])
+        for name, rows in session.window(t0, t1).items():
+            print(f"{name} entre {t0} et {t1} s : {len(rows)} enregistrements")
+            if 'image' not in rows.dtype.names:
+                for row in rows[:10]:
+                    print("   ", row)
@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+"""
+Simulateur cinématique en boucle fermée du suivi de ligne
+
+Le robot (différentiel, deux roues) roule sur une image de piste vue de
+dessus (simulink/huit.jpg). À chaque pas de commande, la vue caméra est
+synthétisée par une projection perspective vectorisée (cv2.remap avec
+des tables précalculées), puis le vrai code de détection et de pilotage
+(vision.detect_line / steering.compute_steering_command) calcule les
+commandes moteur, qui sont intégrées par le modèle cinématique.
+
+Une simulation tourne bien plus vite que le temps réel : on peut évaluer
+des profils de réglage sur un portable au lieu de refaire des essais
+sur la piste.
+
+Usage:
+    python3 simulation.py [--track ../simulink/huit.jpg] [--duration 60]
+"""
+
+import argparse
+import math
+import os
+import time
+
+import cv2
+import numpy as np
+
+import config
+import steering
+import vision
+
+TRACK_DEFAULT = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', 'simulink', 'huit.jpg')
+
+# ============================================
+# PARAMÈTRES DE LA PISTE
+# ============================================
+
+# Échelle de l'image de piste (mètres par pixel)
+TRACK_SCALE = 0.004
+
+# Largeur réelle de la ligne (m) ; la ligne de l'image est élargie à cette taille
+LINE_WIDTH = 0.019
+
+# Niveaux de gris du sol et de la ligne dans la vue synthétisée
+FLOOR_LEVEL = 60
+LINE_LEVEL = 230
+
+# Position de départ (pixels de l'image de piste) et cap (degrés, 0 = vers la droite)
+START_PIXEL = (300, 384)
+START_HEADING = 0.0
+
+# ============================================
+# PARAMÈTRES DE LA CAMÉRA
+# ============================================
+
+# Montage nominal de la caméra (config.py)
+CAMERA_HEIGHT = config.CAMERA_HEIGHT
+CAMERA_TILT = config.CAMERA_TILT
+CAMERA_OFFSET = config.CAMERA_OFFSET
+CAMERA_HFOV = config.CAMERA_HFOV
+CAMERA_VFOV = config.CAMERA_VFOV
+
+# ============================================
+# PARAMÈTRES DU ROBOT
+# ============================================
+
+# Entraxe des roues (m)
+WHEEL_BASE = config.WHEEL_BASE
+# Vitesse de roue (m/s) pour une commande de 255
+SPEED_AT_255 = config.WHEEL_SPEED_AT_255
+# Commande minimale en dessous de laquelle la roue ne tourne pas
+PWM_DEADBAND = 25
+# Constante de temps des moteurs (s)
+MOTOR_TAU = 0.08
+# Pas d'intégration de la dynamique (s)
+PHYSICS_DT = 0.005
+
+# Critères de fin de tour / de sortie de piste
+LAP_RADIUS = 0.08          # retour à moins de 8 cm du départ
+LAP_MIN_DISTANCE = 1.0     # après avoir parcouru au moins 1 m
+OFF_TRACK_DISTANCE = 0.15  # plus de 15 cm de la ligne...
+OFF_TRACK_TIME = 1.0       # ... pendant plus d'une seconde = sortie de piste
+
+
+def load_track(path=TRACK_DEFAULT, scale=TRACK_SCALE, line_width=LINE_WIDTH):
+    """
+    Charge une image de piste (ligne blanche sur fond sombre)
+    Returns: (image BGR synthétisée, carte des distances à la ligne en m)
+    """
+    raw = cv2.imread(path)
+    if raw is None:
+        raise FileNotFoundError(path)
+    line = np.all(raw > 150, axis=2).astype(np.uint8)
+
+    radius = max(1, int(round(line_width / scale / 2)))
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (2*radius + 1, 2*radius + 1))
+    wide = cv2.dilate(line, kernel)
+    gray = np.where(wide > 0, LINE_LEVEL, FLOOR_LEVEL).astype(np.uint8)
+
+    # Distance (m) de chaque pixel au centre de la ligne, pour l'erreur latérale
+    distance = cv2.distanceTransform((1 - line).astype(np.uint8), cv2.DIST_L2, 5) * scale
+    return cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR), distance
+
+
+def camera_ground_points(resolution=config.CAMERA_RESOLUTION):
+    """
+    Coordonnées au sol (repère robot, x devant, y à gauche) de chaque pixel
+    de la caméra, calculées une seule fois
+    Returns: (X, Y, valid) tableaux (hauteur, largeur)
+    """
+    w, h = resolution
+    fx = (w / 2) / math.tan(math.radians(CAMERA_HFOV) / 2)
+    fy = (h / 2) / math.tan(math.radians(CAMERA_VFOV) / 2)
+    u, v = np.meshgrid(np.arange(w) + 0.5 - w/2, np.arange(h) + 0.5 - h/2)
+
+    # Rayon dans le repère caméra incliné : (avant, gauche, haut)
+    tilt = math.radians(CAMERA_TILT)
+    forward = np.cos(tilt) - (v / fy) * np.sin(tilt)
+    down = np.sin(tilt) + (v / fy) * np.cos(tilt)
+    left = -u / fx
+
+    valid = down > 1e-3
+    t = np.where(valid, CAMERA_HEIGHT / np.where(valid, down, 1.0), 0.0)
+    X = (CAMERA_OFFSET + t * forward).astype(np.float32)
+    Y = (t * left).astype(np.float32)
+    return X, Y, valid
+
+
+class Simulator:
+    """
+    Robot différentiel simulé sur une piste
+
+    cfg: config.LineConfig utilisée par le pipeline réel
+    controller: fonction controller(image) -> (left_speed, right_speed)
+                par défaut le pipeline réel detect_line + compute_steering_command
+    """
+
+    def __init__(self, track=TRACK_DEFAULT, scale=TRACK_SCALE, cfg=None, controller=None,
+                 resolution=config.CAMERA_RESOLUTION, period=config.FRAME_DELAY):
+        self.scale = scale
+        self.period = period
+        self.resolution = resolution
+        self.track, self.distance = load_track(track, scale)
+        self.height_px = self.track.shape[0]
+        self.cfg = cfg or config.LineConfig.from_module()
+        self.controller = controller or self.line_following_controller
+        self._X, self._Y, self._valid = camera_ground_points(resolution)
+        self._map_x = np.empty(self._X.shape, np.float32)
+        self._map_y = np.empty(self._X.shape, np.float32)
+        self._view = np.empty((resolution[1], resolution[0], 3), np.uint8)
+        self.reset()
+
+    def reset(self, start_pixel=START_PIXEL, heading=START_HEADING):
+        """Place le robot au départ (pixels de la piste, cap en degrés)"""
+        self.x, self.y = self.to_world(*start_pixel)
+        self.theta = math.radians(heading)
+        self.v_left = self.v_right = 0.0
+        self.t = 0.0
+
+    def to_world(self, px, py):
+        return px * self.scale, (self.height_px - py) * self.scale
+
+    def to_pixel(self, x, y):
+        return x / self.scale, self.height_px - y / self.scale
+
+    def render(self):
+        """Synthétise la vue caméra à la pose courante"""
+        c, s = math.cos(self.theta), math.sin(self.theta)
+        inv = 1.0 / self.scale
+        np.multiply(self._X, c * inv, out=self._map_x)
+        self._map_x -= self._Y * (s * inv)
+        self._map_x += self.x * inv
+        np.multiply(self._X, -s * inv, out=self._map_y)
+        self._map_y -= self._Y * (c * inv)
+        self._map_y += self.height_px - self.y * inv
+        self._map_x[~self._valid] = -1
+        cv2.remap(self.track, self._map_x, self._map_y, cv2.INTER_LINEAR,
+                  dst=self._view, borderMode=cv2.BORDER_CONSTANT,
+                  borderValue=(FLOOR_LEVEL,) * 3)
+        return self._view
+
+    def step(self, left_cmd, right_cmd):
+        """Intègre la cinématique pendant une période de commande"""
+        n = max(1, int(round(self.period / PHYSICS_DT)))
+        dt = self.period / n
+        alpha = dt / (MOTOR_TAU + dt)
+        target_l = _wheel_speed(left_cmd)
+        target_r = _wheel_speed(right_cmd)
+        for _ in range(n):
+            self.v_left += alpha * (target_l - self.v_left)
+            self.v_right += alpha * (target_r - self.v_right)
+            v = 0.5 * (self.v_left + self.v_right)
+            w = (self.v_right - self.v_left) / WHEEL_BASE
+            mid = self.theta + 0.5 * w * dt
+            self.x += v * math.cos(mid) * dt
+            self.y += v * math.sin(mid) * dt
+            self.theta += w * dt
+        self.t += self.period
+
+    def line_following_controller(self, image):
+        """Pipeline réel : détection de la ligne puis calcul des vitesses"""
+        cx, cy, _ = vision.detect_line(image, self.cfg)
+        return steering.compute_steering_command(cx, self.cfg)
+
+    def cross_track_error(self):
+        """Distance (m) entre le centre du robot et la ligne"""
+        px, py = self.to_pixel(self.x, self.y)
+        ix, iy = int(px), int(py)
+        if 0 <= iy < self.distance.shape[0] and 0 <= ix < self.distance.shape[1]:
+            return float(self.distance[iy, ix])
+        return math.inf
+
+    def run(self, duration=60.0, laps=1):
+        """
+        Simule jusqu'à `laps` tours, une sortie de piste ou `duration` secondes
+        Returns: SimResult
+        """
+        start = (self.x, self.y)
+        travelled = 0.0
+        off_since = None
+        lap_times = []
+        errors = []
+        poses = []
+        lost = 0
+        steps = 0
+        wall = time.perf_counter()
+
+        while self.t < duration:
+            left, right = self.controller(self.render())
+            if left == 0 and right == 0:
+                lost += 1
+            x0, y0 = self.x, self.y
+            self.step(left, right)
+            steps += 1
+            travelled += math.hypot(self.x - x0, self.y - y0)
+
+            err = self.cross_track_error()
+            errors.append(err)
+            poses.append((self.t, self.x, self.y, self.theta))
+
+            if err > OFF_TRACK_DISTANCE:
+                off_since = self.t if off_since is None else off_since
+                if self.t - off_since > OFF_TRACK_TIME:
+                    break
+            else:
+                off_since = None
+
+            if travelled > LAP_MIN_DISTANCE and \
+               math.hypot(self.x - start[0], self.y - start[1]) < LAP_RADIUS:
+                lap_times.append(self.t - sum(lap_times))
+                travelled = 0.0
+                if len(lap_times) >= laps:
+                    break
+
+        return SimResult(lap_times, np.array(errors), np.array(poses),
+                         lost / max(steps, 1), self.t, time.perf_counter() - wall,
+                         off_track=off_since is not None)
+
+
+class SimResult:
+    """Résultat d'une simulation"""
+
+    __slots__ = ('lap_times', 'errors', 'poses', 'lost_ratio', 'sim_time',
+                 'wall_time', 'off_track')
+
+    def __init__(self, lap_times, errors, poses, lost_ratio, sim_time, wall_time, off_track):
+        self.lap_times = lap_times
+        self.errors = errors
+        self.poses = poses
+        self.lost_ratio = lost_ratio
+        self.sim_time = sim_time
+        self.wall_time = wall_time
+        self.off_track = off_track
+
+    @property
+    def completed(self):
+        return len(self.lap_times) > 0 and not self.off_track
+
+    @property
+    def mean_error(self):
+        finite = self.errors[np.isfinite(self.errors)]
+        return float(finite.mean()) if finite.size else math.inf
+
+    @property
+    def max_error(self):
+        return float(self.errors.max()) if self.errors.size else math.inf
+
+    @property
+    def speedup(self):
+        return self.sim_time / self.wall_time if self.wall_time > 0 else math.inf
+
+    def summary(self):
+        laps = ", ".join(f"{t:.2f}s" for t in self.lap_times) or "aucun"
+        return (f"Tours: {laps} | erreur moy: {self.mean_error*100:.1f} cm "
+                f"max: {self.max_error*100:.1f} cm | ligne perdue: {self.lost_ratio*100:.0f}% "
+                f"| {'SORTIE DE PISTE' if self.off_track else 'OK'} "
+                f"| {self.sim_time:.1f}s simulées en {self.wall_time:.2f}s (x{self.speedup:.0f})")
+
+
+def geometry_controller(sim, controller):
+    """
+    Fonction de commande du simulateur pour un contrôleur de steering.py :
+    masque, géométrie de la ligne (geometry.py), puis controller.update
+    avec la vitesse réelle du robot (comme l'odométrie)
+    """
+    from geometry import GeometryEstimator
+
+    estimator = GeometryEstimator((sim.resolution[1], sim.resolution[0]))
+
+    def control(image):
+        geo = estimator.from_mask(vision.line_mask(image, sim.cfg))
+        # sans ligne utilisable le robot simulé s'arrête (pas de navigation ici)
+        return controller.update(geo, 0.5 * (sim.v_left + sim.v_right)) or (0, 0)
+    return control
+
+
+def _wheel_speed(cmd):
+    """Vitesse de roue (m/s) pour une commande moteur (-255..255)"""
+    if abs(cmd) < PWM_DEADBAND:
+        return 0.0
+    return SPEED_AT_255 * max(-255, min(255, cmd)) / 255.0
+
+
+def draw_trajectory(sim, result, path):
+    """Enregistre la trajectoire simulée sur l'image de la piste"""
+    out = sim.track.copy()
+    pts = [sim.to_pixel(x, y) for _, x, y, _ in result.poses]
+    pts = np.array(pts, np.int32).reshape(-1, 1, 2)
+    cv2.polylines(out, [pts], False, (0, 0, 255), 2)
+    cv2.imwrite(path, out)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulation du suivi de ligne sur une piste")
+    parser.add_argument('--track', default=TRACK_DEFAULT, help="image de la piste vue de dessus")
+    parser.add_argument('--duration', type=float, default=60.0, help="durée max simulée (s)")
+    parser.add_argument('--laps', type=int, default=1, help="nombre de tours")
+    parser.add_argument('--save', help="image de la trajectoire (png)")
+    parser.add_argument('--profile', help="profil de config.py ou de profils_regles.yaml")
+    parser.add_argument('--config', help="fichier YAML de configuration")
+    parser.add_argument('--controller', choices=sorted(steering.CONTROLLERS),
+                        help="loi de pilotage (par défaut : centroïde et table de config.py)")
+    args = parser.parse_args()
+
+    cfg = config.LineConfig()
+    if args.profile:
+        cfg = config.LineConfig.from_dict(config.available_profiles()[args.profile], cfg)
+    if args.config:
+        cfg = config.LineConfig.from_yaml(args.config, cfg)
+    sim = Simulator(args.track, cfg=cfg)
+    if args.controller:
+        from geometry import CameraModel
+        # la caméra simulée est le montage nominal, pas celle du robot calibrée
+        camera = CameraModel(sim.resolution)
+        sim.controller = geometry_controller(sim, steering.make_controller(args.controller, cfg, camera))
+    result = sim.run(args.duration, args.laps)
+    print(result.summary())
+    if args.save:
+        draw_trajectory(sim, result, args.save)
+        print(f"✓ Trajectoire enregistrée dans {args.save}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+"""
+Asservissement de la vitesse des roues sur le Raspberry Pi
+
+send_motor_command envoie des tensions PWM en boucle ouverte : la même
+BASE_SPEED donne une vitesse réelle différente selon la charge de la
+batterie. Ici la vision commande des vitesses de roues (m/s) et une
+boucle plus rapide que la vision (SPEED_LOOP_FREQUENCY) :
+- mesure la vitesse de chaque roue à partir des compteurs d'encodeurs
+  (question 'N' : la vitesse de SPEED_DUAL_code n'est rafraîchie que
+  toutes les 500 ms par la tâche 2, trop lentement pour la boucle)
+- calcule la tension par une table PWM -> vitesse (anticipation), apprise
+  sur des mesures enregistrées, plus un correcteur PI par roue
+- envoie la commande 'C' à la carte
+
+Calibration de la table (robot sur cales, roues libres) :
+    python3 speed_control.py --calibrate --port /dev/ttyACM0
+Démonstration sur l'émulateur de la carte :
+    python3 speed_control.py --port emul://
+"""
+
+import argparse
+import math
+import os
+import struct
+import threading
+import time
+
+import numpy as np
+
+import config
+from odometry import Odometry, read_encoders
+
+# Tensions PWM de la table
+PWM_LEVELS = np.arange(-255, 256)
+
+
+class FeedForwardTable:
+    """
+    Table PWM -> vitesse de roue (m/s) et sa réciproque
+
+    speeds: tableau (511, 2), vitesse de chaque roue pour PWM_LEVELS
+    """
+
+    def __init__(self, speeds):
+        self.speeds = np.asarray(speeds, dtype=float).reshape(len(PWM_LEVELS), 2)
+
+    @classmethod
+    def fit(cls, pwm, speed):
+        """
+        Apprend la table à partir de mesures enregistrées
+        pwm: tensions appliquées (n, 2)
+        speed: vitesses mesurées (n, 2) en m/s
+        La vitesse médiane est prise pour chaque tension mesurée, puis la
+        table est rendue croissante et interpolée entre les mesures.
+        """
+        pwm = np.asarray(pwm, dtype=int).reshape(-1, 2)
+        speed = np.asarray(speed, dtype=float).reshape(-1, 2)
+        table = np.zeros((len(PWM_LEVELS), 2))
+        for wheel in range(2):
+            levels = np.unique(pwm[:, wheel])
+            medians = np.array([np.median(speed[pwm[:, wheel] == level, wheel])
+                                for level in levels])
+            # la vitesse ne peut que croître avec la tension
+            medians = np.maximum.accumulate(medians)
+            table[:, wheel] = np.interp(PWM_LEVELS, levels, medians)
+        return cls(table)
+
+    @classmethod
+    def load(cls, path=config.SPEED_TABLE_PATH):
+        with np.load(path) as data:
+            return cls(data['speeds'])
+
+    def save(self, path=config.SPEED_TABLE_PATH):
+        np.savez(path, pwm=PWM_LEVELS, speeds=self.speeds)
+
+    def speed(self, pwm):
+        """Vitesses (gauche, droite) attendues pour une commande PWM (gauche, droite)"""
+        pwm = np.clip(np.asarray(pwm, dtype=int), -255, 255)
+        return self.speeds[pwm + 255, [0, 1]]
+
+    def pwm(self, speed):
+        """Commandes PWM (gauche, droite) donnant les vitesses demandées"""
+        out = np.empty(2)
+        for wheel in range(2):
+            curve = self.speeds[:, wheel]
+            if speed[wheel] == 0:
+                out[wheel] = 0
+            elif speed[wheel] > 0:
+                # partie positive de la table, au-delà de la zone morte
+                out[wheel] = np.interp(speed[wheel], curve[255:], PWM_LEVELS[255:])
+                out[wheel] = max(out[wheel], self._deadband(wheel, +1))
+            else:
+                out[wheel] = np.interp(speed[wheel], curve[:256], PWM_LEVELS[:256])
+                out[wheel] = min(out[wheel], -self._deadband(wheel, -1))
+        return out
+
+    def _deadband(self, wheel, sign):
+        # dernière tension pour laquelle la roue ne tourne pas encore
+        curve = self.speeds[255::sign, wheel]
+        moving = np.nonzero(np.abs(curve) > 1e-6)[0]
+        return max(moving[0] - 1, 0) if len(moving) else 0
+
+
+class WheelPI:
+    """Correcteur PI d'une roue, avec anti-emballement de l'intégrale"""
+
+    def __init__(self, kp=config.SPEED_KP, ki=config.SPEED_KI, limit=255):
+        self.kp = kp
+        self.ki = ki
+        self.limit = limit
+        self.integral = 0.0
+
+    def reset(self):
+        self.integral = 0.0
+
+    def update(self, error, feedforward, dt):
+        """Returns: commande PWM bornée à ±limit"""
+        output = feedforward + self.kp * error + self.ki * (self.integral + error * dt)
+        if abs(output) < self.limit or output * error < 0:
+            # on n'intègre pas quand la commande est saturée dans le sens de l'erreur
+            self.integral += error * dt
+        return max(-self.limit, min(self.limit, output))
+
+
+class SpeedController:
+    """
+    Boucle de vitesse des deux roues dans un thread
+
+    arduino: liaison connectée en mode binaire (commode >= 2)
+    lock: verrou des échanges série, partagé avec les autres threads
+          (obstacle.ObstacleMonitor)
+    table: FeedForwardTable ; kp, ki: gains du PI
+    rate: fréquence de la boucle (Hz)
+    """
+
+    def __init__(self, arduino, table, kp=config.SPEED_KP, ki=config.SPEED_KI,
+                 rate=config.SPEED_LOOP_FREQUENCY, filter_time=0.04, lock=None):
+        self.arduino = arduino
+        self.lock = lock or threading.Lock()
+        self.table = table
+        self.pis = (WheelPI(kp, ki), WheelPI(kp, ki))
+        self.period = 1.0 / rate
+        self.filter_time = filter_time
+        self.meters_per_tick = math.pi * config.WHEEL_DIAMETER / config.ENCODER_TICKS_PER_REV
+        self.target = (0.0, 0.0)
+        self.speed = np.zeros(2)
+        self.pwm = np.zeros(2)
+        self.odometry = Odometry()  # pose intégrée à partir des mêmes lectures d'encodeurs
+        self.record = None          # deque où ajouter les lectures (t, enc1, enc2), session_store
+        self._running = False
+        self._thread = None
+        self._last = None
+
+    def set_target(self, left, right):
+        """Vitesses de roues visées (m/s), prises en compte au prochain pas"""
+        self.target = (float(left), float(right))
+
+    def set_command(self, left_pwm, right_pwm):
+        """
+        Consigne exprimée comme une commande PWM (celle de steering.py) :
+        convertie en la vitesse que donne cette commande dans la table
+        """
+        self.set_target(*self.table.speed((int(left_pwm), int(right_pwm))))
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Arrête la boucle et les moteurs"""
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._send(0, 0)
+
+    def _loop(self):
+        next_time = time.monotonic()
+        while self._running:
+            self.step()
+            next_time += self.period
+            delay = next_time - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_time = time.monotonic()        # retard : on ne rattrape pas
+
+    def step(self):
+        """Un pas de la boucle : mesure, correcteur, commande"""
+        with self.lock:
+            sample = read_encoders(self.arduino)
+        if sample is None:
+            return
+        t, enc1, enc2 = sample
+        if self.record is not None:
+            self.record.append(sample)
+        self.odometry.update(t, enc1, enc2)
+        ticks = np.array([enc1, enc2])
+        if self._last is None:
+            self._last = (t, ticks)
+            return
+        dt = t - self._last[0]
+        if dt <= 0:
+            return
+        measured = (ticks - self._last[1]) * self.meters_per_tick / dt
+        self._last = (t, ticks)
+        # filtre passe-bas (quantification des ticks sur une période courte)
+        alpha = dt / (self.filter_time + dt)
+        self.speed += alpha * (measured - self.speed)
+
+        target = np.array(self.target)
+        feedforward = self.table.pwm(target)
+        for wheel in range(2):
+            if target[wheel] == 0:
+                self.pis[wheel].reset()
+                self.pwm[wheel] = 0
+            else:
+                self.pwm[wheel] = self.pis[wheel].update(target[wheel] - self.speed[wheel],
+                                                         feedforward[wheel], dt)
+        self._send(int(round(self.pwm[0])), int(round(self.pwm[1])))
+
+    def _send(self, left, right):
+        with self.lock:
+            self.arduino.write(b'C' + struct.pack('<hhl', left, right, 0))
+            self.arduino.readline()        # acquittement
+
+
+############################################
+# Calibration de la table
+############################################
+
+def calibrate(arduino, levels=range(-255, 256, 15), settle=0.4, measure=0.6,
+              rate=config.SPEED_LOOP_FREQUENCY, sleep=time.sleep):
+    """
+    Applique une suite de tensions et enregistre les vitesses atteintes
+    Returns: (pwm, speed) à donner à FeedForwardTable.fit
+    """
+    meters_per_tick = math.pi * config.WHEEL_DIAMETER / config.ENCODER_TICKS_PER_REV
+    pwm, speed = [], []
+    for level in levels:
+        arduino.write(b'C' + struct.pack('<hhl', level, level, 0))
+        arduino.readline()
+        sleep(settle)
+        last = read_encoders(arduino)
+        samples = []
+        for _ in range(int(measure * rate)):
+            sleep(1.0 / rate)
+            sample = read_encoders(arduino)
+            if sample is None:
+                # réponse incomplète : la liaison est vidée, on repart de la lecture suivante
+                arduino.reset_input_buffer()
+                last = None
+                continue
+            if last is not None and sample[0] > last[0]:
+                (t0, a0, b0), (t1, a1, b1) = last, sample
+                samples.append(((a1 - a0) / (t1 - t0), (b1 - b0) / (t1 - t0)))
+            last = sample
+        if not samples:
+            print(f"  PWM {level:4d} -> pas de mesure (la carte ne répond pas)")
+            continue
+        for sample in samples:
+            pwm.append((level, level))
+            speed.append(np.array(sample) * meters_per_tick)
+        print(f"  PWM {level:4d} -> {np.mean(samples, axis=0) * meters_per_tick} m/s")
+    arduino.write(b'C' + struct.pack('<hhl', 0, 0, 0))
+    arduino.readline()
+    return np.array(pwm), np.array(speed)
+
+
+def table_for(arduino):
+    """
+    Table PWM -> vitesse pour une liaison en mode binaire : celle de
+    config.SPEED_TABLE_PATH, ou apprise à la volée sur l'émulateur de la carte
+    Returns: FeedForwardTable, ou None sans table enregistrée
+    """
+    if os.path.exists(config.SPEED_TABLE_PATH):
+        return FeedForwardTable.load()
+    if getattr(arduino, 'emulator', None) is None:
+        return None
+    print("Calibration de la table PWM -> vitesse sur l'émulateur...")
+    return FeedForwardTable.fit(*calibrate(arduino, range(-255, 256, 30), settle=0.3, measure=0.3))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Asservissement de vitesse des roues")
+    parser.add_argument('--port', default=config.ARDUINO_PORT,
+                        help="port série de l'Arduino ('emul://' pour l'émulateur)")
+    parser.add_argument('--calibrate', action='store_true',
+                        help=f"apprend la table PWM -> vitesse ({config.SPEED_TABLE_PATH})")
+    parser.add_argument('--speed', type=float, default=0.3, help="vitesse de démonstration (m/s)")
+    args = parser.parse_args()
+
+    from serial_protocol import open_serial
+    arduino = open_serial(args.port, baudrate=config.ARDUINO_BAUDRATE, timeout=config.ARDUINO_TIMEOUT)
+    emulated = args.port.startswith('emul://')
+    if not emulated:
+        time.sleep(2)            # initialisation de la carte
+    arduino.write(b'A12')        # acquittement OK, réponses binaires
+    print(arduino.readline().decode().strip())
+
+    try:
+        if args.calibrate or emulated:
+            print("Calibration de la table PWM -> vitesse...")
+            levels = range(-255, 256, 15 if args.calibrate else 30)
+            table = FeedForwardTable.fit(*calibrate(arduino, levels, settle=0.3, measure=0.3))
+            if args.calibrate:
+                table.save()
+                print(f"✓ Table enregistrée dans {config.SPEED_TABLE_PATH}")
+        else:
+            table = FeedForwardTable.load()
+
+        controller = SpeedController(arduino, table).start()
+        steps = [(args.speed, args.speed), (args.speed, args.speed / 2), (0.0, 0.0)]
+        for charge in ((1.0, 0.8) if emulated else (1.0,)):
+            if emulated:
+                arduino.emulator.battery = charge
+                print(f"\nBatterie à {charge*100:.0f}%")
+            for left, right in steps:
+                controller.set_target(left, right)
+                time.sleep(1.5)
+                print(f"  consigne {left:.2f} {right:.2f} m/s -> mesure "
+                      f"{controller.speed[0]:.2f} {controller.speed[1]:.2f} m/s "
+                      f"(PWM {controller.pwm[0]:.0f} {controller.pwm[1]:.0f})")
+        controller.stop()
+    except KeyboardInterrupt:
+        print("\nArrêt demandé par l'utilisateur")
+    finally:
+        arduino.write(b'a')
+        arduino.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Temps de démarrage des scripts du robot
+
+Chaque point d'entrée est importé dans un nouvel interpréteur (comme au
+lancement d'un script) ; on mesure :
+- la durée de l'import du module, et les modules lourds qu'il a chargés
+  (ils ne doivent l'être qu'au moment où on s'en sert)
+- pour les scripts qui pilotent la carte, la durée jusqu'à ce que le
+  robot soit prêt à rouler : import puis connexion à l'émulateur de la
+  carte ('emul://', arduino_emulator.py)
+
+Usage:
+    python3 startup_time.py [--repeat 5] [--port emul://]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+READY_BUDGET = 1.0          # le robot doit être prêt à rouler en moins d'une seconde (s)
+
+HEAVY_MODULES = ('cv2', 'matplotlib', 'picamera', 'zmq', 'multiprocessing', 'serial')
+
+# (répertoire, module, instructions exécutées après l'import jusqu'à « prêt » ; {port})
+ENTRY_POINTS = [
+    ('basic_motion', 'dialogue', "m.disconnect_arduino(m.connect_arduino({port!r}))"),
+    ('basic_motion', 'test_moteurs',
+     "link, rep = m.connect({port!r}, b'A22'); assert rep; link.close()"),
+    ('basic_motion', 'demo', None),
+    ('basic_motion', 'visualize_system', None),
+    ('basic_motion', 'speed_control', None),
+    ('basic_motion', 'simulation', None),
+    ('basic_image_processing', 'perception_students', None),
+    ('basic_image_processing', 'batch_process', None),
+    ('basic_infrastructure', 'robot', None),
+    ('basic_infrastructure', 'control', None),
+]
+
+PROBE = """
+import sys, time, json
+start = time.perf_counter()
+import {module} as m
+imported = time.perf_counter() - start
+ready = None
+if {ready!r}:
+    exec({ready!r})
+    ready = time.perf_counter() - start
+print(json.dumps({{'import': imported, 'ready': ready,
+                  'heavy': [name for name in {heavy!r} if name in sys.modules]}}))
+"""
+
+
+def measure(directory, module, ready=None, port='emul://'):
+    """
+    Démarrage d'un point d'entrée dans un nouvel interpréteur
+    Returns: {'import': s, 'ready': s ou None, 'heavy': [modules]}
+             ou None si le module ne s'importe pas ici (dépendance absente)
+    """
+    code = PROBE.format(module=module, ready=ready.format(port=port) if ready else None,
+                        heavy=HEAVY_MODULES)
+    cmd = [sys.executable, '-c', code]
+    result = subprocess.run(cmd, cwd=os.path.join(ROOT, directory), capture_output=True, text=True)
+    if result.returncode != 0:
+        return None
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Temps de démarrage des points d'entrée")
+    parser.add_argument('--repeat', type=int, default=3, help="mesures par script (on garde la meilleure)")
+    parser.add_argument('--port', default='emul://', help="liaison utilisée pour la connexion")
+    args = parser.parse_args()
+
+    print(f"{'script':46s} {'import':>9s} {'prêt':>9s}  modules lourds chargés")
+    late = []
+    for directory, module, ready in ENTRY_POINTS:
+        samples = [measure(directory, module, ready, args.port) for _ in range(args.repeat)]
+        samples = [s for s in samples if s is not None]
+        name = f"{directory}/{module}.py"
+        if not samples:
+            print(f"{name:46s} {'—':>9s} {'—':>9s}  (ne s'importe pas ici)")
+            continue
+        best = min(samples, key=lambda s: s['ready'] if s['ready'] is not None else s['import'])
+        ready_ms = f"{best['ready'] * 1000:7.0f}ms" if best['ready'] is not None else f"{'':9s}"
+        print(f"{name:46s} {best['import'] * 1000:7.0f}ms {ready_ms}  {', '.join(best['heavy']) or '-'}")
+        if best['ready'] is not None and best['ready'] > READY_BUDGET:
+            late.append(name)
+
+    if late:
+        print(f"✗ Prêts en plus de {READY_BUDGET:.1f} s : {', '.join(late)}")
+    else:
+        print(f"✓ Scripts de pilotage prêts en moins de {READY_BUDGET:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+"""
+Calcul des commandes moteur à partir de la position de la ligne
+
+La loi de commande (zone morte, correction proportionnelle, vitesse
+minimale) est précalculée dans cfg.speed_table : une commande est une
+simple lecture de table indexée par la colonne du centroïde.
+
+Les contrôleurs (make_controller) utilisent la géométrie de la ligne
+(geometry.py) : poursuite pure d'un point d'anticipation ou contrôleur
+de Stanley, en mètres au sol, avec une vitesse réduite seulement
+quand la courbure de la ligne l'exige (SpeedScheduler). Les distances
+d'image des points utilisés sont calculées à la création : chaque
+commande ne coûte que quelques opérations sur des flottants.
+"""
+
+import abc
+import math
+
+import config
+
+
+def compute_steering_command(cx, cfg):
+    """
+    Calcule la commande de direction basée sur la position du centroïde
+    Returns: (left_speed, right_speed) - (0, 0) si aucune ligne détectée
+    """
+    if cx is None:
+        return 0, 0
+    table = cfg.speed_table
+    left_speed, right_speed = table[min(max(int(cx), 0), len(table) - 1)]
+    return int(left_speed), int(right_speed)
+
+
+def describe(cx, left_speed, right_speed, cfg):
+    """Texte décrivant la commande (console et image de debug)"""
+    if cx is None:
+        return "Aucune ligne détectée - ARRÊT"
+    error = cx - cfg.camera_resolution[0] / 2
+    if abs(error) < cfg.dead_zone:
+        return f"Ligne centrée | L:{left_speed} R:{right_speed}"
+    if error < 0:
+        return f"Tourne GAUCHE (err:{error:.1f}) | L:{left_speed} R:{right_speed}"
+    return f"Tourne DROITE (err:{error:.1f}) | L:{left_speed} R:{right_speed}"
+
+
+############################################
+# Contrôleurs à partir de la géométrie de la ligne
+############################################
+
+class SpeedScheduler:
+    """
+    Vitesse d'avance selon la courbure de la ligne devant le robot
+
+    La vitesse de base n'est réduite que si la courbure l'exige :
+    v² × courbure <= max_lateral_accel, sans descendre sous min_speed.
+    """
+
+    def __init__(self, cfg, max_lateral_accel=config.MAX_LATERAL_ACCEL,
+                 speed_at_255=config.WHEEL_SPEED_AT_255):
+        self.base_speed = cfg.base_speed
+        self.min_speed = cfg.min_speed
+        self.max_lateral_accel = max_lateral_accel
+        self.pwm_per_mps = 255.0 / speed_at_255
+
+    def speed(self, curvature):
+        """Commande d'avance (0-255) pour une courbure (1/m)"""
+        curvature = abs(curvature)
+        if curvature < 1e-6:
+            return self.base_speed
+        limit = math.sqrt(self.max_lateral_accel / curvature) * self.pwm_per_mps
+        return max(self.min_speed, min(self.base_speed, limit))
+
+
+class Controller(abc.ABC):
+    """
+    Interface des lois de pilotage
+
+    update(geometry, speed) -> (left_speed, right_speed), commandes -255..255,
+    ou None si la ligne n'est pas utilisable (pas vue, point visé hors du
+    sol) : la navigation (navigation.Navigator) passe alors en recherche
+    geometry: geometry.LineGeometry de l'image, None si la ligne n'est pas vue
+    speed: vitesse d'avance mesurée (m/s, odométrie) ou None
+    """
+
+    @abc.abstractmethod
+    def update(self, geometry, speed=None):
+        """Returns: (left_speed, right_speed) ou None"""
+
+    def reset(self):
+        pass
+
+
+class TableController(Controller):
+    """Loi historique : table précalculée indexée par la colonne du bas de la ligne"""
+
+    def __init__(self, cfg):
+        self.cfg = cfg
+
+    def update(self, geometry, speed=None):
+        if geometry is None:
+            return None
+        return compute_steering_command(geometry.offset + self.cfg.camera_resolution[0] / 2,
+                                        self.cfg)
+
+
+class _GroundController(Controller):
+    """
+    Base des contrôleurs géométriques : points de la ligne au sol
+
+    camera: geometry.CameraModel ou rectification.Rectifier ; les distances
+    d'image des points utilisés sont calculées une fois ici
+    """
+
+    def __init__(self, cfg, camera, lookahead, scheduler=None,
+                 wheel_base=config.WHEEL_BASE, speed_at_255=config.WHEEL_SPEED_AT_255):
+        self.cfg = cfg
+        self.camera = camera
+        self.scheduler = scheduler or SpeedScheduler(cfg, speed_at_255=speed_at_255)
+        self.half_base = wheel_base / 2
+        self.mps_per_pwm = speed_at_255 / 255.0
+        self.near_depth = 0.0                               # bas de l'image
+        self.far_depth = camera.depth_for(lookahead)
+        self.last_speed = 0.0                               # dernière commande d'avance
+
+    def path_curvature(self, geometry):
+        """Courbure au sol (1/m, > 0 à gauche) du cercle passant par trois points de la ligne"""
+        far = min(self.far_depth, geometry.depth)
+        p0 = self.camera.line_point(geometry, self.near_depth)
+        p1 = self.camera.line_point(geometry, 0.5 * far)
+        p2 = self.camera.line_point(geometry, far)
+        if p0 is None or p1 is None or p2 is None:
+            return 0.0
+        (x0, y0), (x1, y1), (x2, y2) = p0, p1, p2
+        cross = (x1 - x0) * (y2 - y0) - (y1 - y0) * (x2 - x0)
+        a = math.hypot(x1 - x0, y1 - y0)
+        b = math.hypot(x2 - x1, y2 - y1)
+        c = math.hypot(x2 - x0, y2 - y0)
+        if a * b * c < 1e-9:
+            return 0.0
+        return 2 * cross / (a * b * c)
+
+    def wheels(self, forward, curvature):
+        """Commandes des roues pour une avance (0-255) et une courbure de trajectoire (1/m, > 0 à gauche)"""
+        left = forward * (1 - curvature * self.half_base)
+        right = forward * (1 + curvature * self.half_base)
+        peak = max(abs(left), abs(right))
+        if peak > 255:
+            left, right = left * 255 / peak, right * 255 / peak
+        self.last_speed = forward
+        return int(round(left)), int(round(right))
+
+    def _speed(self, speed):
+        return self.last_speed * self.mps_per_pwm if speed is None else speed
+
+
+class PurePursuitController(_GroundController):
+    """
+    Poursuite pure : arc de cercle passant par le point de la ligne situé
+    à `lookahead` m devant (courbure 2 y / L²)
+    """
+
+    def __init__(self, cfg, camera, lookahead=config.PURSUIT_LOOKAHEAD, scheduler=None, **kwargs):
+        super().__init__(cfg, camera, lookahead, scheduler, **kwargs)
+
+    def update(self, geometry, speed=None):
+        if geometry is None:
+            return None
+        target = self.camera.line_point(geometry, min(self.far_depth, geometry.depth))
+        if target is None:
+            return None                 # point visé au-dessus de l'horizon
+        x, y = target
+        curvature = 2 * y / (x * x + y * y)
+        return self.wheels(self.scheduler.speed(self.path_curvature(geometry)), curvature)
+
+
+class StanleyController(_GroundController):
+    """
+    Contrôleur de Stanley : angle de braquage = écart de cap de la ligne
+    + atan(gain × écart latéral / (softening + vitesse)), au point de la
+    ligne le plus proche vu par la caméra, converti en courbure de trajectoire
+
+    Le point de référence P (bas de l'image, à d = near[0] devant l'axe
+    des roues) joue le rôle de l'essieu avant du modèle bicyclette de
+    Stanley. Pour un robot différentiel d'avance v et de rotation ω, P se
+    déplace à (v, ω d) dans le repère du robot : pour que P suive la
+    direction de braquage δ il faut ω d / v = tan δ, soit une courbure
+    tan δ / d, la loi bicyclette d'empattement d.
+    """
+
+    def __init__(self, cfg, camera, gain=config.STANLEY_GAIN, softening=config.STANLEY_SOFTENING,
+                 lookahead=config.PURSUIT_LOOKAHEAD, scheduler=None, **kwargs):
+        super().__init__(cfg, camera, lookahead, scheduler, **kwargs)
+        self.gain = gain
+        self.softening = softening
+        # tangente de la ligne mesurée entre le bas de l'image et 5 cm plus loin
+        w, h = cfg.camera_resolution
+        self.tangent_depth = camera.depth_for(camera.to_ground(w / 2, h - 1)[0] + 0.05)
+
+    def update(self, geometry, speed=None):
+        if geometry is None:
+            return None
+        near = self.camera.line_point(geometry, self.near_depth)
+        ahead = self.camera.line_point(geometry, min(self.tangent_depth, geometry.depth))
+        if near is None or ahead is None or ahead[0] <= near[0]:
+            return None                 # tangente de la ligne non mesurable
+        heading = math.atan2(ahead[1] - near[1], ahead[0] - near[0])
+        steer = heading + math.atan2(self.gain * near[1], self.softening + abs(self._speed(speed)))
+        steer = max(-1.2, min(1.2, steer))
+        curvature = math.tan(steer) / near[0]          # tan δ / d, voir la docstring
+        return self.wheels(self.scheduler.speed(self.path_curvature(geometry)), curvature)
+
+
+CONTROLLERS = {'table': TableController, 'pursuit': PurePursuitController,
+               'stanley': StanleyController}
+
+
+def make_controller(name, cfg, camera=None):
+    """
+    Contrôleur de CONTROLLERS ; camera par défaut : rectification calibrée
+    (rectification.py), ou modèle nominal (geometry.CameraModel) sans calibration
+    """
+    if name == 'table':
+        return TableController(cfg)
+    if camera is None:
+        from rectification import load_camera
+        camera = load_camera(cfg.camera_resolution)
+    return CONTROLLERS[name](cfg, camera)
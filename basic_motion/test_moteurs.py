@@ -5,11 +5,14 @@
 #
 #########################################################################
 
-import serial 
+import sys
 import time
-import numpy as np
 import struct
 
+from serial_protocol import connect
+
+arduino = None      # liaison avec la carte, ouverte par main()
+
 
 def read_i16(f):
     return struct.unpack('<h', bytearray(f.read(2)))[0]
@@ -142,13 +145,17 @@ def TestMoteur():
         print("Le vehicule démarre")
         carAdvance(180,180)
         
+        import numpy as np
+        from odometry import Odometry
+        odo = Odometry()
         vit1=1
         vit2=1
         while ((vit1!=0) or (vit2!=0)):
             time.sleep(0.5)
             tim,tim2,ir,dum1 = recupCmdi(b'R')
             enc1,enc2 = recupCmdl(b'N') 
-            print(enc1,enc2,ir) ;
+            x,y,cap = odo.update(time.monotonic(), enc1, enc2)
+            print(enc1,enc2,ir, "x=%.2f y=%.2f cap=%.0f°" % (x, y, np.degrees(cap))) ;
             vit1,vit2,dum1,dum2 = recupCmdi(b'T')
         print("Un obstacle a été détecté")
 
@@ -157,30 +164,30 @@ def TestMoteur():
 # Programme principal
 ############################################
 
-############################################################
-# initialisation de la liaison série connection à l'arduino
-
-arduino = serial.Serial(port='/dev/ttyACM0', baudrate=115200, timeout=0.1)
-
-rep=' '   # on vide la liaison série
-while rep!=b'':
-  rep = arduino.readline()
-print ("Connection à l'arduino")
+def main(argv=sys.argv):
+    global arduino
+    ############################################################
+    # initialisation de la liaison série connection à l'arduino
 
-time.sleep(2)         # on attend 2s pour que la carte soit initialisée
+    # port en argument (par ex. 'emul://' pour l'émulateur de la carte)
+    port = argv[1] if len(argv) > 1 else '/dev/ttyACM0'
+    print ("Connection à l'arduino")
 
-arduino.write(b'A22')       # demande de connection avec acquitement par OK
-rep = arduino.readline()
-if rep.split()[0]==b'OK':
-    arduino.write(b'I0')
-    AttAcquit()
-    print(rep.decode()) 
-    TestMoteur()
+    # demande de connection avec acquitement par OK, renvoyée jusqu'à ce que la carte soit initialisée
+    arduino, rep = connect(port, b'A22', baudrate=115200, timeout=0.1)
+    if rep.split()[:1]==[b'OK']:
+        arduino.write(b'I0')
+        AttAcquit()
+        print(rep.decode()) 
+        TestMoteur()
   
-#######################################
-#   deconnection de l'arduino
+    #######################################
+    #   deconnection de l'arduino
+
+    arduino.write(b'a')     # deconnection de la carte
+    arduino.close()         # fermeture de la liaison série
+    print ("Fin de programme")
 
-arduino.write(b'a')     # deconnection de la carte
-arduino.close()         # fermeture de la liaison série
-print ("Fin de programme")
 
+if __name__ == "__main__":
+    main()
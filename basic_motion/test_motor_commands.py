@@ -4,10 +4,14 @@ Script de test pour vérifier l'envoi des commandes moteur
 Compatible avec le protocole binaire de serial_link.ino
 """
 
+import argparse
 import serial
 import time
 import struct
 
+import config
+from serial_protocol import open_serial
+
 
 def write_i16(f, value):
     """Écrit un entier 16 bits (int16) au format little-endian"""
@@ -124,27 +128,29 @@ def manual_control(arduino):
         stop_motors(arduino)
 
 
-def main():
-    """Fonction principale"""
+def main(port=config.ARDUINO_PORT):
+    """
+    Fonction principale
+    port: port série de l'Arduino, ou 'emul://' pour l'émulateur de la carte
+    """
     print("\n" + "="*60)
     print("TEST DES COMMANDES MOTEUR")
     print("Protocole binaire - serial_link.ino")
     print("="*60)
     
     # Configuration du port série
-    port = '/dev/ttyACM0'
-    baudrate = 115200
+    baudrate = config.ARDUINO_BAUDRATE
     
     print(f"\nConnexion à {port} ({baudrate} bauds)...")
     
     try:
-        arduino = serial.Serial(port=port, baudrate=baudrate, timeout=0.1)
+        arduino = open_serial(port, baudrate=baudrate, timeout=config.ARDUINO_TIMEOUT)
         print("✓ Connexion établie")
         time.sleep(2)  # Attente initialisation Arduino
         
         # Connexion au protocole
         print("\nInitialisation du protocole...")
-        arduino.write(b'A20')
+        arduino.write(b'A22')   # commandes binaires, acquittement complet
         time.sleep(0.1)
         rep = arduino.readline()
         
@@ -212,8 +218,12 @@ def main():
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Test des commandes moteur")
+    parser.add_argument('--port', default=config.ARDUINO_PORT,
+                        help="port série de l'Arduino ('emul://' pour l'émulateur)")
+    args = parser.parse_args()
     try:
-        main()
+        main(args.port)
     except KeyboardInterrupt:
         print("\n\n✓ Programme interrompu par l'utilisateur")
     
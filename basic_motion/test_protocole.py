@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+Test de conformité du protocole série de serial_link.ino (sans Arduino)
+
+Les commandes encodées par serial_protocol.py sont envoyées au modèle du
+décodeur non bloquant de la carte, découpées en morceaux quelconques et
+avec le temps de transmission à 115200 bauds. On vérifie que :
+- chaque commande est décodée avec les bons paramètres, dans tous les modes
+- une commande binaire est exécutée dès son dernier octet (aucune attente)
+- une commande ASCII sans fin de ligne est exécutée après ASCII_GAP_US
+- une trame binaire tronquée est abandonnée (ER) puis la liaison se resynchronise
+puis on rejoue les commandes principales sur l'émulateur de la carte
+(arduino_emulator.py) : réponses, encodeurs, obstacle "OB" et latence.
+"""
+
+import random
+import struct
+import sys
+
+from arduino_emulator import IR_OBSTACLE, EmulatedSerial, byte_time
+
+from serial_protocol import (ASCII_GAP_US, FRAME_TIMEOUT_US, REPLY_FORMATS, CommandParser,
+                             connect_command, decode_values, encode_command)
+
+BYTE_US = 10 * 1e6 / 115200      # 1 start + 8 bits + 1 stop
+
+COMMANDS = [
+    ('C', (100, -50)),
+    ('C', (-255, 255)),
+    ('D', (80, 60, 5)),
+    ('G', (90,)),
+    ('B', ()),
+    ('c', ('2', -120)),
+    ('I', ('1',)),
+    ('O', ('1',)),
+    ('N', ()),
+    ('T', ()),
+    ('R', ()),
+    ('P', ()),
+]
+
+results = []
+
+
+def check(name, ok, detail=""):
+    results.append(ok)
+    print(f"  {'✓' if ok else '✗'} {name}" + (f" ({detail})" if detail and not ok else ""))
+
+
+def send(parser, data, now, rng=None):
+    """
+    Envoie les octets un par un à 115200 bauds, en appelant le décodeur
+    après des morceaux de taille aléatoire (comme loop() sur la carte)
+    Returns: (commandes, date de décodage de chacune, date de fin)
+    """
+    out, dates = [], []
+    i = 0
+    while i < len(data):
+        n = rng.randint(1, 6) if rng else len(data)
+        chunk = data[i:i + n]
+        i += len(chunk)
+        now += len(chunk) * BYTE_US
+        got = parser.feed(chunk, now)
+        out += got
+        dates += [now] * len(got)
+    return out, dates, now
+
+
+def expected_values(cmd, values):
+    """Valeurs attendues après décodage (paramètres manquants à 0)"""
+    payload = encode_command(cmd, *values, commode=2)[1:]
+    return decode_values(cmd, payload)
+
+
+def parse_ascii(cmd, payload):
+    """Lecture des paramètres ASCII comme GetChar / ParseAscii"""
+    text = payload.decode().strip()
+    if cmd in ('c', 'I', 'O', 'i', 'o'):
+        char, rest = text[:1].encode() or b'0', text[1:]
+        nums = [int(v) for v in rest.split()]
+        return (char,) + tuple(nums)
+    return tuple(int(v) for v in text.split())
+
+
+def check_mode(commode, rng):
+    print(f"\nMode {commode} :")
+    parser = CommandParser()
+    now = 0.0
+    got, _, now = send(parser, connect_command(2, commode), now)
+    check("connexion", parser.connected and parser.commode == commode and got[0][0] == 'A')
+
+    for cmd, values in COMMANDS:
+        data = encode_command(cmd, *values, commode=commode)
+        got, dates, now = send(parser, data, now, rng)
+        ok = len(got) == 1 and got[0][0] == cmd
+        if ok and commode:
+            decoded = decode_values(cmd, got[0][1])
+            ok = decoded == expected_values(cmd, values)
+            # décodé dès le dernier octet reçu
+            ok = ok and dates[0] == now
+        elif ok:
+            ok = parse_ascii(cmd, got[0][1])[:len(values)] == tuple(
+                v.encode() if isinstance(v, str) else v for v in values)
+        check(f"commande {cmd} {values}", ok, got)
+        now += rng.uniform(0, 500)
+
+
+def check_ascii_without_newline():
+    print("\nASCII sans fin de ligne :")
+    parser = CommandParser()
+    send(parser, connect_command(2, 0), 0.0)
+    got, _, now = send(parser, b'C 100 100', 1000.0)
+    check("pas de décodage avant le silence", got == [])
+    got = parser.poll(now + ASCII_GAP_US / 2)
+    check("toujours en attente à ASCII_GAP_US/2", got == [])
+    got = parser.poll(now + ASCII_GAP_US + 1)
+    check("décodé après ASCII_GAP_US", len(got) == 1 and got[0][0] == 'C')
+
+
+def check_truncated_frame():
+    print("\nTrame tronquée :")
+    for commode in (2, 3):
+        parser = CommandParser()
+        send(parser, connect_command(2, commode), 0.0)
+        frame = encode_command('C', 10, 20, commode=commode)
+        got, _, now = send(parser, frame[:4], 1000.0)
+        check(f"mode {commode} : attente de la suite", got == [])
+        got = parser.poll(now + FRAME_TIMEOUT_US + 1)
+        check(f"mode {commode} : trame abandonnée (ER)", got == [('ER', b'')])
+        got, _, now = send(parser, frame, now + FRAME_TIMEOUT_US + 2)
+        check(f"mode {commode} : resynchronisation",
+              len(got) == 1 and decode_values('C', got[0][1])[:2] == (10, 20))
+
+
+def check_burst():
+    print("\nRafale de commandes :")
+    parser = CommandParser()
+    send(parser, connect_command(2, 3), 0.0)
+    data = b''.join(encode_command('C', i, -i, commode=3) for i in range(20))
+    got = []
+    now = 1000.0
+    # le buffer de la carte fait 32 octets : on lit au fil de l'eau
+    for i in range(0, len(data), 16):
+        out, _, now = send(parser, data[i:i + 16], now)
+        got += out
+    check("20 commandes décodées dans l'ordre",
+          [decode_values('C', p)[0] for _, p in got] == list(range(20)))
+
+
+def check_emulator(commode):
+    print(f"\nÉmulateur, mode {commode} :")
+    link = EmulatedSerial(timeout=0.1, realtime=False)
+
+    def query(cmd, *values):
+        link.write(encode_command(cmd, *values, commode=commode))
+        if commode >= 2:
+            fmt = REPLY_FORMATS[cmd]
+            return struct.unpack(fmt, link.read(struct.calcsize(fmt)))
+        return tuple(int(v) for v in link.readline().split())
+
+    link.write(connect_command(1, commode))
+    check("connexion acquittée", link.readline() == b'OK\r\n')
+
+    start = link.clock()
+    link.write(encode_command('C', 150, -150, commode=commode))
+    ack = link.readline()
+    sent = len(encode_command('C', 150, -150, commode=commode))
+    # commande + acquittement transmis sans attente côté carte
+    expected = (sent + len(ack)) * byte_time()
+    latency = link.clock() - start
+    check("commande C acquittée sans délai", ack == b'OK\r\n' and latency < expected + 1e-4,
+          f"{latency*1000:.2f} ms")
+    check("question T", query('T')[:2] == (150, -150))
+
+    link.sleep(1.0)
+    enc1, enc2 = query('N')[:2]
+    check("encodeurs intégrés", enc1 > 0 and enc2 < 0, (enc1, enc2))
+    speed = query('P')[:2]
+    check("vitesse (tâche 2)", speed[0] > 0 and speed[1] < 0, speed)
+
+    link.emulator.ir_value = IR_OBSTACLE + 100
+    link.write(encode_command('I', '1', commode=commode))
+    link.readline()
+    link.sleep(0.25)
+    link.write(encode_command('C', 100, 100, commode=commode))
+    check("obstacle : réponse OB", link.readline() == b'OB\r\n')
+    check("obstacle : moteurs arrêtés", link.emulator.pwm1 == link.emulator.pwm2 == 0)
+
+    link.write(b'a')
+    check("déconnexion", link.readline().startswith(b'OK Arduino deconnecte'))
+
+
+############################################
+# Points d'entrée pytest (le script reste utilisable seul)
+############################################
+
+def _passed(check_fn, *args):
+    start = len(results)
+    check_fn(*args)
+    return all(results[start:])
+
+
+def test_modes():
+    rng = random.Random(0)
+    assert all([_passed(check_mode, commode, rng) for commode in (0, 1, 2, 3)])
+
+
+def test_decoder_timing():
+    assert all([_passed(check_ascii_without_newline), _passed(check_truncated_frame),
+                _passed(check_burst)])
+
+
+def test_emulator_modes():
+    assert all([_passed(check_emulator, commode) for commode in (0, 2, 3)])
+
+
+def main():
+    print("="*60)
+    print("TEST DE CONFORMITÉ DU PROTOCOLE SÉRIE")
+    print("="*60)
+    rng = random.Random(0)
+    for commode in (0, 1, 2, 3):
+        check_mode(commode, rng)
+    check_ascii_without_newline()
+    check_truncated_frame()
+    check_burst()
+    for commode in (0, 2, 3):
+        check_emulator(commode)
+
+    print("\n" + "="*60)
+    print(f"{sum(results)}/{len(results)} vérifications réussies")
+    print("="*60)
+    return 0 if all(results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
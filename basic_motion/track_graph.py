@@ -0,0 +1,643 @@
+"""
+Graphe de la piste et choix de la branche aux intersections
+
+La piste vue de dessus (simulink/huit.jpg) est réduite à un graphe :
+- squelette de la ligne blanche (amincissement de Zhang-Suen)
+- nœuds : intersections (pixels du squelette à 3 voisins ou plus,
+  regroupés) et extrémités
+- arêtes : tronçons de ligne entre deux nœuds, avec leur longueur et
+  leur temps de parcours (vitesse limitée par la courbure, comme
+  steering.SpeedScheduler) ; chaque extrémité d'arête est une « porte »
+  du nœud, avec sa direction
+- obstacles : taches rouges de l'image (simulink/huit_obstacle.jpg),
+  rattachées à l'arête la plus proche, qui est alors bloquée
+
+Les routes les plus rapides sont précalculées (Dijkstra à rebours sur
+les arêtes orientées, avec une pénalité de virage à chaque nœud) pour
+chaque destination et chaque ensemble d'arêtes bloquées envisagé (aucune,
+chacune seule, celles des obstacles de l'image). En fonctionnement, le
+choix de la branche à une intersection est une lecture de table :
+plan[bloquées][destination][arête orientée] -> (arête suivante, branche).
+Sans destination (tour de piste), la branche tout droit est prise si
+elle n'est pas bloquée, sinon la moins chère.
+
+Le graphe et les tables sont gardés en cache (config.TRACK_GRAPH_CACHE),
+indexés par le contenu de l'image.
+
+RouteFollower rattache les intersections détectées par la vision aux
+nœuds du graphe : la distance parcourue (odométrie) depuis l'entrée sur
+l'arête courante doit correspondre à sa longueur, à
+INTERSECTION_AHEAD près (le croisement est vu avant d'y arriver) et à
+ROUTE_TOLERANCE près. Sa méthode decide sert de navigation.Navigator.decide.
+
+Usage:
+    python3 track_graph.py                          # graphe et routes de huit.jpg
+    python3 track_graph.py ../simulink/huit_obstacle.jpg
+    python3 track_graph.py --check                  # intersections sur la simulation
+"""
+
+import hashlib
+import heapq
+import json
+import math
+import os
+
+import cv2
+import numpy as np
+
+import config
+from simulation import TRACK_DEFAULT, TRACK_SCALE
+
+NODE_RADIUS = 12            # rayon (pixels) d'un nœud : les pixels de jonction voisins sont regroupés
+PORT_LENGTH = 20            # longueur (pixels) d'arête qui donne la direction d'une porte
+MIN_EDGE_PIXELS = 15        # tronçons plus courts ignorés (barbules du squelette)
+STRAIGHT_ANGLE = math.radians(35)       # écart de cap en dessous duquel une branche est « tout droit »
+OBSTACLE_RADIUS = 30        # distance max (pixels) entre une tache rouge et l'arête bloquée
+RESAMPLE = 5                # pas (pixels) du calcul de courbure
+SMOOTH_WINDOW = 9           # pixels moyennés le long du squelette
+
+
+############################################
+# Image -> graphe
+############################################
+
+def thin(mask):
+    """Squelette d'un masque binaire (Zhang-Suen, vectorisé)"""
+    img = np.pad((mask > 0).astype(np.uint8), 1)
+    while True:
+        changed = False
+        for step in (0, 1):
+            p2, p3, p4 = img[:-2, 1:-1], img[:-2, 2:], img[1:-1, 2:]
+            p5, p6, p7 = img[2:, 2:], img[2:, 1:-1], img[2:, :-2]
+            p8, p9 = img[1:-1, :-2], img[:-2, :-2]
+            ring = (p2, p3, p4, p5, p6, p7, p8, p9, p2)
+            count = sum(ring[:8])
+            transitions = sum((ring[k] == 0) & (ring[k + 1] == 1) for k in range(8))
+            if step == 0:
+                side = (p2 * p4 * p6 == 0) & (p4 * p6 * p8 == 0)
+            else:
+                side = (p2 * p4 * p8 == 0) & (p2 * p6 * p8 == 0)
+            remove = (img[1:-1, 1:-1] == 1) & (count >= 2) & (count <= 6) & (transitions == 1) & side
+            if remove.any():
+                img[1:-1, 1:-1][remove] = 0
+                changed = True
+        if not changed:
+            return img[1:-1, 1:-1]
+
+
+def _ring(img):
+    # 8 voisins dans l'ordre (nord, nord-est, ... nord-ouest) puis nord à nouveau
+    p = np.pad(img, 1)
+    return (p[:-2, 1:-1], p[:-2, 2:], p[1:-1, 2:], p[2:, 2:],
+            p[2:, 1:-1], p[2:, :-2], p[1:-1, :-2], p[:-2, :-2], p[:-2, 1:-1])
+
+
+def _branches(skeleton):
+    """
+    Nombre de branches du squelette autour de chaque pixel (passages
+    0 -> 1 sur ses 8 voisins) : 1 extrémité, 2 ligne, 3 ou plus jonction.
+    Contrairement au nombre de voisins, les marches d'escalier du
+    squelette ne comptent pas comme des jonctions
+    """
+    ring = _ring(skeleton.astype(np.uint8))
+    return sum((ring[k] == 0) & (ring[k + 1] == 1) for k in range(8)).astype(int) * skeleton
+
+
+def _walk(pixels, start):
+    """Pixels d'un tronçon de squelette rangés depuis `start`"""
+    remaining = set(pixels)
+    path = [start]
+    remaining.discard(start)
+    y, x = start
+    while True:
+        # voisins à 4 connexions d'abord : les marches d'escalier du squelette ne sautent pas de pixel
+        for dy, dx in ((0, 1), (1, 0), (0, -1), (-1, 0), (1, 1), (1, -1), (-1, 1), (-1, -1)):
+            if (y + dy, x + dx) in remaining:
+                y, x = y + dy, x + dx
+                remaining.discard((y, x))
+                path.append((y, x))
+                break
+        else:
+            return path
+
+
+def _smooth(path, window=SMOOTH_WINDOW):
+    """
+    Moyenne glissante des pixels d'un tronçon : les marches d'escalier du
+    squelette allongeraient les diagonales (jusqu'à x1.41)
+    """
+    points = np.array(path, np.float64)
+    if len(points) <= window:
+        return points.tolist()
+    kernel = np.ones(window) / window
+    inner = np.column_stack([np.convolve(points[:, k], kernel, mode='valid') for k in (0, 1)])
+    return [path[0]] + inner[::max(1, window // 2)].tolist() + [path[-1]]
+
+
+def _curvature_time(points, speed, max_lateral_accel):
+    """Temps de parcours (s) d'une polyligne (m), vitesse limitée par la courbure"""
+    steps = np.diff(points, axis=0)
+    ds = np.hypot(steps[:, 0], steps[:, 1])
+    if len(ds) < 2:
+        return float(ds.sum()) / speed
+    headings = np.unwrap(np.arctan2(steps[:, 1], steps[:, 0]))
+    curvature = np.abs(np.diff(headings)) / np.maximum(0.5 * (ds[1:] + ds[:-1]), 1e-9)
+    curvature = np.concatenate([[curvature[0]], curvature])
+    with np.errstate(divide='ignore'):
+        limit = np.sqrt(max_lateral_accel / curvature)
+    return float(np.sum(ds / np.minimum(speed, limit)))
+
+
+def _angle(a):
+    return (a + math.pi) % (2 * math.pi) - math.pi
+
+
+class TrackGraph:
+    """
+    Graphe de la piste, coordonnées au sol (m, x à droite, y vers le haut
+    de l'image, comme simulation.Simulator.to_world)
+
+    nodes: positions (n, 2)
+    edges: liste de dicts {'ends': (nœud, nœud), 'points': (k, 2),
+           'length': m, 'time': s, 'ports': (direction en 0, direction en 1)}
+           ; la direction d'une porte part du nœud vers l'arête (rad)
+    obstacles: [(arête, position (x, y))]
+    Arête orientée d = 2 e (de ends[0] vers ends[1]) ou 2 e + 1 (sens inverse)
+    """
+
+    def __init__(self, nodes, edges, obstacles=(), scale=TRACK_SCALE, height=0,
+                 speed=None, max_lateral_accel=config.MAX_LATERAL_ACCEL,
+                 turn_time=config.TURN_TIME_PER_RAD):
+        self.nodes = np.asarray(nodes, np.float64).reshape(-1, 2)
+        self.edges = edges
+        self.obstacles = list(obstacles)
+        self.scale = scale
+        self.height = height
+        self.speed = speed or config.BASE_SPEED * config.WHEEL_SPEED_AT_255 / 255
+        self.max_lateral_accel = max_lateral_accel
+        self.turn_time = turn_time
+        self._successors = self._build_successors()
+        self._plans = {}
+
+    ############################################
+    # Construction
+    ############################################
+
+    @classmethod
+    def from_image(cls, path=TRACK_DEFAULT, scale=TRACK_SCALE, cache=config.TRACK_GRAPH_CACHE):
+        """Graphe d'une image de piste, lu dans le cache si l'image n'a pas changé"""
+        with open(path, 'rb') as f:
+            key = f"{hashlib.sha1(f.read()).hexdigest()}:{scale}"
+        stored = {}
+        if cache and os.path.exists(cache):
+            with open(cache) as f:
+                stored = json.load(f)
+            if key in stored:
+                return cls.from_dict(stored[key])
+        graph = cls.build(cv2.imread(path), scale)
+        graph.precompute()
+        if cache:
+            stored[key] = graph.to_dict()
+            with open(cache, 'w') as f:
+                json.dump(stored, f)
+        return graph
+
+    @classmethod
+    def build(cls, image, scale=TRACK_SCALE):
+        """Squelette, nœuds, arêtes et obstacles d'une image de piste (BGR)"""
+        height = image.shape[0]
+        line = np.all(image > 150, axis=2)
+        b, g, r = (image[:, :, k].astype(int) for k in range(3))
+        red = (r > 150) & (g < 100) & (b < 100)
+        # la tache de l'obstacle recouvre la ligne : elle fait partie de la piste pour le squelette
+        skeleton = thin(line | red)
+        branches = _branches(skeleton)
+
+        def world(y, x):
+            return x * scale, (height - y) * scale
+
+        # nœuds : jonctions regroupées, puis extrémités libres
+        junctions = (branches >= 3).astype(np.uint8)
+        kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (NODE_RADIUS, NODE_RADIUS))
+        count, _, _, centroids = cv2.connectedComponentsWithStats(cv2.dilate(junctions, kernel))
+        centers = [(cy, cx) for cx, cy in centroids[1:]]
+        cut = skeleton.copy()
+        for cy, cx in centers:
+            cv2.circle(cut, (int(round(cx)), int(round(cy))), NODE_RADIUS, 0, -1)
+
+        edges = []
+        count, labels = cv2.connectedComponents(cut, connectivity=8)
+        for label in range(1, count):
+            ys, xs = np.nonzero(labels == label)
+            if len(ys) < MIN_EDGE_PIXELS:
+                continue
+            pixels = list(zip(ys.tolist(), xs.tolist()))
+            degree = _branches((labels == label).astype(np.uint8))
+            ends = [p for p in pixels if degree[p] <= 1]
+            path = _walk(pixels, ends[0] if ends else pixels[0])
+            attached = []
+            for end in (path[0], path[-1]):
+                dist = [math.hypot(end[0] - cy, end[1] - cx) for cy, cx in centers]
+                if dist and min(dist) <= NODE_RADIUS + 3:
+                    attached.append(int(np.argmin(dist)))
+                else:
+                    centers.append(end)            # extrémité libre (ou boucle sans intersection)
+                    attached.append(len(centers) - 1)
+            points = np.array([centers[attached[0]]] + _smooth(path) + [centers[attached[1]]])
+            edges.append({'ends': tuple(attached),
+                          'points': np.column_stack(world(points[:, 0], points[:, 1]))})
+
+        nodes = [world(cy, cx) for cy, cx in centers]
+        graph = cls(nodes, [], scale=scale, height=height)
+        for edge in edges:
+            graph._measure(edge)
+        graph.edges = edges
+
+        # obstacles : tache rouge -> arête la plus proche
+        count, _, _, blobs = cv2.connectedComponentsWithStats(red.astype(np.uint8))
+        for cx, cy in blobs[1:]:
+            position = np.array(world(cy, cx))
+            dist = [np.min(np.hypot(*(e['points'] - position).T)) for e in edges]
+            if dist and min(dist) <= OBSTACLE_RADIUS * scale:
+                graph.obstacles.append((int(np.argmin(dist)), tuple(position)))
+        graph._successors = graph._build_successors()
+        return graph
+
+    def _measure(self, edge):
+        points = edge['points']
+        ds = np.hypot(*np.diff(points, axis=0).T)
+        edge['length'] = float(ds.sum())
+        arc = np.concatenate([[0.0], np.cumsum(ds)])
+        step = RESAMPLE * self.scale
+        samples = np.arange(0.0, arc[-1], step).tolist() + [arc[-1]]
+        resampled = np.column_stack([np.interp(samples, arc, points[:, k]) for k in (0, 1)])
+        edge['time'] = _curvature_time(resampled, self.speed, self.max_lateral_accel)
+        reach = PORT_LENGTH * self.scale
+        head = np.interp(min(reach, arc[-1]), arc, points[:, 0]), np.interp(min(reach, arc[-1]), arc, points[:, 1])
+        tail = (np.interp(max(arc[-1] - reach, 0), arc, points[:, 0]),
+                np.interp(max(arc[-1] - reach, 0), arc, points[:, 1]))
+        edge['ports'] = (math.atan2(head[1] - points[0, 1], head[0] - points[0, 0]),
+                         math.atan2(tail[1] - points[-1, 1], tail[0] - points[-1, 0]))
+
+    def to_dict(self):
+        return {'nodes': self.nodes.tolist(), 'scale': self.scale, 'height': self.height,
+                'obstacles': [[e, list(p)] for e, p in self.obstacles],
+                'edges': [{'ends': list(e['ends']), 'points': e['points'].tolist(),
+                           'length': e['length'], 'time': e['time'], 'ports': list(e['ports'])}
+                          for e in self.edges],
+                'plans': {','.join(map(str, sorted(b))): {str(t): plan for t, plan in targets.items()}
+                          for b, targets in self._plans.items()}}
+
+    @classmethod
+    def from_dict(cls, data):
+        edges = [{'ends': tuple(e['ends']), 'points': np.array(e['points']), 'length': e['length'],
+                  'time': e['time'], 'ports': tuple(e['ports'])} for e in data['edges']]
+        graph = cls(data['nodes'], edges, [(e, tuple(p)) for e, p in data['obstacles']],
+                    data['scale'], data['height'])
+        for blocked, targets in data['plans'].items():
+            key = frozenset(int(e) for e in blocked.split(',') if e)
+            graph._plans[key] = {(None if t == 'None' else int(t)): [tuple(step) for step in plan]
+                                 for t, plan in targets.items()}
+        return graph
+
+    ############################################
+    # Arêtes orientées et branches
+    ############################################
+
+    def start_node(self, d):
+        return self.edges[d // 2]['ends'][d % 2]
+
+    def end_node(self, d):
+        return self.edges[d // 2]['ends'][1 - d % 2]
+
+    def _leaving(self, d):
+        """Cap (rad) au départ du nœud de l'arête orientée d"""
+        return self.edges[d // 2]['ports'][d % 2]
+
+    def _arriving(self, d):
+        """Cap (rad) à l'arrivée au nœud de l'arête orientée d"""
+        return _angle(self.edges[d // 2]['ports'][1 - d % 2] + math.pi)
+
+    def _build_successors(self):
+        """successeurs[d] = [(d suivante, branche, virage en rad)]"""
+        successors = []
+        for d in range(2 * len(self.edges)):
+            node, arrival = self.end_node(d), (d // 2, 1 - d % 2)
+            heading = self._arriving(d)
+            choices = []
+            for e, edge in enumerate(self.edges):
+                for k in (0, 1):
+                    if edge['ends'][k] != node or (e, k) == arrival:
+                        continue
+                    nxt = 2 * e + k
+                    turn = _angle(self._leaving(nxt) - heading)
+                    branch = 'straight' if abs(turn) < STRAIGHT_ANGLE else ('left' if turn > 0 else 'right')
+                    choices.append((nxt, branch, abs(turn)))
+            successors.append(choices)
+        return successors
+
+    def turn(self, d, nxt):
+        """Virage (rad, valeur absolue) pour passer de l'arête orientée d à nxt"""
+        return abs(_angle(self._leaving(nxt) - self._arriving(d)))
+
+    def branches(self, d):
+        """Branches possibles au bout de l'arête orientée d : [(d suivante, branche)]"""
+        return [(nxt, branch) for nxt, branch, _ in self._successors[d]]
+
+    ############################################
+    # Routes précalculées
+    ############################################
+
+    def scenarios(self):
+        """Ensembles d'arêtes bloquées envisagés : aucune, chacune seule, celles des obstacles"""
+        keys = [frozenset()] + [frozenset([e]) for e in range(len(self.edges))]
+        if self.obstacles:
+            keys.append(frozenset(e for e, _ in self.obstacles))
+        return list(dict.fromkeys(keys))
+
+    def precompute(self):
+        """Tables de routes de tous les scénarios et de toutes les destinations"""
+        for blocked in self.scenarios():
+            self.plan(blocked)
+        return self
+
+    def plan(self, blocked=frozenset()):
+        """{destination (arête ou None): [(d suivante, branche) par arête orientée]}, calculé une fois"""
+        blocked = frozenset(blocked)
+        if blocked not in self._plans:
+            targets = {None: self._tour(blocked)}
+            for target in range(len(self.edges)):
+                targets[target] = self._dijkstra(target, blocked)
+            self._plans[blocked] = targets
+        return self._plans[blocked]
+
+    def _turn_cost(self, turn):
+        return self.turn_time * turn
+
+    def _dijkstra(self, target, blocked):
+        """
+        Temps depuis l'entrée sur chaque arête orientée jusqu'à l'entrée sur
+        l'arête `target` (dans un sens ou l'autre), à rebours
+        """
+        n = 2 * len(self.edges)
+        predecessors = [[] for _ in range(n)]
+        for d in range(n):
+            for nxt, branch, turn in self._successors[d]:
+                predecessors[nxt].append((d, branch, turn))
+        cost = [math.inf] * n
+        best = [None] * n
+        queue = []
+        if target not in blocked:
+            for d in (2 * target, 2 * target + 1):
+                cost[d] = 0.0
+                queue.append((0.0, d))
+        heapq.heapify(queue)
+        while queue:
+            c, nxt = heapq.heappop(queue)
+            if c > cost[nxt]:
+                continue
+            for d, branch, turn in predecessors[nxt]:
+                if d // 2 in blocked and d // 2 != target:
+                    continue
+                total = c + self.edges[d // 2]['time'] + self._turn_cost(turn)
+                if total < cost[d]:
+                    cost[d] = total
+                    best[d] = (nxt, branch)
+                    heapq.heappush(queue, (total, d))
+        # sur l'arête visée : continuer tout droit (ou la branche la moins chère)
+        for d in (2 * target, 2 * target + 1):
+            best[d] = self._tour_step(d, blocked)
+        return [step if step is not None else (None, 'straight') for step in best]
+
+    def _tour_step(self, d, blocked):
+        choices = [(turn, nxt, branch) for nxt, branch, turn in self._successors[d]
+                   if nxt // 2 not in blocked]
+        if not choices:
+            return (None, 'straight')
+        _, nxt, branch = min(choices)
+        return (nxt, branch)
+
+    def _tour(self, blocked):
+        """Tour de piste : tout droit si possible, sinon la branche la moins tournante non bloquée"""
+        return [self._tour_step(d, blocked) for d in range(2 * len(self.edges))]
+
+    ############################################
+    # Localisation
+    ############################################
+
+    def locate(self, position, heading):
+        """
+        Arête orientée et distance déjà parcourue sur celle-ci pour une
+        position au sol (m) et un cap (rad)
+        """
+        best = None
+        for e, edge in enumerate(self.edges):
+            points = edge['points']
+            dist = np.hypot(*(points - position).T)
+            i = int(np.argmin(dist))
+            if best is None or dist[i] < best[0]:
+                best = (dist[i], e, i)
+        _, e, i = best
+        points = self.edges[e]['points']
+        j = min(i + 1, len(points) - 1)
+        i = j - 1
+        tangent = math.atan2(points[j, 1] - points[i, 1], points[j, 0] - points[i, 0])
+        done = float(np.sum(np.hypot(*np.diff(points[:i + 1], axis=0).T))) if i > 0 else 0.0
+        if abs(_angle(heading - tangent)) <= math.pi / 2:
+            return 2 * e, done
+        return 2 * e + 1, self.edges[e]['length'] - done
+
+    def to_world(self, px, py):
+        """Position au sol (m) d'un pixel de l'image de la piste"""
+        return px * self.scale, (self.height - py) * self.scale
+
+    def edge_at(self, position):
+        """Arête la plus proche d'une position au sol (m), pour une destination"""
+        return self.locate(position, 0.0)[0] // 2
+
+    def describe(self):
+        lines = [f"{len(self.nodes)} nœuds, {len(self.edges)} arêtes"]
+        for e, edge in enumerate(self.edges):
+            a, b = edge['ends']
+            lines.append(f"  arête {e} : nœud {a} -> nœud {b}, {edge['length']:.2f} m, "
+                         f"{edge['time']:.2f} s")
+        for e, position in self.obstacles:
+            lines.append(f"  obstacle en ({position[0]:.2f}, {position[1]:.2f}) m : arête {e} bloquée")
+        return "\n".join(lines)
+
+
+############################################
+# Suivi de la route en fonctionnement
+############################################
+
+class RouteFollower:
+    """
+    Position sur le graphe et décision aux intersections
+
+    odometer: fonction sans argument -> distance parcourue (m), par
+              exemple lambda: odometry.distance
+    target: arête de destination, None pour un tour de piste
+    blocked: arêtes bloquées (par défaut celles des obstacles du graphe)
+    """
+
+    def __init__(self, graph, odometer, target=None, blocked=None,
+                 ahead=config.INTERSECTION_AHEAD, tolerance=config.ROUTE_TOLERANCE):
+        self.graph = graph
+        self.odometer = odometer
+        self.target = target
+        self.ahead = ahead
+        self.tolerance = tolerance
+        self.events = []            # (t, nœud, écart en m, branche) ; nœud None si rejeté
+        self.missed = 0
+        self.edge = None
+        self.entered = 0.0          # distance de l'odomètre à l'entrée sur l'arête courante
+        self.block(*(blocked if blocked is not None else [e for e, _ in graph.obstacles]))
+
+    def block(self, *edges):
+        """Arêtes bloquées : la table du scénario correspondant est sélectionnée"""
+        self.blocked = frozenset(edges)
+        self.table = self.graph.plan(self.blocked)[self.target]
+
+    def start(self, position, heading):
+        """Position de départ au sol (m) et cap (rad)"""
+        self.edge, done = self.graph.locate(position, heading)
+        self.entered = self.odometer() - done
+
+    def _remaining(self, distance):
+        return self.entered + self.graph.edges[self.edge // 2]['length'] - distance
+
+    def decide(self, t):
+        """
+        Branche à prendre à l'intersection vue devant (navigation.Navigator.decide)
+        Returns: (branche, distance du nœud en m, virage en rad), ou None si
+                 aucun nœud n'est attendu à cette distance (fausse détection)
+        """
+        distance = self.odometer()
+        # intersections passées sans être vues : on suppose la branche prévue prise
+        while self._remaining(distance) - self.ahead < -self.tolerance:
+            self._take(self._remaining(distance) + distance)
+            self.missed += 1
+        gap = self._remaining(distance) - self.ahead
+        if abs(gap) > self.tolerance:
+            # aucun nœud attendu ici : fausse détection, ignorée
+            self.events.append((t, None, gap, None))
+            return None
+        node = self.graph.end_node(self.edge)
+        remaining = self._remaining(distance)
+        nxt = self.table[self.edge][0]
+        turn = 0.0 if nxt is None else self.graph.turn(self.edge, nxt)
+        branch = self._take(distance + remaining)
+        self.events.append((t, node, gap, branch))
+        return branch, remaining, turn
+
+    def _take(self, at):
+        nxt, branch = self.table[self.edge]
+        if nxt is None:
+            return branch
+        self.edge = nxt
+        self.entered = at
+        return branch
+
+
+def start_route(odometer, target=None, track=TRACK_DEFAULT):
+    """
+    RouteFollower pour le robot posé au départ de la piste (position et
+    cap de départ de la simulation, START_PIXEL et START_HEADING)
+    odometer: distance parcourue (m), par exemple lambda: odometry.distance
+    """
+    from simulation import START_HEADING, START_PIXEL
+
+    graph = TrackGraph.from_image(track)
+    follower = RouteFollower(graph, odometer, target)
+    follower.start(graph.to_world(*START_PIXEL), math.radians(START_HEADING))
+    return follower
+
+
+############################################
+# Vérification sur la simulation
+############################################
+
+def check(track=TRACK_DEFAULT, duration=40.0):
+    """
+    Tour simulé avec détection des intersections : chaque détection est
+    rattachée à un nœud du graphe par RouteFollower
+    Returns: (RouteFollower, SimResult)
+    """
+    import steering
+    import vision
+    from navigation import Navigator, line_side
+    from simulation import Simulator
+
+    graph = TrackGraph.from_image(track)
+    sim = Simulator(track)
+    cfg = sim.cfg
+    w = cfg.camera_resolution[0]
+    odometer = {'distance': 0.0, 'last': (sim.x, sim.y)}
+    follower = RouteFollower(graph, lambda: odometer['distance'])
+    follower.start((sim.x, sim.y), sim.theta)
+    nav = Navigator(cfg, decide=follower.decide)
+
+    def control(image):
+        odometer['distance'] += math.hypot(sim.x - odometer['last'][0], sim.y - odometer['last'][1])
+        odometer['last'] = (sim.x, sim.y)
+        mask = vision.line_mask(image, cfg)
+        cx, _ = vision.centroid(mask)
+        command = None if cx is None else steering.compute_steering_command(cx, cfg)
+        return nav.update(sim.t, command, line_side(None if cx is None else cx - w / 2),
+                          vision.detect_intersection(mask), (sim.x, sim.y, sim.theta))
+
+    sim.controller = control
+    return follower, sim.run(duration, laps=1)
+
+
+def main():
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Graphe de la piste et routes précalculées")
+    parser.add_argument('track', nargs='?', default=TRACK_DEFAULT)
+    parser.add_argument('--check', action='store_true', help="intersections sur la simulation")
+    args = parser.parse_args()
+
+    if args.check:
+        follower, result = check(args.track)
+        for t, node, gap, branch in follower.events:
+            where = f"nœud {node}" if node is not None else "rejetée"
+            print(f"  t={t:5.2f} s : intersection {where:8s} écart {gap * 100:+6.1f} cm"
+                  + (f" -> {branch}" if branch else ""))
+        matched = sum(1 for event in follower.events if event[1] is not None)
+        print(f"  {matched} intersections rattachées, {len(follower.events) - matched} rejetées, "
+              f"{follower.missed} manquées (confirmation sur {config.INTERSECTION_FRAMES} images)")
+        print(f"  {result.summary()}")
+        return
+
+    start = time.perf_counter()
+    graph = TrackGraph.build(cv2.imread(args.track))
+    graph.precompute()
+    built = time.perf_counter() - start
+    print(graph.describe())
+    print(f"Construction et tables : {built * 1000:.0f} ms")
+    start = time.perf_counter()
+    TrackGraph.from_image(args.track)           # remplit le cache si besoin
+    TrackGraph.from_image(args.track)
+    print(f"Lecture du cache : {(time.perf_counter() - start) / 2 * 1000:.1f} ms")
+
+    blocked = frozenset(e for e, _ in graph.obstacles)
+    for key in dict.fromkeys([frozenset(), blocked]):
+        label = f"arêtes bloquées {sorted(key)}" if key else "aucune arête bloquée"
+        print(f"Tour de piste, {label} :")
+        plan = graph.plan(key)[None]
+        for d, (nxt, branch) in enumerate(plan):
+            if d // 2 in key or nxt is None:
+                continue
+            print(f"  arrivée par l'arête {d // 2} ({'+' if d % 2 == 0 else '-'}) au nœud "
+                  f"{graph.end_node(d)} : {branch:8s} -> arête {nxt // 2}")
+    plan = graph.plan(blocked)[None]
+    start = time.perf_counter()
+    for i in range(100000):
+        plan[i % len(plan)]
+    print(f"Décision : {(time.perf_counter() - start) / 100000 * 1e9:.0f} ns (lecture de table)")
+
+
+if __name__ == "__main__":
+    main()
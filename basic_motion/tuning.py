@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+Balayage parallèle et réglage automatique des paramètres de suivi de ligne
+
+Chaque jeu de paramètres candidat (BASE_SPEED, CORRECTION_FACTOR,
+DEAD_ZONE, MIN_SPEED, THRESHOLD_VALUE...) est évalué en simulation
+(simulation.py) sur la piste, dans un pool de processus. Le score
+combine le temps au tour et l'erreur latérale moyenne ; une sortie de
+piste est fortement pénalisée.
+
+Trois stratégies de recherche :
+- grid     : grille régulière sur chaque paramètre
+- random   : tirage uniforme dans l'espace de recherche
+- adaptive : tirages successifs resserrés autour des meilleurs candidats
+             (méthode de l'entropie croisée, proche d'une recherche bayésienne)
+
+Les meilleurs jeux de paramètres sont enregistrés dans profils_regles.yaml
+et se chargent ensuite comme les autres profils : config.load_profile(nom).
+
+Usage:
+    python3 tuning.py --mode adaptive --budget 96 --workers 4 --save tuned
+"""
+
+import argparse
+import itertools
+import math
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import config
+
+# Espace de recherche : paramètre -> (min, max, type)
+SEARCH_SPACE = {
+    'BASE_SPEED': (60, 200, int),
+    'CORRECTION_FACTOR': (0.2, 0.9, float),
+    'DEAD_ZONE': (0, 20, int),
+    'MIN_SPEED': (20, 120, int),
+    'THRESHOLD_VALUE': (120, 220, int),
+}
+
+# Pénalité de l'erreur latérale (secondes de tour par cm d'erreur moyenne)
+ERROR_WEIGHT = 2.0
+# Score d'un candidat qui ne finit pas le tour (auquel on retranche le temps tenu)
+FAIL_SCORE = 1000.0
+
+_simulator = None
+_duration = None
+
+
+############################################
+# Évaluation (dans les processus du pool)
+############################################
+
+def _init_worker(track, duration):
+    global _simulator, _duration
+    from simulation import Simulator
+    _simulator = Simulator(track, cfg=config.LineConfig())
+    _duration = duration
+
+
+def evaluate(params):
+    """
+    Simule un tour avec les paramètres donnés
+    Returns: dict avec le score et les mesures (temps au tour, erreur...)
+    """
+    _simulator.cfg = config.LineConfig.from_dict(params)
+    _simulator.reset()
+    result = _simulator.run(_duration, laps=1)
+
+    if result.completed:
+        score = result.lap_times[0] + ERROR_WEIGHT * result.mean_error * 100
+        lap_time = result.lap_times[0]
+    else:
+        score = FAIL_SCORE - result.sim_time
+        lap_time = math.inf
+    return {'params': params, 'score': score, 'lap_time': lap_time,
+            'mean_error': result.mean_error, 'max_error': result.max_error,
+            'lost_ratio': result.lost_ratio}
+
+
+############################################
+# Génération des candidats
+############################################
+
+def _cast(name, value):
+    low, high, kind = SEARCH_SPACE[name]
+    value = min(max(value, low), high)
+    return int(round(value)) if kind is int else round(float(value), 3)
+
+
+def _constrain(params):
+    # MIN_SPEED n'a pas de sens au-dessus de BASE_SPEED
+    if 'MIN_SPEED' in params:
+        params['MIN_SPEED'] = min(params['MIN_SPEED'], params.get('BASE_SPEED', config.BASE_SPEED))
+    return params
+
+
+def grid_candidates(names, steps):
+    """Grille régulière de `steps` valeurs par paramètre"""
+    axes = []
+    for name in names:
+        low, high, _ = SEARCH_SPACE[name]
+        axes.append([_cast(name, v) for v in np.linspace(low, high, steps)])
+    seen = set()
+    for values in itertools.product(*axes):
+        params = _constrain(dict(zip(names, values)))
+        key = tuple(sorted(params.items()))
+        if key not in seen:
+            seen.add(key)
+            yield params
+
+
+def random_candidates(names, count, rng):
+    """Tirage uniforme dans l'espace de recherche"""
+    for _ in range(count):
+        yield _constrain({name: _cast(name, rng.uniform(*SEARCH_SPACE[name][:2]))
+                          for name in names})
+
+
+def adaptive_candidates(names, elites, count, rng):
+    """Tirage gaussien autour des meilleurs candidats (espace normalisé)"""
+    lows = np.array([SEARCH_SPACE[n][0] for n in names], float)
+    spans = np.array([SEARCH_SPACE[n][1] for n in names], float) - lows
+    points = np.array([[e['params'][n] for n in names] for e in elites], float)
+    points = (points - lows) / spans
+    mean = points.mean(axis=0)
+    std = np.maximum(points.std(axis=0), 0.03)
+    for _ in range(count):
+        sample = np.clip([rng.gauss(m, s) for m, s in zip(mean, std)], 0.0, 1.0)
+        yield _constrain({n: _cast(n, lows[i] + sample[i] * spans[i])
+                          for i, n in enumerate(names)})
+
+
+############################################
+# Moteur de balayage
+############################################
+
+def sweep(mode='adaptive', names=tuple(SEARCH_SPACE), budget=64, workers=None,
+          track=None, duration=90.0, steps=3, rounds=4, seed=0):
+    """
+    Évalue les candidats dans un pool de processus
+    Returns: liste des résultats triée du meilleur au moins bon
+    """
+    from simulation import TRACK_DEFAULT
+    track = track or TRACK_DEFAULT
+    names = list(names)
+    workers = workers or os.cpu_count() or 1
+    rng = random.Random(seed)
+    results = []
+    start = time.time()
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(track, duration)) as pool:
+        def run(candidates):
+            candidates = list(candidates)
+            chunk = max(1, len(candidates) // (4 * workers))
+            batch = list(pool.map(evaluate, candidates, chunksize=chunk))
+            results.extend(batch)
+            best = min(results, key=lambda r: r['score'])
+            print(f"  {len(results)} candidats évalués ({time.time() - start:.1f}s) "
+                  f"| meilleur score: {best['score']:.2f}")
+
+        if mode == 'grid':
+            run(grid_candidates(names, steps))
+        elif mode == 'random':
+            run(random_candidates(names, budget, rng))
+        elif mode == 'adaptive':
+            per_round = max(1, budget // rounds)
+            run(random_candidates(names, per_round, rng))
+            for _ in range(rounds - 1):
+                ranked = sorted(results, key=lambda r: r['score'])
+                elites = ranked[:max(2, len(ranked) // 4)]
+                run(adaptive_candidates(names, elites, per_round, rng))
+        else:
+            raise ValueError(f"Mode de recherche inconnu: {mode}")
+
+    return sorted(results, key=lambda r: r['score'])
+
+
+def save_profiles(profiles, path=config.TUNED_PROFILES_PATH):
+    """Ajoute des profils {nom: paramètres} au fichier des profils réglés"""
+    import yaml
+    existing = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            existing = yaml.safe_load(f) or {}
+    for name, params in profiles.items():
+        existing[name] = {k: (v.item() if hasattr(v, 'item') else v) for k, v in params.items()}
+    with open(path, 'w') as f:
+        yaml.safe_dump(existing, f, sort_keys=True)
+
+
+def print_results(results, top=5):
+    print(f"\n{'Rang':>4} | {'Score':>7} | {'Tour':>7} | {'Err moy':>7} | Paramètres")
+    print("-"*90)
+    for rank, r in enumerate(results[:top], 1):
+        lap = f"{r['lap_time']:.2f}s" if math.isfinite(r['lap_time']) else "échec"
+        params = ", ".join(f"{k}={v}" for k, v in r['params'].items())
+        print(f"{rank:>4} | {r['score']:>7.2f} | {lap:>7} | {r['mean_error']*100:>5.1f}cm | {params}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Réglage automatique des profils par simulation")
+    parser.add_argument('--mode', choices=('grid', 'random', 'adaptive'), default='adaptive')
+    parser.add_argument('--params', nargs='+', default=list(SEARCH_SPACE),
+                        choices=list(SEARCH_SPACE), help="paramètres à régler")
+    parser.add_argument('--budget', type=int, default=64, help="nombre de candidats (random/adaptive)")
+    parser.add_argument('--steps', type=int, default=3, help="valeurs par paramètre (grid)")
+    parser.add_argument('--rounds', type=int, default=4, help="nombre de tours de recherche (adaptive)")
+    parser.add_argument('--workers', type=int, default=None, help="processus (défaut: nb de coeurs)")
+    parser.add_argument('--track', default=None, help="image de la piste")
+    parser.add_argument('--duration', type=float, default=90.0, help="durée max d'un tour simulé (s)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--top', type=int, default=5, help="nombre de résultats affichés")
+    parser.add_argument('--save', metavar='NOM', help="enregistre le meilleur jeu comme profil NOM")
+    args = parser.parse_args()
+
+    print(f"Recherche '{args.mode}' sur {', '.join(args.params)}")
+    results = sweep(args.mode, args.params, args.budget, args.workers, args.track,
+                    args.duration, args.steps, args.rounds, args.seed)
+    print_results(results, args.top)
+
+    if args.save and results and math.isfinite(results[0]['lap_time']):
+        save_profiles({args.save: results[0]['params']})
+        print(f"\n✓ Profil '{args.save}' enregistré dans {config.TUNED_PROFILES_PATH}")
+        print(f"  Chargement : config.load_profile('{args.save}')")
+
+
+if __name__ == "__main__":
+    main()
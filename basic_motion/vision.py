@@ -0,0 +1,125 @@
+"""
+Détection de la ligne blanche
+
+Fonctions partagées par dialogue.py, test_line_tracking.py et la
+simulation. Tous les paramètres viennent d'un config.LineConfig passé
+explicitement (noyaux et bornes HSV déjà précalculés).
+"""
+
+import cv2
+import numpy as np
+
+import config
+
+# Nombre de bandes horizontales de band_points
+BANDS = 8
+
+# Coins attendus dans le masque pour reconnaître une intersection
+# (comme dans basic_image_processing/corner_detection.py)
+EXPECTED_CORNERS = 3
+
+# Borne haute du masque fusionné (line_mask)
+WHITE = np.full(3, 255, np.uint8)
+
+
+def line_mask(image, cfg):
+    """
+    Masque binaire nettoyé des zones blanches de l'image
+    Avec cfg.fused_mask, seuillage et masque HSV se font en un seul
+    inRange (même masque, voir config.LineConfig._white_lower)
+    """
+    # Prétraitement: flou pour réduire le bruit
+    blur = cv2.blur(image, cfg.blur_kernel_size)
+    
+    if cfg.white_lower is not None:
+        # Blanc après seuillage = les trois canaux au-dessus du seuil
+        mask = cv2.inRange(blur, cfg.white_lower, WHITE)
+    else:
+        # Seuillage pour isoler les zones blanches
+        ret, thresh1 = cv2.threshold(blur, cfg.threshold_value, 255, cv2.THRESH_BINARY)
+        
+        # Conversion en HSV et masque du blanc
+        hsv = cv2.cvtColor(thresh1, cv2.COLOR_RGB2HSV)
+        mask = cv2.inRange(hsv, cfg.hsv_lower, cfg.hsv_upper)
+    
+    # Suppression du bruit avec morphologie
+    eroded_mask = cv2.erode(mask, cfg.erode_kernel, iterations=cfg.erode_iterations)
+    return cv2.dilate(eroded_mask, cfg.dilate_kernel, iterations=cfg.dilate_iterations)
+
+
+def detect_line(image, cfg, debug=False):
+    """
+    Détecte la ligne blanche dans l'image et retourne les coordonnées du centroïde
+    L'image n'est copiée pour le debug que si debug=True
+    Returns: (cx, cy, debug_image) ou (None, None, debug_image)
+             debug_image vaut None si debug=False
+    """
+    if image is None:
+        return None, None, None
+    
+    debug_image = image.copy() if debug else None
+    mask = line_mask(image, cfg)
+    
+    if debug:
+        contours, hierarchy = cv2.findContours(mask, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
+        cv2.drawContours(debug_image, contours, -1, (0, 255, 0), 2)
+    
+    cx, cy = centroid(mask)
+    if cx is not None and debug:
+        cv2.circle(debug_image, (cx, cy), 5, (255, 0, 0), -1)
+        cv2.putText(debug_image, f"({cx},{cy})", (cx+10, cy-10),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.4, (255, 0, 0), 1)
+    return cx, cy, debug_image
+
+
+def centroid(mask):
+    """
+    Centroïde du plus grand contour du masque
+    Returns: (cx, cy) ou (None, None)
+    """
+    contours, hierarchy = cv2.findContours(mask, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
+    
+    # Garder seulement le plus grand contour
+    if len(contours) > 0:
+        M = cv2.moments(max(contours, key=cv2.contourArea))
+        
+        if M['m00'] != 0:
+            return int(M['m10'] / M['m00']), int(M['m01'] / M['m00'])
+    
+    return None, None
+
+
+def band_rows(height, bands=BANDS):
+    """Ligne d'image au milieu de chacune des `bands` bandes de band_points"""
+    return (np.arange(bands) + 0.5) * (height // bands)
+
+
+def band_points(mask, bands=BANDS):
+    """
+    Points de la ligne : abscisse moyenne des pixels blancs dans `bands`
+    bandes horizontales du masque, de haut en bas
+    Returns: (xs, ys), xs vaut NaN pour une bande sans ligne
+    """
+    h, w = mask.shape
+    rows = h // bands
+    counts = np.count_nonzero(mask[:rows * bands].reshape(bands, rows, w), axis=1)
+    total = counts.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        xs = counts @ np.arange(w) / total
+    return np.where(total > 0, xs, np.nan), band_rows(h, bands)
+
+
+def occupancy(image, cfg, step=config.OCCUPANCY_STEP):
+    """
+    Part des pixels blancs de l'image, lue une ligne et une colonne sur
+    `step` : contrôle rapide de la présence de la ligne (sans flou,
+    masque ni contours) tant qu'elle est perdue
+    """
+    small = image[::step, ::step]
+    return np.count_nonzero(small.min(axis=2) > cfg.threshold_value) / (small.shape[0] * small.shape[1])
+
+
+def detect_intersection(mask, expected_corners=EXPECTED_CORNERS):
+    """True si le masque présente assez de coins pour une intersection"""
+    corners = cv2.goodFeaturesToTrack(np.float32(mask), 5, 0.5, 20)
+    return corners is not None and len(corners) >= expected_corners
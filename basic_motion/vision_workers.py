@@ -0,0 +1,394 @@
+"""
+Détection de la ligne dans des processus séparés
+
+Dans autonomous_line_following tout tourne dans un seul thread Python :
+la détection (tri des contours, moments...) et les échanges série se
+partagent le GIL. Ici :
+- la capture écrit les images dans un FramePool en mémoire partagée
+- un ou plusieurs processus de vision lisent l'image à partir de son
+  indice (aucune copie), calculent le centroïde, les points de la ligne
+  par bande et la présence d'une intersection
+- chaque processus écrit ses résultats dans son propre anneau en mémoire
+  partagée (un seul écrivain, un seul lecteur : aucun verrou) ; le
+  processus de contrôle lit les anneaux sans attendre et ne fait que
+  commander les moteurs
+
+Le numéro de séquence d'une case de l'anneau est écrit en dernier, et
+remis à -1 pendant l'écriture : le lecteur relit le numéro après avoir
+copié la case et l'ignore s'il a changé.
+
+Les images sont confiées aux processus par un Pipe (indice du buffer,
+comme debug_server.py) et gardées (retain) jusqu'à l'arrivée du résultat.
+
+Mesure du débit selon le nombre de processus, écrite dans bench_vision.md
+(mêmes règles que bench_loop.py : sur le robot, 4 cœurs, depuis un arbre
+git propre ; ailleurs --output). Ce tableau n'a pas encore été mesuré sur
+le Raspberry Pi : aucun gain des processus n'est établi pour l'instant.
+    python3 vision_workers.py --bench [--frames 300] [--workers 3] [--output bench_vision.md]
+Au-delà d'un processus par cœur libre, les processus se partagent les
+cœurs et le débit ne peut plus augmenter.
+"""
+
+import multiprocessing as mp
+import os
+import time
+
+import numpy as np
+
+import config
+import vision
+from frames import FramePool
+
+BENCH_OUTPUT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_vision.md')
+
+RING_SIZE = 16          # cases de l'anneau de résultats de chaque processus
+IN_FLIGHT = 2           # images confiées à la fois à un processus
+
+RESULT_DTYPE = np.dtype([
+    ('seq', '<i8'),             # numéro du résultat, écrit en dernier (-1 pendant l'écriture)
+    ('number', '<i8'),          # numéro de l'image
+    ('index', '<i4'),           # buffer de l'image dans le pool
+    ('found', '?'),
+    ('intersection', '?'),
+    ('cx', '<f4'), ('cy', '<f4'),
+    ('bands', '<f4', (vision.BANDS,)),
+    ('captured', '<f8'),        # date de capture (time.monotonic)
+    ('done', '<f8'),            # date de fin de la détection
+])
+
+
+class VisionResult:
+    """Résultat compact de la détection d'une image"""
+
+    __slots__ = ('number', 'worker', 'cx', 'cy', 'bands', 'intersection', 'captured', 'done')
+
+    def __init__(self, record, worker):
+        self.number = int(record['number'])
+        self.worker = worker
+        found = bool(record['found'])
+        self.cx = int(record['cx']) if found else None
+        self.cy = int(record['cy']) if found else None
+        self.bands = record['bands'].copy()
+        self.intersection = bool(record['intersection'])
+        self.captured = float(record['captured'])
+        self.done = float(record['done'])
+
+    @property
+    def latency(self):
+        """Délai entre la capture et la fin de la détection (s)"""
+        return self.done - self.captured
+
+    def __repr__(self):
+        return (f"VisionResult(#{self.number}, cx={self.cx}, cy={self.cy}, "
+                f"intersection={self.intersection}, {self.latency*1000:.1f} ms)")
+
+
+def analyse(image, cfg):
+    """
+    Détection complète d'une image
+    Returns: (cx, cy, band_xs, intersection), cx et cy None sans ligne
+    """
+    mask = vision.line_mask(image, cfg)
+    cx, cy = vision.centroid(mask)
+    xs, _ = vision.band_points(mask)
+    return cx, cy, xs, vision.detect_intersection(mask)
+
+
+class ResultRing:
+    """Anneau de résultats en mémoire partagée (un écrivain, un lecteur)"""
+
+    def __init__(self, size=RING_SIZE, name=None):
+        from multiprocessing import shared_memory
+        nbytes = size * RESULT_DTYPE.itemsize
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=nbytes)
+            self.owner = True
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            self.owner = False
+        self.slots = np.ndarray((size,), dtype=RESULT_DTYPE, buffer=self.shm.buf)
+        if self.owner:
+            self.slots['seq'] = -1
+        self.size = size
+        self.written = 0        # côté écrivain
+        self.read = 0           # côté lecteur
+
+    def write(self, number, index, cx, cy, bands, intersection, captured):
+        slot = self.slots[self.written % self.size]
+        slot['seq'] = -1
+        slot['number'] = number
+        slot['index'] = index
+        slot['found'] = cx is not None
+        slot['cx'] = cx if cx is not None else 0
+        slot['cy'] = cy if cy is not None else 0
+        slot['bands'] = bands
+        slot['intersection'] = intersection
+        slot['captured'] = captured
+        slot['done'] = time.monotonic()
+        slot['seq'] = self.written
+        self.written += 1
+
+    def poll(self):
+        """Résultats écrits depuis le dernier appel (copies des cases)"""
+        records = []
+        while True:
+            slot = self.slots[self.read % self.size]
+            seq = int(slot['seq'])
+            if seq < self.read:
+                return records                  # pas encore écrit (ou en cours d'écriture)
+            record = slot.copy()
+            if int(slot['seq']) != seq:
+                return records                  # réécrit pendant la copie : on relira
+            if seq > self.read:
+                self.read = seq                 # l'écrivain a fait un tour de plus : cases perdues
+            records.append(record)
+            self.read += 1
+
+    def close(self):
+        self.slots = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def _worker_loop(conn, pool_spec, ring_name, cfg):
+    shm, storage = FramePool.attach(pool_spec)
+    ring = ResultRing(name=ring_name)
+    try:
+        while True:
+            msg = conn.recv()
+            if msg is None:
+                break
+            index, number, captured, new_cfg = msg
+            if new_cfg is not None:
+                cfg = new_cfg
+            cx, cy, bands, intersection = analyse(storage[index], cfg)
+            ring.write(number, index, cx, cy, bands, intersection, captured)
+    except (EOFError, KeyboardInterrupt):
+        pass
+    finally:
+        del storage
+        ring.close()
+        shm.close()
+
+
+class VisionWorkers:
+    """
+    Processus de détection alimentés par un FramePool partagé
+
+    pool: FramePool créé avec shared=True, d'au moins
+          workers * IN_FLIGHT + 2 buffers (capture et contrôle)
+    cfg: config.LineConfig ; update_config() la transmet quand elle change
+    """
+
+    def __init__(self, pool, cfg, workers=2):
+        self.pool = pool
+        self.cfg = cfg
+        self.count = workers
+        self.submitted = 0
+        self.dropped = 0
+        self.completed = 0
+        self._workers = []
+        self._latest = None
+        self._results = []          # résultats lus, pas encore rendus par poll()
+
+    def start(self):
+        for i in range(self.count):
+            ring = ResultRing()
+            conn, child_conn = mp.Pipe()
+            process = mp.Process(target=_worker_loop, daemon=True,
+                                 args=(child_conn, self.pool.shared_spec, ring.shm.name, self.cfg))
+            process.start()
+            # [processus, pipe, anneau, images en cours (numéro -> Frame), config à transmettre]
+            self._workers.append([process, conn, ring, {}, None])
+        return self
+
+    def update_config(self, cfg):
+        """Nouvelle configuration, transmise avec la prochaine image de chaque processus"""
+        if cfg is not self.cfg:
+            self.cfg = cfg
+            for worker in self._workers:
+                worker[4] = cfg
+
+    def submit(self, frame):
+        """
+        Confie une image au processus le moins chargé (non bloquant)
+        Returns: False si tous les processus sont occupés (image ignorée)
+        """
+        self._collect()
+        worker = min(self._workers, key=lambda w: len(w[3]))
+        if len(worker[3]) >= IN_FLIGHT:
+            self.dropped += 1
+            return False
+        worker[3][frame.number] = frame.retain()
+        worker[1].send((frame.index, frame.number, frame.timestamp, worker[4]))
+        worker[4] = None
+        self.submitted += 1
+        return True
+
+    def _collect(self):
+        # lecture des anneaux et retour des images traitées au pool
+        for i, (_, _, ring, inflight, _) in enumerate(self._workers):
+            for record in ring.poll():
+                frame = inflight.pop(int(record['number']), None)
+                if frame is not None:
+                    frame.release()
+                result = VisionResult(record, i)
+                self._results.append(result)
+                self.completed += 1
+                if self._latest is None or result.number > self._latest.number:
+                    self._latest = result
+
+    def poll(self):
+        """
+        Lit les anneaux sans attendre
+        Returns: résultats arrivés depuis le dernier appel, par numéro d'image croissant
+        """
+        self._collect()
+        results, self._results = self._results, []
+        results.sort(key=lambda r: r.number)
+        return results
+
+    @property
+    def latest(self):
+        """Résultat de l'image la plus récente traitée"""
+        self._collect()
+        return self._latest
+
+    @property
+    def busy(self):
+        return sum(len(w[3]) for w in self._workers)
+
+    def wait(self, timeout=1.0):
+        """Attend la fin des images en cours (fin de parcours, mesures)"""
+        deadline = time.monotonic() + timeout
+        while self.busy and time.monotonic() < deadline:
+            self._collect()
+            time.sleep(0.0005)
+        return self.poll()
+
+    def close(self):
+        for process, conn, ring, inflight, _ in self._workers:
+            try:
+                conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+            process.join(timeout=1.0)
+            if process.is_alive():
+                process.terminate()
+            for frame in inflight.values():
+                frame.release()
+            ring.close()
+        self._workers = []
+
+
+############################################
+# Mesure du débit
+############################################
+
+def benchmark(frames=300, max_workers=3):
+    """
+    Images traitées par seconde, en ligne (sans processus) puis avec 1 à
+    max_workers processus, sur des images rendues par la simulation
+    Returns: {nombre de processus (0 = en ligne): images/s}
+    """
+    from simulation import Simulator
+
+    sim = Simulator()
+    images = []
+    for _ in range(16):
+        images.append(sim.render().copy())
+        sim.step(config.BASE_SPEED, config.BASE_SPEED)
+    cfg = config.LineConfig()
+    rates = {}
+
+    start = time.perf_counter()
+    for i in range(frames):
+        analyse(images[i % len(images)], cfg)
+    rates[0] = frames / (time.perf_counter() - start)
+
+    for workers in range(1, max_workers + 1):
+        pool = FramePool(images[0].shape, count=workers * IN_FLIGHT + 2, shared=True)
+        vw = VisionWorkers(pool, cfg, workers).start()
+        vw.wait(0.5)
+        done = 0
+        start = time.perf_counter()
+        i = 0
+        while done < frames:
+            frame = pool.acquire(timeout=0) if i < frames else None
+            if frame is not None:
+                pool.buffer(frame)[:] = images[i % len(images)]
+                if vw.submit(frame):
+                    i += 1
+                frame.release()
+            else:
+                time.sleep(0.0002)
+            done += len(vw.poll())
+        rates[workers] = frames / (time.perf_counter() - start)
+        vw.close()
+        pool.close()
+    return rates
+
+
+def bench_table(rates, frames):
+    """Tableau Markdown du débit selon le nombre de processus"""
+    from bench_loop import describe_platform
+
+    cores = os.cpu_count() or 1
+    lines = [
+        "# Processus de détection (vision_workers.py --bench)",
+        "",
+        describe_platform(),
+        f"Images rendues par la simulation, {frames} par mesure ; débit en images/s.",
+        "",
+        "| processus | images/s | accélération | remarque |",
+        "|---|---|---|---|",
+    ]
+    for workers, rate in rates.items():
+        label = "en ligne" if workers == 0 else str(workers)
+        # le processus de contrôle occupe aussi un cœur
+        note = "plus de processus que de cœurs libres" if workers >= cores else ""
+        lines.append(f"| {label} | {rate:.1f} | x{rate / rates[0]:.2f} | {note} |")
+    return "\n".join(lines) + "\n"
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Détection de la ligne dans des processus séparés")
+    parser.add_argument('--bench', action='store_true', help="débit selon le nombre de processus")
+    parser.add_argument('--frames', type=int, default=300, help="images par mesure")
+    parser.add_argument('--workers', type=int, default=3, help="nombre maximal de processus")
+    parser.add_argument('--output', default=BENCH_OUTPUT, help="fichier du tableau ('-' : aucun)")
+    args = parser.parse_args()
+    if not args.bench:
+        print(__doc__)
+        return
+
+    from bench_loop import not_committable
+
+    if os.path.abspath(args.output) == BENCH_OUTPUT:
+        reason = not_committable()
+        if reason is not None:
+            parser.error(f"{reason} : le tableau commité {os.path.basename(BENCH_OUTPUT)} "
+                         "n'est écrit que sur le robot depuis un arbre propre (--output pour un autre fichier)")
+    cores = os.cpu_count() or 1
+    if args.workers >= cores:
+        print(f"⚠ {cores} cœur(s) : au-delà de {cores - 1} processus de détection, ils se partagent "
+              "les cœurs avec le contrôle, le gain mesuré ne vaut pas pour le robot")
+    print(f"Débit de détection ({cores} cœurs)")
+    rates = benchmark(args.frames, args.workers)
+    for workers, rate in rates.items():
+        label = "en ligne" if workers == 0 else f"{workers} processus"
+        print(f"  {label:12s} : {rate:7.1f} images/s  (x{rate / rates[0]:.2f})")
+    report = bench_table(rates, args.frames)
+    print()
+    print(report)
+    if args.output != '-':
+        with open(args.output, 'w') as f:
+            f.write(report)
+        print(f"✓ Tableau écrit dans {args.output}")
+
+
+if __name__ == "__main__":
+    main()
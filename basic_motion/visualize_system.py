@@ -3,12 +3,14 @@ Script de visualisation du système de suivi de ligne
 Crée un diagramme expliquant le fonctionnement
 """
 
-import matplotlib.pyplot as plt
-import matplotlib.patches as patches
 import numpy as np
 
 def create_system_diagram():
     """Crée un diagramme du système de suivi de ligne"""
+    # matplotlib n'est importé que pour dessiner (long à charger sur le Raspberry Pi)
+    import matplotlib.pyplot as plt
+    import matplotlib.patches as patches
+    
     fig, axes = plt.subplots(2, 2, figsize=(14, 10))
     fig.suptitle('Système de Suivi de Ligne Autonome', fontsize=16, fontweight='bold')
     
@@ -187,6 +189,9 @@ def create_system_diagram():
     print("✓ Diagramme sauvegardé : line_tracking_system.png")
     plt.show()
 
-if __name__ == "__main__":
+def main():
     print("Génération du diagramme du système...")
     create_system_diagram()
+
+if __name__ == "__main__":
+    main()